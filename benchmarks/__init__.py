@@ -0,0 +1,8 @@
+"""
+Бенчмарки конвейеров бота. Отправка в Telegram заменена заглушками, входные данные синтетические.
+
+    python -m benchmarks.video_circle --quick
+    python -m benchmarks.video_circle --baseline benchmarks/baselines/video_circle.json
+    python -m benchmarks.image_effects --quick --photos ~/photos
+    python -m benchmarks.loadtest --users 20
+"""
@@ -0,0 +1,230 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+# Бенчмарки не ходят в Telegram, но конфиг бота без токена не загрузится
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+DEFAULT_THRESHOLD = 0.15
+# Рост этих метрик относительно baseline считается регрессией
+REGRESSION_METRICS = ("wall_seconds", "cpu_seconds", "peak_rss_kb", "output_bytes", "fallback_rate")
+# Разница меньше порога шума не считается регрессией, даже если в процентах она большая
+NOISE_FLOOR = {"wall_seconds": 0.05, "cpu_seconds": 0.05, "peak_rss_kb": 4096,
+               "p50_seconds": 0.005, "p95_seconds": 0.01, "alloc_peak_bytes": 1 << 20}
+
+
+class Measurement:
+    """Стеновое время, CPU (свой процесс + дочерние ffmpeg) и пиковая память одного замера."""
+
+    def __init__(self):
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_kb = 0
+
+    def as_dict(self) -> dict:
+        return {"wall_seconds": self.wall_seconds, "cpu_seconds": self.cpu_seconds, "peak_rss_kb": self.peak_rss_kb}
+
+
+def _cpu(usage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+def _rss_kb(usage) -> int:
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+
+def _reset_peak_rss() -> bool:
+    """Сбрасывает VmHWM (Linux): иначе пик включает память, унаследованную от родителя до exec."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return _rss_kb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+@contextmanager
+def measure():
+    """
+    Замеряет блок кода. Пик памяти своего процесса считается с начала блока, если
+    ОС позволяет сбросить VmHWM, иначе за всю жизнь процесса; для дочерних ffmpeg —
+    максимум по всем дочерним процессам. Поэтому случаи запускаются через run_isolated.
+    """
+    measurement = Measurement()
+    _reset_peak_rss()
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement.wall_seconds = time.perf_counter() - started
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        measurement.cpu_seconds = (
+            _cpu(self_after) - _cpu(self_before) + _cpu(children_after) - _cpu(children_before)
+        )
+        measurement.peak_rss_kb = max(_peak_rss_kb(), _rss_kb(children_after))
+
+
+def run_isolated(func, *args):
+    """Выполняет func(*args) в свежем процессе, чтобы пиковая память и CPU не смешивались между случаями."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        return executor.submit(func, *args).result()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией, q от 0 до 1."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples: list[dict]) -> dict:
+    """Сводит повторы одного случая: медиана числовых метрик, разброс стенового времени."""
+    summary = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            summary[key] = statistics.median(values)
+        else:
+            summary[key] = values[-1]
+    walls = [sample["wall_seconds"] for sample in samples if "wall_seconds" in sample]
+    if len(walls) > 1:
+        summary["wall_seconds_min"] = min(walls)
+        summary["wall_seconds_max"] = max(walls)
+    summary["repeats"] = len(samples)
+    return summary
+
+
+def ffmpeg_version() -> str:
+    try:
+        output = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return output.splitlines()[0] if output else "unknown"
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version(),
+    }
+
+
+def compare_with_baseline(cases: dict, baseline: dict, threshold: float, metrics=REGRESSION_METRICS) -> list[str]:
+    """Сравнивает результаты с baseline и возвращает описания регрессий."""
+    regressions = []
+    for name, current in cases.items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            continue
+        for metric in metrics:
+            if metric not in current or metric not in base:
+                continue
+            new, old = current[metric], base[metric]
+            if new - old <= NOISE_FLOOR.get(metric, 0):
+                continue
+            if old == 0 or new > old * (1 + threshold):
+                change = f"+{(new / old - 1) * 100:.0f}%" if old else "было 0"
+                regressions.append(f"{name}: {metric} {old:.4g} -> {new:.4g} ({change})")
+    return regressions
+
+
+def add_common_arguments(parser: argparse.ArgumentParser, suite: str):
+    parser.add_argument("--quick", action="store_true", help="сокращённая матрица случаев")
+    parser.add_argument("--repeat", type=int, default=1, help="повторов на случай (берётся медиана)")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, f"{suite}.json"), help="куда писать JSON")
+    parser.add_argument("--baseline", default=os.path.join(BASELINES_DIR, f"{suite}.json"),
+                        help="JSON с эталонными результатами")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимый рост метрик относительно baseline (0.15 = 15%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="сохранить результаты как новый baseline")
+    parser.add_argument("--verbose", action="store_true", help="показывать логи бота")
+
+
+def setup_logging(args):
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+
+def _write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def print_table(cases: dict, columns: tuple):
+    width = max([len(name) for name in cases] + [4])
+    print(f"{'case':<{width}}  " + "  ".join(f"{column:>14}" for column in columns))
+    for name, metrics in cases.items():
+        cells = []
+        for column in columns:
+            value = metrics.get(column, "")
+            cells.append(f"{value:>14.4g}" if isinstance(value, float) else f"{value!s:>14}")
+        print(f"{name:<{width}}  " + "  ".join(cells))
+
+
+def finish(suite: str, cases: dict, args, extra: dict = None, metrics=REGRESSION_METRICS) -> int:
+    """Пишет результаты, сравнивает с baseline и возвращает код выхода (1 при регрессии)."""
+    results = {
+        "suite": suite,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "threshold": args.threshold,
+        "cases": cases,
+        **(extra or {}),
+    }
+    _write_json(args.output, results)
+    print(f"Результаты записаны в {args.output}")
+
+    if args.update_baseline:
+        _write_json(args.baseline, results)
+        print(f"Baseline обновлён: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Baseline {args.baseline} не найден, сравнение пропущено (--update-baseline, чтобы создать)")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment", {}).get("ffmpeg") != results["environment"]["ffmpeg"]:
+        print("Внимание: baseline снят с другой версией ffmpeg, сравнение может быть неточным")
+    regressions = compare_with_baseline(cases, baseline, args.threshold, metrics)
+    if regressions:
+        print(f"Регрессии больше {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("Регрессий относительно baseline нет")
+    return 0
@@ -0,0 +1,191 @@
+"""
+Бенчмарк эффектов из bot/utils/image_processing.py.
+
+Каждая функция create_*_image прогоняется по матрице: параметр эффекта
+(spiral_turns или grid_size) x размер результата x входное изображение.
+Входы — синтетические JPEG разных разрешений и, по желанию, реальные фото
+из --photos. Для каждого случая пишутся перцентили задержки рендера и PNG,
+пик аллокаций Python (tracemalloc), пиковый RSS и размер PNG.
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import (add_common_arguments, finish, measure, percentile, print_table, run_isolated,
+                               setup_logging, summarize)
+
+SUITE = "image_effects"
+
+# эффект -> (функция, изменяемый параметр, значения)
+EFFECTS = {
+    "spiral": ("create_spiral_image", "spiral_turns", (25, 50, 100)),
+    "double_spiral": ("create_double_spiral_image", "spiral_turns", (25, 50, 100)),
+    "square": ("create_square_grid_image", "grid_size", (25, 50, 100)),
+    "hexagon": ("create_hexagon_grid_image", "grid_size", (25, 50, 100)),
+    "triangle": ("create_triangle_grid_image", "grid_size", (25, 50, 100)),
+    "diamond": ("create_diamond_grid_image", "grid_size", (25, 50, 100)),
+    "pentagon": ("create_pentagon_grid_image", "grid_size", (25, 50, 100)),
+}
+DEFAULT_PARAM = 50  # значение, с которым эффекты вызывает бот
+
+SIZES = (300, 600, 1200)
+PATTERNS = ("gradient", "portrait", "stripes", "noise")
+RESOLUTIONS = ((640, 480), (1920, 1080), (4032, 3024))
+QUICK_INPUTS = (("portrait", 1920, 1080), ("noise", 640, 480))
+
+REGRESSION_METRICS = ("p50_seconds", "p95_seconds", "peak_rss_kb", "alloc_peak_bytes", "png_bytes")
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _pattern_array(pattern: str, width: int, height: int):
+    import numpy as np
+
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    x /= width
+    y /= height
+    if pattern == "gradient":
+        values = np.hypot(x - 0.5, y - 0.5) * 1.4
+    elif pattern == "portrait":
+        # Несколько мягких пятен: плавные тона, как у лица на фоне
+        values = np.zeros_like(x)
+        for cx, cy, radius, weight in ((0.5, 0.45, 0.22, 1.0), (0.42, 0.4, 0.04, -0.6), (0.58, 0.4, 0.04, -0.6),
+                                       (0.5, 0.9, 0.35, 0.7), (0.15, 0.2, 0.3, 0.3)):
+            values += weight * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+        values = 1 - np.clip(values, 0, 1)
+    elif pattern == "stripes":
+        values = ((np.floor(x * 24) + np.floor(y * 16)) % 2) * 0.8 + 0.1
+    elif pattern == "noise":
+        values = np.random.default_rng(42).random((height, width), dtype=np.float32)
+    else:
+        raise ValueError(f"unknown pattern {pattern}")
+    gray = (np.clip(values, 0, 1) * 255).astype(np.uint8)
+    # Цветное изображение: эффекты сами переводят в оттенки серого, как с настоящим фото
+    return np.stack([gray, np.roll(gray, width // 7, axis=1), 255 - gray], axis=-1)
+
+
+def generate_input(pattern: str, width: int, height: int, inputs_dir: str) -> str:
+    from PIL import Image
+
+    path = os.path.join(inputs_dir, f"{pattern}_{width}x{height}.jpg")
+    if not os.path.exists(path):
+        os.makedirs(inputs_dir, exist_ok=True)
+        Image.fromarray(_pattern_array(pattern, width, height)).save(path, quality=90)
+    return path
+
+
+def collect_inputs(args) -> dict:
+    """Имя входа -> путь к файлу."""
+    if args.quick:
+        synthetic = QUICK_INPUTS
+    else:
+        synthetic = [(pattern, width, height) for pattern, (width, height) in itertools.product(PATTERNS, RESOLUTIONS)]
+    inputs = {
+        f"{pattern}_{width}x{height}": generate_input(pattern, width, height, args.inputs_dir)
+        for pattern, width, height in synthetic
+    }
+    for directory in args.photos or ():
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith(PHOTO_EXTENSIONS):
+                inputs[f"photo_{os.path.splitext(filename)[0]}"] = os.path.join(directory, filename)
+    return inputs
+
+
+def build_cases(args, inputs: dict) -> list[tuple]:
+    sizes = (300,) if args.quick else SIZES
+    cases = []
+    for effect, (_, _, values) in EFFECTS.items():
+        if args.effect and effect not in args.effect:
+            continue
+        params = (DEFAULT_PARAM,) if args.quick else values
+        for param, size, input_name in itertools.product(params, sizes, inputs):
+            cases.append((effect, param, size, input_name))
+    return cases
+
+
+def case_name(effect: str, param: int, size: int, input_name: str) -> str:
+    return f"{effect}_{EFFECTS[effect][1]}{param}_{size}px_{input_name}"
+
+
+def run_case(effect: str, param: int, size: int, input_path: str, iterations: int) -> dict:
+    """Точка входа дочернего процесса: холодный вызов, затем iterations замеров и один прогон под tracemalloc."""
+    import tracemalloc
+    from bot.utils import image_processing
+
+    func = getattr(image_processing, EFFECTS[effect][0])
+    kwargs = {EFFECTS[effect][1]: param, "size": size}
+
+    started = time.perf_counter()
+    image = func(input_path, **kwargs)
+    png = image_processing.save_image_to_bytes(image)
+    first_seconds = time.perf_counter() - started
+
+    render_times, encode_times, totals = [], [], []
+    with measure() as measurement:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            image = func(input_path, **kwargs)
+            rendered = time.perf_counter()
+            png = image_processing.save_image_to_bytes(image)
+            finished = time.perf_counter()
+            render_times.append(rendered - started)
+            encode_times.append(finished - rendered)
+            totals.append(finished - started)
+
+    tracemalloc.start()
+    image_processing.save_image_to_bytes(func(input_path, **kwargs))
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "first_seconds": first_seconds,
+        "p50_seconds": percentile(totals, 0.5),
+        "p95_seconds": percentile(totals, 0.95),
+        "max_seconds": max(totals),
+        "render_p50_seconds": percentile(render_times, 0.5),
+        "encode_p50_seconds": percentile(encode_times, 0.5),
+        "cpu_seconds": measurement.cpu_seconds / iterations,
+        "peak_rss_kb": measurement.peak_rss_kb,
+        "alloc_peak_bytes": alloc_peak,
+        "png_bytes": len(png),
+        "iterations": iterations,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк эффектов обработки изображений")
+    add_common_arguments(parser, SUITE)
+    parser.add_argument("--iterations", type=int, default=5, help="замеров на случай после холодного вызова")
+    parser.add_argument("--inputs-dir", default=os.path.join(tempfile.gettempdir(), "tg_bot_bench_images"),
+                        help="кэш сгенерированных входов")
+    parser.add_argument("--photos", action="append", help="папка с реальными фото, добавляются к синтетическим")
+    parser.add_argument("--effect", action="append", choices=sorted(EFFECTS), help="только эти эффекты")
+    args = parser.parse_args(argv)
+    setup_logging(args)
+
+    inputs = collect_inputs(args)
+    cases = {}
+    for effect, param, size, input_name in build_cases(args, inputs):
+        name = case_name(effect, param, size, input_name)
+        samples = [
+            run_isolated(run_case, effect, param, size, inputs[input_name], args.iterations)
+            for _ in range(args.repeat)
+        ]
+        cases[name] = summarize(samples)
+        print(f"{name}: p50 {cases[name]['p50_seconds'] * 1000:.1f}мс, PNG {cases[name]['png_bytes'] // 1024} КБ",
+              flush=True)
+
+    if not cases:
+        print("Нет случаев для запуска")
+        return 2
+
+    print_table(cases, ("first_seconds", "p50_seconds", "p95_seconds", "render_p50_seconds", "encode_p50_seconds",
+                        "peak_rss_kb", "alloc_peak_bytes", "png_bytes"))
+    return finish(SUITE, cases, args, metrics=REGRESSION_METRICS)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
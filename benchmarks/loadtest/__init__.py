@@ -0,0 +1,7 @@
+"""
+Нагрузочный тест бота без Telegram и без внешних сайтов: настоящий Dispatcher с
+register_all_handlers поллит локальный фейковый Bot API, yt-dlp и Shazam заменены
+заглушками, которые отдают локальные медиа.
+
+    python -m benchmarks.loadtest --users 20 --jobs-per-user 3 --mix tiktok=3,circle=1,spiral=1
+"""
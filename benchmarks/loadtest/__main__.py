@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.common import add_common_arguments, finish, percentile, print_table, setup_logging
+from benchmarks.loadtest.scenarios import SCENARIOS, ScenarioError, SimulatedUser
+
+SUITE = "loadtest"
+DEFAULT_MIX = "tiktok=3,reels=2,youtube=2,audio=1,circle=1,spiral=1,square=1"
+REGRESSION_METRICS = ("p50_seconds", "p95_seconds", "error_rate")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий {name}, есть: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def prepare_media(inputs_dir: str) -> dict:
+    """Локальные файлы, которые отдают заглушки: короткое видео с телефона, ролик с YouTube, фото."""
+    from benchmarks import image_effects, video_circle
+
+    clip = video_circle.generate_input((720, 1280, 30, 12, "medium"), inputs_dir)
+    return {
+        "tiktok": clip,
+        "instagram": clip,
+        "youtube": video_circle.generate_input((1280, 720, 30, 20, "medium"), inputs_dir),
+        "circle": video_circle.generate_input((640, 360, 30, 8, "medium"), inputs_dir),
+        "photo": image_effects.generate_input("portrait", 1280, 960, inputs_dir),
+    }
+
+
+async def simulate_user(user: SimulatedUser, mix: dict, jobs: int, think: float, rng: random.Random, results: list):
+    names, weights = list(mix), list(mix.values())
+    for _ in range(jobs):
+        scenario = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            latency = await user.run(scenario)
+            results.append({"scenario": scenario, "ok": True, "latency": latency})
+        except ScenarioError as e:
+            results.append({"scenario": scenario, "ok": False, "error": str(e),
+                            "latency": time.perf_counter() - started})
+        except asyncio.TimeoutError:
+            results.append({"scenario": scenario, "ok": False, "error": "timeout",
+                            "latency": time.perf_counter() - started})
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+
+
+def summarize_results(results: list, wall: float) -> dict:
+    cases = {}
+    groups = {"all": results}
+    for result in results:
+        groups.setdefault(result["scenario"], []).append(result)
+    for name, group in groups.items():
+        latencies = [r["latency"] for r in group if r["ok"]]
+        errors = [r for r in group if not r["ok"]]
+        cases[name] = {
+            "jobs": len(group),
+            "ok": len(latencies),
+            "errors": len(errors),
+            "timeouts": sum(r["error"] == "timeout" for r in errors),
+            "error_rate": len(errors) / len(group),
+            "throughput_per_min": len(latencies) / wall * 60,
+            "p50_seconds": percentile(latencies, 0.5) if latencies else 0.0,
+            "p95_seconds": percentile(latencies, 0.95) if latencies else 0.0,
+            "p99_seconds": percentile(latencies, 0.99) if latencies else 0.0,
+            "max_seconds": max(latencies, default=0.0),
+        }
+        error_texts = {}
+        for r in errors:
+            error_texts[r["error"]] = error_texts.get(r["error"], 0) + 1
+        if error_texts:
+            cases[name]["error_texts"] = error_texts
+    return cases
+
+
+async def run(args, workdir: str) -> tuple[dict, dict]:
+    from benchmarks.loadtest import stubs
+    from benchmarks.loadtest.fake_api import FakeBotAPI
+
+    media = prepare_media(args.inputs_dir)
+    stubs.install(stubs.StubSettings(
+        media={key: media[key] for key in ("tiktok", "instagram", "youtube")},
+        download_mbps=args.download_mbps,
+        extractor_latency=args.extractor_latency,
+        extractor_error_rate=args.extractor_error_rate,
+        shazam_latency=args.shazam_latency,
+    ))
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from bot.handlers import register_all_handlers
+    from bot.utils.scheduler import scheduler
+
+    api = FakeBotAPI()
+    base_url = await api.start()
+    user_media = {"video": api.register_file(media["circle"]), "photo": api.register_file(media["photo"])}
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    bot = Bot(token="123456:loadtest", session=session, default=DefaultBotProperties(parse_mode='HTML'))
+    dp = Dispatcher()
+    register_all_handlers(dp, bot)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False,
+                                                   polling_timeout=1))
+
+    rng = random.Random(args.seed)
+    results = []
+    users = [SimulatedUser(api, 1000 + i, user_media, args.timeout) for i in range(args.users)]
+    started = time.perf_counter()
+    tasks = []
+    for i, user in enumerate(users):
+        delay = args.ramp * i / max(len(users) - 1, 1)
+        tasks.append(asyncio.create_task(_delayed(delay, simulate_user(
+            user, args.mix, args.jobs_per_user, args.think, random.Random(rng.random()), results))))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+
+    # Даём хэндлерам доделать хвосты (удаление файлов, сообщения после результата)
+    await asyncio.wait_for(scheduler.drain(), timeout=args.timeout)
+    await dp.stop_polling()
+    await polling
+    await bot.session.close()
+    await api.stop()
+
+    cases = summarize_results(results, wall)
+    extra = {
+        "wall_seconds": wall,
+        "users": args.users,
+        "mix": args.mix,
+        "queued_notices": sum(user.queued_notices for user in users),
+        "api_calls": dict(api.calls),
+        "uploaded_bytes": api.uploaded_bytes,
+        "downloaded_bytes": api.downloaded_bytes,
+    }
+    return cases, extra
+
+
+async def _delayed(delay: float, coro):
+    await asyncio.sleep(delay)
+    return await coro
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.loadtest",
+        description="Нагрузочный тест: настоящий Dispatcher против фейкового Bot API и заглушек yt-dlp/Shazam")
+    add_common_arguments(parser, SUITE)
+    parser.add_argument("--users", type=int, default=10, help="число симулированных пользователей")
+    parser.add_argument("--jobs-per-user", type=int, default=3, help="задач на пользователя")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"веса сценариев, по умолчанию {DEFAULT_MIX}")
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза пользователя между задачами, с")
+    parser.add_argument("--timeout", type=float, default=300.0, help="таймаут одного сценария, с")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--download-mbps", type=float, default=50.0, help="скорость «скачивания» в заглушке yt-dlp")
+    parser.add_argument("--extractor-latency", type=float, default=0.3, help="задержка извлечения информации, с")
+    parser.add_argument("--extractor-error-rate", type=float, default=0.0, help="доля сбоев заглушки yt-dlp")
+    parser.add_argument("--shazam-latency", type=float, default=1.5, help="задержка заглушки Shazam, с")
+    parser.add_argument("--inputs-dir", default=os.path.join(tempfile.gettempdir(), "tg_bot_bench_inputs"),
+                        help="кэш сгенерированных медиа")
+    args = parser.parse_args(argv)
+    setup_logging(args)
+
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        print("Для нагрузочного теста нужны ffmpeg и ffprobe в PATH")
+        return 2
+
+    # Папки бота — во временном каталоге, чтобы тест не трогал настоящие загрузки и трассы
+    workdir = tempfile.mkdtemp(prefix="bot_loadtest_")
+    os.environ["DOWNLOADS_DIR"] = os.path.join(workdir, "downloads")
+    os.environ.setdefault("TRACE_FILE", os.path.join(workdir, "traces.jsonl"))
+    os.environ.setdefault("METRICS_PORT", "0")
+    try:
+        cases, extra = asyncio.run(run(args, workdir))
+    finally:
+        if os.environ["TRACE_FILE"].startswith(workdir):
+            logging.getLogger("bot.trace").handlers.clear()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.users} пользователей, {extra['wall_seconds']:.1f}с, "
+          f"постановок в очередь: {extra['queued_notices']}")
+    print_table(cases, ("jobs", "ok", "errors", "timeouts", "error_rate", "throughput_per_min",
+                        "p50_seconds", "p95_seconds", "p99_seconds"))
+    return finish(SUITE, cases, args, extra=extra, metrics=REGRESSION_METRICS)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+
+# Метод отправки медиа -> поле Message, в котором Telegram возвращает файл
+MEDIA_METHODS = {
+    "sendVideo": "video",
+    "sendVideoNote": "video_note",
+    "sendAudio": "audio",
+    "sendPhoto": "photo",
+    "sendDocument": "document",
+    "sendAnimation": "animation",
+}
+
+
+class BotCall:
+    """Один вызов Bot API от бота: то, что увидел бы пользователь в чате."""
+
+    def __init__(self, method: str, params: dict, result, uploaded_bytes: int):
+        self.method = method
+        self.params = params
+        self.result = result
+        self.uploaded_bytes = uploaded_bytes
+        self.at = time.perf_counter()
+
+    @property
+    def text(self) -> str:
+        return self.params.get("text") or self.params.get("caption") or ""
+
+    def __repr__(self):
+        return f"BotCall({self.method}, {self.text[:40]!r})"
+
+
+class FakeBotAPI:
+    """
+    Локальный Bot API: отдаёт апдейты в getUpdates, принимает отправку сообщений
+    и медиа, отдаёт зарегистрированные локальные файлы через getFile и /file/.
+    Все вызовы бота раскладываются по очередям чатов, чтобы симулированные
+    пользователи могли дождаться ответа.
+    """
+
+    def __init__(self):
+        self.app = web.Application(client_max_size=1 << 32)
+        self.app.router.add_post("/bot{token}/{method}", self._handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        self.updates = asyncio.Queue()
+        self.files = {}  # file_id -> локальный путь
+        self.chats = defaultdict(asyncio.Queue)  # chat_id -> очередь BotCall
+        self.calls = Counter()
+        self.uploaded_bytes = 0
+        self.downloaded_bytes = 0
+        self._ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+
+    async def start(self, host="127.0.0.1", port=0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # --- Файлы и апдейты со стороны пользователя ---
+
+    def register_file(self, path: str) -> str:
+        file_id = f"local-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = path
+        return file_id
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _message(self, chat_id: int, sender: dict, **fields) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": sender,
+            **fields,
+        }
+
+    def _push(self, **payload):
+        self.updates.put_nowait({"update_id": next(self._ids), **payload})
+
+    def send_text(self, user_id: int, text: str):
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self._push(message=self._message(user_id, self._user(user_id), **fields))
+
+    def send_video(self, user_id: int, file_id: str, width=640, height=360, duration=10):
+        video = {
+            "file_id": file_id, "file_unique_id": file_id, "width": width, "height": height,
+            "duration": duration, "file_size": os.path.getsize(self.files[file_id]),
+        }
+        self._push(message=self._message(user_id, self._user(user_id), video=video))
+
+    def send_photo(self, user_id: int, file_id: str, width=1280, height=960, media_group_id: str = None):
+        photo = [{
+            "file_id": file_id, "file_unique_id": file_id, "width": width, "height": height,
+            "file_size": os.path.getsize(self.files[file_id]),
+        }]
+        fields = {"media_group_id": media_group_id} if media_group_id else {}
+        self._push(message=self._message(user_id, self._user(user_id), photo=photo, **fields))
+
+    def send_album(self, user_id: int, file_ids: list[str]):
+        """Альбом: несколько фото отдельными апдейтами с общим media_group_id, как у Telegram."""
+        media_group_id = str(next(self._ids))
+        for file_id in file_ids:
+            self.send_photo(user_id, file_id, media_group_id=media_group_id)
+
+    def press(self, user_id: int, message: dict, data: str):
+        """Нажатие inline-кнопки под сообщением бота."""
+        self._push(callback_query={
+            "id": str(next(self._ids)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        })
+
+    # --- Bot API ---
+
+    async def _read_params(self, request) -> tuple[dict, int]:
+        """Поля запроса и размер загруженных файлов. Файлы читаются потоком и не сохраняются."""
+        params, uploaded = {}, 0
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    while chunk := await part.read_chunk(1 << 20):
+                        uploaded += len(chunk)
+                    params[part.name] = f"attach://{part.name}"
+                else:
+                    params[part.name] = await part.text()
+        elif request.can_read_body:
+            params = dict(await request.post())
+        return params, uploaded
+
+    def _media(self, method: str, params: dict, field_value) -> dict:
+        field = MEDIA_METHODS[method]
+        file_id = field_value if field_value in self.files else f"sent-{uuid.uuid4().hex[:12]}"
+        media = {"file_id": file_id, "file_unique_id": file_id}
+        if field == "photo":
+            return [{**media, "width": 1, "height": 1}]
+        if field == "video_note":
+            return {**media, "length": int(params.get("length") or 0), "duration": int(params.get("duration") or 0)}
+        if field in ("video", "animation"):
+            return {**media, "width": 1, "height": 1, "duration": int(params.get("duration") or 0)}
+        if field == "audio":
+            return {**media, "duration": int(params.get("duration") or 0)}
+        return media
+
+    async def _get_updates(self, params: dict) -> list:
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            return []
+        while len(updates) < limit and not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def _bot_message(self, method: str, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        fields = {}
+        if params.get("text"):
+            fields["text"] = params["text"]
+        if params.get("caption"):
+            fields["caption"] = params["caption"]
+        if params.get("reply_markup"):
+            fields["reply_markup"] = json.loads(params["reply_markup"])
+        if method in MEDIA_METHODS:
+            field = MEDIA_METHODS[method]
+            fields[field] = self._media(method, params, params.get(field))
+        if method == "editMessageText":
+            return {**self._message(chat_id, BOT_USER, **fields), "message_id": int(params["message_id"])}
+        return self._message(chat_id, BOT_USER, **fields)
+
+    def _media_group(self, params: dict) -> list:
+        chat_id = int(params["chat_id"])
+        messages = []
+        for item in json.loads(params["media"]):
+            method = {"photo": "sendPhoto", "video": "sendVideo", "audio": "sendAudio"}.get(item["type"], "sendDocument")
+            field = MEDIA_METHODS[method]
+            messages.append(self._message(chat_id, BOT_USER, **{field: self._media(method, item, item.get("media"))}))
+        return messages
+
+    async def _handle_method(self, request):
+        method = request.match_info["method"]
+        params, uploaded = await self._read_params(request)
+        self.calls[method] += 1
+        self.uploaded_bytes += uploaded
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if method == "getFile":
+            file_id = params.get("file_id")
+            if file_id not in self.files:
+                return self._error(400, "Bad Request: invalid file_id")
+            return self._ok({"file_id": file_id, "file_unique_id": file_id,
+                             "file_size": os.path.getsize(self.files[file_id]), "file_path": file_id})
+
+        if "chat_id" not in params:
+            # answerCallbackQuery, deleteWebhook и прочее без ответа в чат
+            return self._ok(True)
+        if method == "sendMediaGroup":
+            result = self._media_group(params)
+        elif method in ("deleteMessage", "sendChatAction"):
+            result = True
+        else:
+            result = self._bot_message(method, params)
+        self.chats[int(params["chat_id"])].put_nowait(BotCall(method, params, result, uploaded))
+        return self._ok(result)
+
+    async def _handle_file(self, request):
+        path = self.files.get(request.match_info["path"])
+        if path is None:
+            raise web.HTTPNotFound()
+        self.downloaded_bytes += os.path.getsize(path)
+        return web.FileResponse(path)
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str):
+        logging.warning(f"Fake Bot API: {description}")
+        return web.json_response({"ok": False, "error_code": code, "description": description}, status=code)
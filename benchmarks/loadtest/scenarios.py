@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+# Такие символы бот ставит в сообщения об ошибках и отказах
+ERROR_MARKERS = ("❌", "😔", "😭", "😢", "🚦", "🗄")
+QUEUED_MARKER = "⏳ Задача поставлена в очередь"
+
+# сценарий -> (команда, ссылка, метод, которым бот отдаёт результат)
+LINK_SCENARIOS = {
+    "tiktok": ("/tt_v_d", "https://www.tiktok.com/@loadtest/video/1", "sendVideo"),
+    "youtube": ("/yt_v_d", "https://www.youtube.com/watch?v=loadtest", "sendVideo"),
+    "reels": ("/reels_v_d", "https://www.instagram.com/reel/loadtest/", "sendVideo"),
+    "audio": ("/audio_download", "https://www.tiktok.com/@loadtest/video/2", "sendAudio"),
+}
+SCENARIOS = (*LINK_SCENARIOS, "circle", "spiral", "square", "album", "video_effect")
+ALBUM_SIZE = 4
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class SimulatedUser:
+    """Пользователь в личном чате с ботом: шлёт апдейты в фейковый API и ждёт ответов бота."""
+
+    def __init__(self, api, user_id: int, media: dict, timeout: float):
+        self.api = api
+        self.user_id = user_id
+        self.media = media  # "video" / "photo" -> file_id, зарегистрированный в фейковом API
+        self.timeout = timeout
+        self.queued_notices = 0
+        self.deadline = None
+
+    @property
+    def inbox(self) -> asyncio.Queue:
+        return self.api.chats[self.user_id]
+
+    def clear_inbox(self):
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+
+    async def wait_for(self, method: str, contains: str = None):
+        """Ждёт вызова method (с текстом contains). Сообщение об ошибке от бота прерывает сценарий."""
+        while True:
+            remaining = self.deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            call = await asyncio.wait_for(self.inbox.get(), timeout=remaining)
+            if call.text.startswith(QUEUED_MARKER):
+                self.queued_notices += 1
+                continue
+            if call.method == method and (contains is None or contains in call.text):
+                return call
+            if call.method in ("sendMessage", "editMessageText") and any(m in call.text for m in ERROR_MARKERS):
+                raise ScenarioError(call.text.splitlines()[0][:80])
+
+    async def run(self, scenario: str) -> float:
+        """Выполняет сценарий и возвращает задержку от действия, запускающего работу, до результата."""
+        self.clear_inbox()
+        self.deadline = time.perf_counter() + self.timeout
+        if scenario in LINK_SCENARIOS:
+            command, link, result_method = LINK_SCENARIOS[scenario]
+            self.api.send_text(self.user_id, command)
+            await self.wait_for("sendMessage")
+            started = time.perf_counter()
+            self.api.send_text(self.user_id, link)
+            await self.wait_for(result_method)
+            return time.perf_counter() - started
+
+        if scenario == "circle":
+            started = time.perf_counter()
+            self.api.send_video(self.user_id, self.media["video"])
+            await self.wait_for("sendVideoNote")
+            await self.wait_for("sendMessage", contains="Готово")
+            return time.perf_counter() - started
+
+        # Эффекты для фото и видео: команда, фото или видео, выбор эффекта кнопкой
+        self.api.send_text(self.user_id, "/phone_converter")
+        await self.wait_for("sendMessage")
+        # Разные file_id, чтобы кэш результатов не отвечал за уже отрендеренные фото и видео
+        if scenario == "video_effect":
+            self.api.send_video(self.user_id, self.api.register_file(self.api.files[self.media["video"]]))
+        elif scenario == "album":
+            self.api.send_album(self.user_id, [self.api.register_file(self.api.files[self.media["photo"]])
+                                               for _ in range(ALBUM_SIZE)])
+        else:
+            self.api.send_photo(self.user_id, self.media["photo"])
+        keyboard = (await self.wait_for("sendMessage", contains="Выберите")).result
+        started = time.perf_counter()
+        if scenario == "spiral":
+            self.api.press(self.user_id, keyboard, "effect_spiral")
+            await self.wait_for("editMessageText")
+            started = time.perf_counter()
+            self.api.press(self.user_id, keyboard, "spiral_thick_2")
+        elif scenario in ("album", "video_effect"):
+            self.api.press(self.user_id, keyboard, "effect_square")
+            await self.wait_for("sendMediaGroup" if scenario == "album" else "sendVideo")
+            latency = time.perf_counter() - started
+            # Бот сбрасывает состояние после удаления сообщения «Обработка»: без паузы
+            # следующая команда пользователя успела бы прийти раньше и была бы сброшена
+            await self.wait_for("deleteMessage")
+            return latency
+        else:
+            self.api.press(self.user_id, keyboard, f"effect_{scenario}")
+        await self.wait_for("sendPhoto")
+        return time.perf_counter() - started
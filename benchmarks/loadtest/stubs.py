@@ -0,0 +1,97 @@
+"""
+Заглушки yt-dlp и shazamio для нагрузочного теста. Подменяют модули в sys.modules,
+поэтому ленивые `import yt_dlp` и `from shazamio import Shazam` в хэндлерах получают их.
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import sys
+import time
+import types
+
+
+class DownloadError(Exception):
+    pass
+
+
+class StubSettings:
+    def __init__(self, media: dict, download_mbps=0.0, extractor_latency=0.2, extractor_error_rate=0.0,
+                 shazam_latency=1.0):
+        self.media = media  # подстрока домена ("tiktok", "youtube", "instagram") -> локальный файл
+        self.download_mbps = download_mbps
+        self.extractor_latency = extractor_latency
+        self.extractor_error_rate = extractor_error_rate
+        self.shazam_latency = shazam_latency
+        self.rng = random.Random(42)
+
+
+settings = None
+
+
+class FakeYoutubeDL:
+    """Отдаёт локальный файл для известных доменов, с задержкой и ограничением скорости как у сети."""
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _source(self, url: str) -> str:
+        for key, path in settings.media.items():
+            if key in url:
+                return path
+        raise DownloadError(f"Unsupported URL: {url}")
+
+    def extract_info(self, url, download=True):
+        source = self._source(url)
+        time.sleep(settings.extractor_latency)
+        if settings.rng.random() < settings.extractor_error_rate:
+            raise DownloadError("simulated extractor failure")
+        info = {"id": "loadtest", "title": "loadtest", "ext": "mp4", "url": url, "webpage_url": url,
+                "filesize": os.path.getsize(source)}
+        return self.process_ie_result(info, download)
+
+    def process_ie_result(self, info, download=True):
+        if download and not self.params.get("skip_download"):
+            max_filesize = self.params.get("max_filesize")
+            if max_filesize and info["filesize"] > max_filesize:
+                raise DownloadError("File is larger than max-filesize")
+            if settings.download_mbps:
+                time.sleep(info["filesize"] * 8 / (settings.download_mbps * 1_000_000))
+            shutil.copyfile(self._source(info["webpage_url"]), self.prepare_filename(info))
+        return info
+
+    def prepare_filename(self, info):
+        return self.params.get("outtmpl") or f"{info['id']}.{info['ext']}"
+
+
+class FakeShazam:
+    async def _recognize(self, path):
+        await asyncio.sleep(settings.shazam_latency)
+        return {"track": {"title": "Load Test", "subtitle": os.path.basename(str(path))}}
+
+    recognize = _recognize
+    recognize_song = _recognize
+
+
+def install(stub_settings: StubSettings):
+    """Подменяет yt_dlp и shazamio. Вызывать до первого вызова хэндлеров."""
+    global settings
+    settings = stub_settings
+
+    yt_dlp = types.ModuleType("yt_dlp")
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    yt_dlp.utils = types.ModuleType("yt_dlp.utils")
+    yt_dlp.utils.DownloadError = DownloadError
+    sys.modules["yt_dlp"] = yt_dlp
+    sys.modules["yt_dlp.utils"] = yt_dlp.utils
+
+    shazamio = types.ModuleType("shazamio")
+    shazamio.Shazam = FakeShazam
+    sys.modules["shazamio"] = shazamio
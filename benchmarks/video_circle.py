@@ -0,0 +1,204 @@
+"""
+Бенчмарк конвейера кружков: split_video_chunks -> process_video_to_circle,
+плюс compress_video_if_needed на том же входе.
+
+Входы генерируются ffmpeg lavfi с разным разрешением, длительностью, частотой
+кадров и количеством движения и кэшируются между запусками. Каждый случай
+выполняется в отдельном процессе, отправка в Telegram заменена заглушкой.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import add_common_arguments, finish, measure, print_table, run_isolated, setup_logging, summarize
+
+SUITE = "video_circle"
+
+# Источник lavfi по количеству движения. Временной шум — худший случай для x264:
+# он раздувает битрейт и провоцирует повторное, более агрессивное перекодирование.
+MOTION_SOURCES = {
+    "static": "smptebars=size={width}x{height}:rate={fps}:duration={duration}",
+    "medium": "testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+    "high": "testsrc2=size={width}x{height}:rate={fps}:duration={duration},noise=alls=60:allf=t+u:all_seed=42",
+}
+
+RESOLUTIONS = ((1280, 720), (720, 1280), (1920, 1080))
+# (fps, длительность): длинный вход проверяет нарезку на чанки
+TIMINGS = ((30, 20), (60, 20), (30, 75))
+QUICK_CASES = (
+    (1280, 720, 30, 20, "medium"),
+    (720, 1280, 30, 20, "high"),
+    (1920, 1080, 60, 20, "static"),
+    (1280, 720, 30, 75, "medium"),
+)
+
+
+def case_name(width, height, fps, duration, motion) -> str:
+    return f"{width}x{height}@{fps}_{duration}s_{motion}"
+
+
+def build_cases(quick: bool) -> list[tuple]:
+    if quick:
+        return list(QUICK_CASES)
+    return [
+        (width, height, fps, duration, motion)
+        for (width, height), (fps, duration), motion in itertools.product(RESOLUTIONS, TIMINGS, MOTION_SOURCES)
+    ]
+
+
+def generate_input(case: tuple, inputs_dir: str) -> str:
+    """Синтетическое видео как с телефона: H.264 + AAC, ключевой кадр раз в 2 секунды."""
+    width, height, fps, duration, motion = case
+    path = os.path.join(inputs_dir, f"{case_name(*case)}.mp4")
+    if os.path.exists(path):
+        return path
+    os.makedirs(inputs_dir, exist_ok=True)
+    video = MOTION_SOURCES[motion].format(width=width, height=height, fps=fps, duration=duration)
+    temp_path = f"{path}.part.mp4"
+    cmd = (
+        f"ffmpeg -y -v error -f lavfi -i {shlex.quote(video)} "
+        f"-f lavfi -i sine=frequency=440:duration={duration} "
+        f"-c:v libx264 -preset veryfast -crf 20 -g {fps * 2} -pix_fmt yuv420p "
+        f"-c:a aac -b:a 128k -shortest {shlex.quote(temp_path)}"
+    )
+    subprocess.run(cmd, shell=True, check=True)
+    os.replace(temp_path, path)
+    return path
+
+
+class StubBot:
+    """Вместо Telegram: запоминает размеры отправленных кружков и тексты сообщений."""
+
+    def __init__(self):
+        self.video_notes = []
+        self.messages = []
+        self.first_sent_at = None
+
+    async def send_video_note(self, chat_id, video_note, **kwargs):
+        if self.first_sent_at is None:
+            self.first_sent_at = time.perf_counter()
+        self.video_notes.append(os.path.getsize(video_note.path))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append(text)
+
+
+async def _run_pipeline(input_path: str, workdir: str, compress_ratio: float, max_duration) -> dict:
+    from bot.utils import helpers
+    from bot.utils.metrics import reencode_fallbacks_total
+    from bot.utils.processing import split_video_chunks, process_video_to_circle, compress_video_if_needed
+
+    # Задержка удаления нужна только чтобы Telegram дочитал файл; здесь она лишь добавила бы секунду на чанк
+    cleanup_files = helpers.cleanup_files
+    helpers.cleanup_files = lambda *filenames, delay=0: cleanup_files(*filenames)
+
+    bot = StubBot()
+    chunk_dir = os.path.join(workdir, "chunks")
+    os.makedirs(chunk_dir)
+    result = {}
+
+    started = time.perf_counter()
+    if max_duration:
+        chunks = await split_video_chunks(input_path, chunk_dir, max_duration=max_duration)
+    else:
+        chunks = await split_video_chunks(input_path, chunk_dir)
+    result["split_seconds"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for chunk_path in chunks:
+        await process_video_to_circle(chunk_path, chat_id=0, bot=bot)
+    result["circle_seconds"] = time.perf_counter() - started
+    result["first_circle_seconds"] = (bot.first_sent_at - started) if bot.first_sent_at else 0.0
+
+    # Лимит ниже размера входа, иначе compress_video_if_needed просто скопирует файл
+    compressed_path = os.path.join(workdir, "compressed.mp4")
+    started = time.perf_counter()
+    compressed_ok = await compress_video_if_needed(
+        input_path, compressed_path, max_size=int(os.path.getsize(input_path) * compress_ratio))
+    result["compress_seconds"] = time.perf_counter() - started
+    compressed_bytes = os.path.getsize(compressed_path) if os.path.exists(compressed_path) else 0
+
+    fallbacks = reencode_fallbacks_total.value(stage="circle") + reencode_fallbacks_total.value(stage="compress")
+    encodes = len(chunks) + 1
+    result.update({
+        "input_bytes": os.path.getsize(input_path),
+        "chunks": len(chunks),
+        "circles_sent": len(bot.video_notes),
+        "circle_bytes": sum(bot.video_notes),
+        "circle_max_bytes": max(bot.video_notes, default=0),
+        "compressed_bytes": compressed_bytes,
+        "compressed_ok": bool(compressed_ok),
+        "output_bytes": sum(bot.video_notes) + compressed_bytes,
+        "reencode_fallbacks": fallbacks,
+        "fallback_rate": fallbacks / encodes,
+        "failures": len(bot.messages),
+    })
+    return result
+
+
+def run_case(input_path: str, compress_ratio: float, max_duration, verbose: bool) -> dict:
+    """Точка входа дочернего процесса: один прогон одного случая."""
+    import logging
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="bench_circle_")
+    try:
+        with measure() as measurement:
+            result = asyncio.run(_run_pipeline(input_path, workdir, compress_ratio, max_duration))
+        result.update(measurement.as_dict())
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера видео-кружков")
+    add_common_arguments(parser, SUITE)
+    parser.add_argument("--inputs-dir", default=os.path.join(tempfile.gettempdir(), "tg_bot_bench_inputs"),
+                        help="кэш сгенерированных входов")
+    parser.add_argument("--compress-ratio", type=float, default=0.5,
+                        help="лимит для compress_video_if_needed как доля размера входа")
+    parser.add_argument("--max-duration", type=int, default=0,
+                        help="длина чанка в секундах (0 — MAX_DURATION_SECONDS из конфига)")
+    parser.add_argument("--case", action="append", help="запустить только случаи с этой подстрокой в имени")
+    args = parser.parse_args(argv)
+    setup_logging(args)
+
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        print("Для бенчмарка нужны ffmpeg и ffprobe в PATH")
+        return 2
+
+    cases = {}
+    for case in build_cases(args.quick):
+        name = case_name(*case)
+        if args.case and not any(pattern in name for pattern in args.case):
+            continue
+        input_path = generate_input(case, args.inputs_dir)
+        samples = [
+            run_isolated(run_case, input_path, args.compress_ratio, args.max_duration, args.verbose)
+            for _ in range(args.repeat)
+        ]
+        cases[name] = summarize(samples)
+        print(f"{name}: {cases[name]['wall_seconds']:.2f}с, кружков {cases[name]['circles_sent']}, "
+              f"перекодирований {cases[name]['reencode_fallbacks']}", flush=True)
+
+    if not cases:
+        print("Нет случаев для запуска")
+        return 2
+
+    print_table(cases, ("wall_seconds", "cpu_seconds", "peak_rss_kb", "split_seconds", "circle_seconds",
+                        "compress_seconds", "output_bytes", "fallback_rate", "failures"))
+    total_fallbacks = sum(metrics["reencode_fallbacks"] for metrics in cases.values())
+    total_encodes = sum(metrics["chunks"] + 1 for metrics in cases.values())
+    return finish(SUITE, cases, args, extra={"fallback_rate": total_fallbacks / total_encodes})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
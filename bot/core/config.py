@@ -9,4 +9,74 @@ CIRCLE_SIZE = config('CIRCLE_SIZE', default=640, cast=int)
 MIN_FILE_SIZE_BYTES = config('MIN_FILE_SIZE_BYTES', default=10240, cast=int)
 RETRY_DOWNLOAD_ATTEMPTS = config('RETRY_DOWNLOAD_ATTEMPTS', default=2, cast=int)
 RETRY_SEND_ATTEMPTS = config('RETRY_SEND_ATTEMPTS', default=3, cast=int)
-SLEEP_BETWEEN_CHUNKS = config('SLEEP_BETWEEN_CHUNKS', default=2, cast=int)
\ No newline at end of file
+SLEEP_BETWEEN_CHUNKS = config('SLEEP_BETWEEN_CHUNKS', default=2, cast=int)
+
+SCHEDULER_HEAVY_SLOTS = config('SCHEDULER_HEAVY_SLOTS', default=4, cast=int)
+SCHEDULER_LIGHT_SLOTS = config('SCHEDULER_LIGHT_SLOTS', default=4, cast=int)
+MAX_ACTIVE_JOBS_PER_USER = config('MAX_ACTIVE_JOBS_PER_USER', default=1, cast=int)
+MAX_ACTIVE_JOBS_PER_CHAT = config('MAX_ACTIVE_JOBS_PER_CHAT', default=2, cast=int)
+MAX_QUEUED_JOBS_PER_USER = config('MAX_QUEUED_JOBS_PER_USER', default=5, cast=int)
+MAX_QUEUED_JOBS = config('MAX_QUEUED_JOBS', default=100, cast=int)
+
+DOWNLOADS_DIR = config('DOWNLOADS_DIR', default='./downloads')
+DOWNLOADS_BUDGET_BYTES = config('DOWNLOADS_BUDGET_BYTES', default=5368709120, cast=int)
+ORPHAN_TTL_SECONDS = config('ORPHAN_TTL_SECONDS', default=21600, cast=int)
+JANITOR_INTERVAL_SECONDS = config('JANITOR_INTERVAL_SECONDS', default=600, cast=int)
+MIN_DISK_FREE_BYTES = config('MIN_DISK_FREE_BYTES', default=536870912, cast=int)
+DOWNLOAD_RESERVE_BYTES = config('DOWNLOAD_RESERVE_BYTES', default=104857600, cast=int)
+
+JOB_TMPFS_DIR = config('JOB_TMPFS_DIR', default='/dev/shm')
+JOB_TMPFS_MIN_FREE_BYTES = config('JOB_TMPFS_MIN_FREE_BYTES', default=67108864, cast=int)
+
+STARTUP_TARGET_SECONDS = config('STARTUP_TARGET_SECONDS', default=3.0, cast=float)
+
+UPDATE_CHECK_INTERVAL_SECONDS = config('UPDATE_CHECK_INTERVAL_SECONDS', default=3600, cast=int)
+HANDOVER_TIMEOUT_SECONDS = config('HANDOVER_TIMEOUT_SECONDS', default=120, cast=int)
+
+METRICS_HOST = config('METRICS_HOST', default='127.0.0.1')
+METRICS_PORT = config('METRICS_PORT', default=9102, cast=int)
+
+TRACE_FILE = config('TRACE_FILE', default='./logs/traces.jsonl')
+TRACE_MAX_BYTES = config('TRACE_MAX_BYTES', default=10485760, cast=int)
+TRACE_BACKUP_COUNT = config('TRACE_BACKUP_COUNT', default=5, cast=int)
+
+RENDER_WORKERS = config('RENDER_WORKERS', default=0, cast=int)
+RENDER_TIMEOUT_SECONDS = config('RENDER_TIMEOUT_SECONDS', default=60, cast=int)
+
+PHOTO_STORE_MAX_BYTES = config('PHOTO_STORE_MAX_BYTES', default=67108864, cast=int)
+PHOTO_STORE_TTL_SECONDS = config('PHOTO_STORE_TTL_SECONDS', default=3600, cast=int)
+MAX_IMAGE_PIXELS = config('MAX_IMAGE_PIXELS', default=40000000, cast=int)
+
+EFFECT_CACHE_MEMORY_ITEMS = config('EFFECT_CACHE_MEMORY_ITEMS', default=2048, cast=int)
+EFFECT_CACHE_MAX_ROWS = config('EFFECT_CACHE_MAX_ROWS', default=200000, cast=int)
+
+HIGHRES_SIZE = config('HIGHRES_SIZE', default=4096, cast=int)
+HIGHRES_SOURCE_SIZE = config('HIGHRES_SOURCE_SIZE', default=1024, cast=int)
+HIGHRES_SUPERSAMPLE = config('HIGHRES_SUPERSAMPLE', default=2, cast=int)
+RENDER_TILE_SIZE = config('RENDER_TILE_SIZE', default=512, cast=int)
+
+OUTPUT_FORMAT = config('OUTPUT_FORMAT', default='PNG')
+OUTPUT_COMPRESS_LEVEL = config('OUTPUT_COMPRESS_LEVEL', default=-1, cast=int)
+OUTPUT_SIZE_TARGET_BYTES = config('OUTPUT_SIZE_TARGET_BYTES', default=2097152, cast=int)
+
+SPIRAL_ANIMATION_SIZE = config('SPIRAL_ANIMATION_SIZE', default=480, cast=int)
+SPIRAL_ANIMATION_SECONDS = config('SPIRAL_ANIMATION_SECONDS', default=6, cast=float)
+SPIRAL_ANIMATION_FPS = config('SPIRAL_ANIMATION_FPS', default=25, cast=int)
+SPIRAL_ANIMATION_FORMAT = config('SPIRAL_ANIMATION_FORMAT', default='mp4')
+
+GEOMETRY_CACHE_ITEMS = config('GEOMETRY_CACHE_ITEMS', default=16, cast=int)
+
+MEDIA_GROUP_WAIT_SECONDS = config('MEDIA_GROUP_WAIT_SECONDS', default=1.0, cast=float)
+
+TONE_MAPPING = config('TONE_MAPPING', default='even')
+DITHER = config('DITHER', default='none')
+
+VIDEO_EFFECT_SIZE = config('VIDEO_EFFECT_SIZE', default=480, cast=int)
+VIDEO_EFFECT_FPS = config('VIDEO_EFFECT_FPS', default=25, cast=int)
+VIDEO_EFFECT_MAX_SECONDS = config('VIDEO_EFFECT_MAX_SECONDS', default=60, cast=int)
+VIDEO_EFFECT_BATCH_FRAMES = config('VIDEO_EFFECT_BATCH_FRAMES', default=16, cast=int)
+
+YOUTUBE_MIN_COMPRESSED_KBPS = config('YOUTUBE_MIN_COMPRESSED_KBPS', default=400, cast=int)
+
+HANDOVER_IDLE_WAIT_SECONDS = config('HANDOVER_IDLE_WAIT_SECONDS', default=900, cast=int)
+HANDOVER_USER_IDLE_SECONDS = config('HANDOVER_USER_IDLE_SECONDS', default=300, cast=int)
@@ -0,0 +1,45 @@
+"""
+Корневой процесс бота после передачи работы преемнику (см. updater.release_process).
+
+Запускается через exec вместо старого бота, поэтому сохраняет его PID и детей, но
+не держит ни event loop, ни уборщика, ни метрик. Только дожидается процессов бота
+(своих и подхваченных как subreaper), пересылает им сигналы остановки и выходит с
+кодом последнего из них. Ничего из bot.* не импортирует.
+"""
+
+import ctypes
+import os
+import signal
+import sys
+
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def _forward(signum, frame):
+    # Преемники в той же группе процессов; сам reaper сигнал больше не получает
+    signal.signal(signum, signal.SIG_IGN)
+    os.killpg(os.getpgrp(), signum)
+
+
+def main() -> int:
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, _forward)
+
+    code = 0
+    while True:
+        try:
+            _, status = os.wait()
+        except ChildProcessError:
+            # Процессов бота не осталось
+            return code
+        code = os.waitstatus_to_exitcode(status)
+        if code < 0:
+            code = 128 - code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
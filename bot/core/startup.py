@@ -0,0 +1,83 @@
+import asyncio
+import importlib
+import logging
+import time
+
+from bot.core.config import STARTUP_TARGET_SECONDS
+
+# Тяжёлые зависимости, которые хэндлеры импортируют лениво. После старта поллинга
+# они прогреваются в фоне, чтобы первый пользователь не ждал импорта.
+HEAVY_MODULES = (
+    "yt_dlp",
+    "shazamio",
+    "numpy",
+    "PIL.Image",
+    "requests",
+    "bs4",
+    "bot.utils.image_processing",
+)
+
+
+class StartupReport:
+    """Отметки времени холодного старта: от импорта этого модуля до первого getUpdates."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.marks = []  # (этап, секунд с начала)
+        self.import_times = {}  # модуль -> секунд на импорт
+        self.polling_started = asyncio.Event()
+
+    def mark(self, stage: str):
+        self.marks.append((stage, time.perf_counter() - self.started_at))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def prewarm(self, modules=HEAVY_MODULES):
+        """Импортирует тяжёлые модули и замеряет время каждого. Синхронная — запускать в потоке."""
+        for name in modules:
+            started = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                logging.warning(f"Прогрев: не удалось импортировать {name}: {e}")
+                continue
+            self.import_times[name] = time.perf_counter() - started
+
+    def log(self):
+        stages = ", ".join(f"{stage} {seconds:.2f}с" for stage, seconds in self.marks)
+        logging.info(f"Холодный старт: {stages}")
+        if self.import_times:
+            imports = ", ".join(
+                f"{name} {seconds * 1000:.0f}мс"
+                for name, seconds in sorted(self.import_times.items(), key=lambda item: -item[1])
+            )
+            logging.info(f"Прогрев импортов: {imports}")
+
+        first_poll = dict(self.marks).get("first_poll")
+        if first_poll is not None and first_poll > STARTUP_TARGET_SECONDS:
+            logging.warning(
+                f"Время до первого поллинга {first_poll:.2f}с превышает цель {STARTUP_TARGET_SECONDS}с"
+            )
+
+    def request_middleware(self):
+        """Middleware сессии бота: отмечает момент отправки первого getUpdates."""
+        from aiogram.methods import GetUpdates
+
+        async def middleware(make_request, bot, method):
+            if not self.polling_started.is_set() and isinstance(method, GetUpdates):
+                self.mark("first_poll")
+                self.polling_started.set()
+            return await make_request(bot, method)
+
+        return middleware
+
+    async def prewarm_after_polling(self):
+        """Ждёт начала поллинга, прогревает тяжёлые модули в потоке и пишет отчёт."""
+        await self.polling_started.wait()
+        await asyncio.to_thread(self.prewarm)
+        self.mark("prewarmed")
+        self.log()
+
+
+startup_report = StartupReport()
@@ -0,0 +1,253 @@
+import asyncio
+import ctypes
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from bot.core.config import (HANDOVER_IDLE_WAIT_SECONDS, HANDOVER_TIMEOUT_SECONDS, HANDOVER_USER_IDLE_SECONDS,
+                             UPDATE_CHECK_INTERVAL_SECONDS)
+
+# Через эту переменную окружения новый процесс узнаёт, что он преемник, и получает id передачи
+HANDOVER_ENV = "BOT_HANDOVER_ID"
+HANDOVER_ROOT = os.path.join(tempfile.gettempdir(), "tg_bot_handover")
+REAPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reaper.py")
+PR_SET_CHILD_SUBREAPER = 36
+
+
+async def _run(*command) -> tuple[int, str]:
+    """Запускает команду без блокировки event loop и возвращает код возврата и вывод."""
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    stdout, _ = await process.communicate()
+    return process.returncode, stdout.decode(errors="replace")
+
+
+async def pull_updates() -> bool:
+    """Подтягивает обновления из Git и ставит зависимости. True, если появился новый код."""
+    try:
+        returncode, _ = await _run('git', 'status')
+        if returncode != 0:
+            logging.warning("Не удалось выполнить git-команды. Возможно, это не Git-репозиторий или нет прав доступа.")
+            return False
+
+        logging.info("Проверка обновлений из репозитория...")
+        returncode, output = await _run('git', 'pull', 'origin', 'master')
+        if returncode != 0:
+            logging.warning(f"git pull завершился с ошибкой: {output.strip()}")
+            return False
+        if "Already up to date." in output or "Already up-to-date." in output:
+            logging.info("Код уже актуален.")
+            return False
+
+        logging.info("Обнаружены и применены обновления кода. Установка зависимостей...")
+        returncode, output = await _run('poetry', 'install')
+        if returncode != 0:
+            logging.error(f"poetry install завершился с ошибкой, обновление не применяется: {output.strip()}")
+            return False
+        return True
+
+    except FileNotFoundError:
+        logging.warning("Команда 'git' или 'poetry' не найдена. Проверьте ваш PATH.")
+    except Exception as e:
+        logging.error(f"Ошибка при самообновлении: {e}")
+    return False
+
+
+class Handover:
+    """
+    Передача работы новому процессу без простоя.
+
+    Старый процесс запускает преемника и ждёт, пока тот прогреется (файл ready).
+    Затем старый перестаёт брать обновления, подтверждает Telegram последнюю пачку
+    и пишет released; преемник начинает поллинг и пишет polling. Только после этого
+    старый доделывает свои задачи и освобождает процесс (см. release_process).
+    """
+
+    def __init__(self, handover_id: str):
+        self.handover_id = handover_id
+        self.dir = os.path.join(HANDOVER_ROOT, handover_id)
+        os.makedirs(self.dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Handover, если текущий процесс запущен как преемник, иначе None."""
+        handover_id = os.environ.get(HANDOVER_ENV)
+        return cls(handover_id) if handover_id else None
+
+    def _flag(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def signal(self, name: str):
+        with open(self._flag(name), "w") as f:
+            f.write(str(os.getpid()))
+
+    async def wait_for(self, name: str, timeout=HANDOVER_TIMEOUT_SECONDS, process=None) -> bool:
+        """Ждёт появления флага. Если передан процесс преемника и он умер, ждать бессмысленно."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(self._flag(name)):
+                return True
+            if process is not None and process.returncode is not None:
+                return False
+            await asyncio.sleep(0.5)
+        return False
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def become_subreaper():
+    """
+    Осиротевшие потомки этого процесса достаются ему, а не init (только Linux).
+    Так преемник, чей родитель-предшественник вышел, остаётся под корневым процессом бота.
+    """
+    if sys.platform != "linux":
+        return
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)
+    except (OSError, AttributeError) as e:
+        logging.warning(f"Не удалось стать subreaper: {e}")
+
+
+def release_process():
+    """
+    Вызывается после asyncio.run, когда работа передана преемнику и задачи доделаны.
+
+    Преемник просто выходит: его собственный преемник уже подхвачен корневым процессом.
+    Корневой процесс (в контейнере это PID 1, его выход остановил бы всех) заменяет
+    себя через exec на reaper.py: тот не держит ни уборщика, ни метрик, ни памяти бота
+    и только дожидается процессов бота. Цепочки из старых процессов не образуется.
+    """
+    if Handover.from_env() is not None or sys.platform != "linux":
+        return
+    logging.info("Корневой процесс передал работу и становится reaper'ом.")
+    logging.shutdown()
+    os.execv(sys.executable, [sys.executable, REAPER_SCRIPT])
+
+
+class Updater:
+    """Фоновая проверка обновлений; при успехе запускает и прогревает преемника."""
+
+    def __init__(self, dp, bot):
+        self.dp = dp
+        self.bot = bot
+        self.successor = None  # asyncio.subprocess.Process
+        self.handover = None
+        # Новый код уже на диске, но ещё не запущен. Не зависит от вывода git:
+        # после неудачной передачи git pull ответит «Already up to date», а перезапуск всё равно нужен
+        self.restart_pending = False
+        self.last_update_id = None
+        self.last_seen = {}  # user_id -> time.monotonic() последнего апдейта
+        dp.update.outer_middleware(self._track_update)
+
+    async def _track_update(self, handler, update, data):
+        self.last_update_id = max(self.last_update_id or 0, update.update_id)
+        user = data.get("event_from_user")
+        if user is not None:
+            self.last_seen[user.id] = time.monotonic()
+        return await handler(update, data)
+
+    def users_in_flow(self) -> int:
+        """
+        Сколько пользователей сейчас посреди диалога: с состоянием FSM и апдейтом за
+        последние HANDOVER_USER_IDLE_SECONDS. Состояния и фото для эффектов живут в памяти
+        процесса и преемнику не достаются. Давно брошенные состояния не считаются:
+        MemoryStorage их не удаляет, и иначе передача ждала бы их до упора.
+        """
+        now = time.monotonic()
+        records = getattr(self.dp.storage, "storage", {})
+        return sum(1 for key, record in list(records.items())
+                   if record.state is not None
+                   and now - self.last_seen.get(key.user_id, float("-inf")) < HANDOVER_USER_IDLE_SECONDS)
+
+    async def _wait_for_users(self):
+        """Ждёт, пока пользователи закончат начатые диалоги, но не дольше HANDOVER_IDLE_WAIT_SECONDS."""
+        deadline = time.monotonic() + HANDOVER_IDLE_WAIT_SECONDS
+        while (active := self.users_in_flow()) and time.monotonic() < deadline:
+            logging.info(f"Перезапуск отложен: {active} пользователей посреди диалога.")
+            await asyncio.sleep(5)
+        if active:
+            logging.warning(f"Не дождался {active} пользователей, перезапускаюсь: их диалог придётся начать заново.")
+
+    async def _confirm_offset(self):
+        """
+        Подтверждает Telegram все полученные апдейты. stop_polling прерывает поллинг
+        до следующего getUpdates с новым offset, и без этого преемник получил бы
+        последнюю пачку повторно и обработал её второй раз.
+        """
+        if self.last_update_id is None:
+            return
+        try:
+            await self.bot.get_updates(offset=self.last_update_id + 1, limit=1, timeout=0)
+        except Exception as e:
+            logging.warning(f"Не удалось подтвердить offset {self.last_update_id + 1}: {e}")
+
+    async def spawn_successor(self) -> bool:
+        become_subreaper()
+        handover = Handover(uuid.uuid4().hex)
+        env = {**os.environ, HANDOVER_ENV: handover.handover_id}
+        process = await asyncio.create_subprocess_exec(sys.executable, *sys.argv, env=env)
+        logging.info(f"Запущен новый процесс бота (pid {process.pid}), жду прогрева...")
+
+        if not await handover.wait_for("ready", process=process):
+            logging.error("Новый процесс не прогрелся вовремя, продолжаю работать на старом коде.")
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+            handover.cleanup()
+            return False
+
+        self.successor, self.handover = process, handover
+        return True
+
+    async def run(self):
+        """
+        Проверяет обновления сразу после старта и затем каждые UPDATE_CHECK_INTERVAL_SECONDS.
+        После неудачной передачи повторная попытка — через интервал, без нового git pull.
+        Преемник запускается, когда пользователи закончат начатые диалоги (см. _wait_for_users).
+        """
+        delay = UPDATE_CHECK_INTERVAL_SECONDS if self.restart_pending else 0
+        while True:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not self.restart_pending:
+                self.restart_pending = await pull_updates()
+            if self.restart_pending:
+                await self._wait_for_users()
+            if self.restart_pending and await self.spawn_successor():
+                logging.info("Новый процесс готов. Прекращаю приём обновлений от Telegram...")
+                await self.dp.stop_polling()
+                return
+            if UPDATE_CHECK_INTERVAL_SECONDS <= 0:
+                return
+            delay = UPDATE_CHECK_INTERVAL_SECONDS
+
+    async def finish_handover(self, drain) -> bool:
+        """
+        Отдаёт поллинг преемнику и доделывает текущие задачи. False, если передача
+        не удалась и поллинг надо вернуть; иначе процесс завершается через release_process.
+        """
+        await self._confirm_offset()
+        self.handover.signal("released")
+        if not await self.handover.wait_for("polling", process=self.successor):
+            logging.error("Новый процесс не начал поллинг вовремя, возвращаюсь к поллингу на старом процессе.")
+            if self.successor.returncode is None:
+                self.successor.terminate()
+                await self.successor.wait()
+            self.handover.cleanup()
+            self.successor = self.handover = None
+            return False
+
+        logging.info("Новый процесс начал поллинг. Завершаю текущие задачи...")
+        await drain()
+        logging.info("Все задачи завершены, старый процесс передал работу.")
+        self.restart_pending = False
+        self.handover.cleanup()
+        return True
@@ -1,4 +1,4 @@
-from .start import register_start_handlers
+from .start import register_fallback_handlers, register_start_handlers
 from .video_circle import register_video_circle_handlers
 from .tiktok import register_tiktok_handlers
 from .youtube import register_youtube_handlers
@@ -21,4 +21,6 @@ def register_all_handlers(dp: Dispatcher, bot: Bot):
     register_reels_handlers(dp)
     register_audio_handlers(dp)
     
-    dp.include_router(image_converter_router)
\ No newline at end of file
+    dp.include_router(image_converter_router)
+
+    register_fallback_handlers(dp)
\ No newline at end of file
@@ -3,26 +3,31 @@ import shlex
 from aiogram import types
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
-from shazamio import Shazam
-import yt_dlp
 import os
 
 from bot.core.states import AudioDownloadStates
-from bot.utils.helpers import cleanup_files, download_with_retry, send_with_retry, validate_audio_file
+from bot.utils.helpers import download_with_retry, send_with_retry, validate_audio_file
 from bot.utils.processing import run_ffmpeg_command, get_audio_duration
+from bot.utils.metrics import observe_stage
+from bot.utils.scheduler import fair_job
+from bot.utils.storage import disk_manager
+from bot.utils.workspace import JobWorkspace
 
 
 async def cmd_audio_download(message: types.Message, state: FSMContext):
     await message.answer("Отправьте ссылку на TikTok видео или Instagram Reel. Я извлеку аудио и отправлю MP3. 🎵")
     await state.set_state(AudioDownloadStates.waiting_for_link)
 
+@fair_job("heavy")
 async def process_audio_link(message: types.Message, state: FSMContext):
+    import yt_dlp  # Ленивый импорт, чтобы не замедлять холодный старт
     bot = message.bot
     await message.answer("Получил ссылку, скачиваю полностью... 🚀")
     link = message.text
     chat_id = message.chat.id
-    video_path = f"./downloads/{chat_id}_audio_video.mp4"
-    audio_path = f"./downloads/{chat_id}_audio_audio.mp3"
+    workspace = JobWorkspace("audio")
+    video_path = workspace.path("video.mp4")
+    audio_path = workspace.scratch("audio.mp3")
 
     try:
         # Скачивание видео с retry (как в tt/reels)
@@ -46,6 +51,7 @@ async def process_audio_link(message: types.Message, state: FSMContext):
             logging.error(f"ffmpeg audio extraction error: {stderr.decode()}")
             await bot.send_message(chat_id, "Ошибка при извлечении аудио. 😔")
             return
+        disk_manager.add(audio_path)
 
         # Валидация аудио
         if not await validate_audio_file(audio_path):
@@ -55,8 +61,10 @@ async def process_audio_link(message: types.Message, state: FSMContext):
         # Shazam audio
         track_info = "Не удалось распознать трек. 🤷‍♀️"
         try:
+            from shazamio import Shazam  # Ленивый импорт: shazamio тяжёлый и нужен не при каждом старте
             shazam = Shazam()
-            out = await shazam.recognize_song(audio_path)
+            with observe_stage("recognize"):
+                out = await shazam.recognize_song(audio_path)
             if out and 'track' in out:
                 title = out['track'].get('title', 'N/A')
                 subtitle = out['track'].get('subtitle', 'N/A')
@@ -80,7 +88,7 @@ async def process_audio_link(message: types.Message, state: FSMContext):
         logging.error(f"Error processing audio link: {e}")
         await bot.send_message(chat_id, "Ошибка при скачивании или обработке. ❌")
     finally:
-        await cleanup_files(video_path, audio_path, delay=1)
+        await workspace.cleanup()
         await state.clear()
 
 def register_audio_handlers(dp):
@@ -1,24 +1,65 @@
+import asyncio
 import logging
 import os
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
-from aiogram.filters import Command
+from aiogram import Bot, Router, F
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import (Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile,
+                           FSInputFile, InputMediaDocument, InputMediaPhoto)
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from bot.utils.image_processing import (
-    create_spiral_image,
-    create_square_grid_image,
-    create_hexagon_grid_image,
-    create_triangle_grid_image,
-    create_diamond_grid_image,
-    create_pentagon_grid_image,
-    create_double_spiral_image,
-    save_image_to_bytes
-)
+from bot.core.config import (CIRCLE_SIZE, HIGHRES_SIZE, HIGHRES_SOURCE_SIZE, HIGHRES_SUPERSAMPLE, OUTPUT_FORMAT,
+                             SPIRAL_ANIMATION_FORMAT, SPIRAL_ANIMATION_FPS, SPIRAL_ANIMATION_SECONDS,
+                             SPIRAL_ANIMATION_SIZE, VIDEO_EFFECT_FPS, VIDEO_EFFECT_MAX_SECONDS, VIDEO_EFFECT_SIZE)
+from bot.utils.media_group import media_groups
+from bot.utils.metrics import observe_stage
+from bot.utils.photo_store import photo_store
+from bot.utils.render_pool import RenderTimeout, render_pool
+from bot.utils.result_cache import effect_cache
+from bot.utils.scheduler import fair_job, job_trace
+from bot.utils.storage import disk_manager
+from bot.utils.video_effects import VideoEffectError, apply_effect_to_video
+from bot.utils.workspace import job_workspace
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# callback_data -> (effect, button text); the order gives the numbers on the preview sheet
+EFFECT_BUTTONS = {
+    "effect_spiral": ("spiral", "🌀 Спиральная обработка"),
+    "effect_square": ("square", "⬜ Квадратная сетка"),
+    "effect_hexagon": ("hexagon", "⬡ Шестиугольная сетка"),
+    "effect_triangle": ("triangle", "🔺 Треугольная сетка"),
+    "effect_diamond": ("diamond", "💎 Ромбовая сетка"),
+    "effect_pentagon": ("pentagon", "⬠ Пятиугольная сетка"),
+    "effect_double_spiral": ("double_spiral", "🎨 Двойная спираль"),
+}
+# Effect parameters used by the buttons and by the preview (spiral: default thickness)
+EFFECT_PARAMS = {
+    "spiral": {"spiral_thickness": 2, "spiral_turns": 50, "invert": False},
+    "square": {"grid_size": 50, "invert": False},
+    "hexagon": {"grid_size": 50, "invert": False},
+    "triangle": {"grid_size": 50, "invert": False},
+    "diamond": {"grid_size": 50, "invert": False},
+    "pentagon": {"grid_size": 50, "invert": False},
+    "double_spiral": {"spiral_thickness": 2, "spiral_turns": 50},
+}
+IMAGE_SIZE = 300
+N_SHADES = 16
+PREVIEW_SIZE = 240
+OUTPUT_EXTENSION = OUTPUT_FORMAT.lower()
+# Result output chosen on the keyboard -> (button text, notice on switching); the button cycles through them
+OUTPUTS = {
+    "photo": ("🖼 Результат: фото", "Результат придёт фото"),
+    "highres": (f"🖨 Результат: {HIGHRES_SIZE}px файлом", f"Результат придёт файлом {HIGHRES_SIZE}px"),
+    "svg": ("📐 Результат: SVG (вектор)", "Результат придёт векторным SVG-файлом"),
+}
+# The same for a video: the effect is applied to every frame
+VIDEO_OUTPUTS = {
+    "video": ("🎞 Результат: видео", "Результат придёт видео"),
+    "video_note": ("⭕ Результат: кружок", "Результат придёт кружком"),
+}
+
 
 class ImageProcessingState(StatesGroup):
     """States for image processing workflow"""
@@ -27,15 +68,17 @@ class ImageProcessingState(StatesGroup):
     waiting_for_spiral_params = State()
     waiting_for_grid_params = State()
     waiting_for_second_image = State()
+    waiting_for_video_effect = State()
 
 
-@router.message(Command("/phone_converter"))
+@router.message(Command("phone_converter"))
 async def start_image_converter(message: Message, state: FSMContext):
     """Start the image converter command"""
     try:
         await message.answer(
             "🖼️ **Конвертер изображений**\n\n"
-            "Отправьте изображение, которое вы хотите обработать.",
+            "Отправьте изображение, которое вы хотите обработать, "
+            "или видео — эффект будет применён к каждому кадру.",
             parse_mode="Markdown"
         )
         await state.set_state(ImageProcessingState.waiting_for_image)
@@ -47,43 +90,88 @@ async def start_image_converter(message: Message, state: FSMContext):
 @router.message(ImageProcessingState.waiting_for_image, F.photo)
 async def receive_image(message: Message, state: FSMContext):
     """Receive image from user"""
+    messages = [message]
+    if message.media_group_id:
+        # The handler of the first photo gets the whole album, the rest only join it
+        messages = await media_groups.collect((message.from_user.id, message.media_group_id), message)
+        if messages is None:
+            return
+    # Photo ingest runs outside the scheduler, so it opens its own trace
+    with job_trace("receive_image", message.from_user.id, message.chat.id, photos=len(messages)):
+        if len(messages) > 1:
+            await _receive_album(sorted(messages, key=lambda m: m.message_id), state)
+            return
+        try:
+            # Download the photo into memory
+            photo = message.photo[-1]
+            with observe_stage("download") as observed:
+                buffer = await message.bot.download(photo)
+                image_bytes = buffer.getvalue()
+                observed.set(bytes=len(image_bytes))
+            photo_store.put(message.from_user.id, image_bytes)
+            await state.update_data(file_unique_id=photo.file_unique_id, album=None, output="photo", previewed=False)
+            
+            # Show effect options
+            keyboard = _effects_keyboard()
+            
+            await message.answer(
+                "✅ Изображение получено!\n\n"
+                "Выберите тип обработки:",
+                reply_markup=keyboard
+            )
+            await state.set_state(ImageProcessingState.waiting_for_effect_choice)
+        
+        except Exception as e:
+            logger.error(f"Error in receive_image: {e}")
+            await message.answer("❌ Ошибка при загрузке изображения. Попробуйте еще раз.")
+            await state.clear()
+
+
+async def _receive_album(messages: list[Message], state: FSMContext):
+    """Receive all photos of an album; the chosen effect is then applied to each of them"""
+    message = messages[0]
     try:
-        # Download the photo
-        photo = message.photo[-1]
-        file_info = await message.bot.get_file(photo.file_id)
-        
-        # Create temporary file
-        temp_dir = "./downloads"
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_file = os.path.join(temp_dir, f"temp_image_{message.from_user.id}.jpg")
-        
-        # Download file
-        await message.bot.download_file(file_info.file_path, temp_file)
-        
-        # Store file path in state
-        await state.update_data(image_path=temp_file)
-        
-        # Show effect options
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🌀 Спиральная обработка", callback_data="effect_spiral")],
-            [InlineKeyboardButton(text="⬜ Квадратная сетка", callback_data="effect_square")],
-            [InlineKeyboardButton(text="⬡ Шестиугольная сетка", callback_data="effect_hexagon")],
-            [InlineKeyboardButton(text="🔺 Треугольная сетка", callback_data="effect_triangle")],
-            [InlineKeyboardButton(text="💎 Ромбовая сетка", callback_data="effect_diamond")],
-            [InlineKeyboardButton(text="⬠ Пятиугольная сетка", callback_data="effect_pentagon")],
-            [InlineKeyboardButton(text="🎨 Двойная спираль", callback_data="effect_double_spiral")],
-        ])
+        photos = [m.photo[-1] for m in messages]
+        with observe_stage("download") as observed:
+            buffers = await asyncio.gather(*(message.bot.download(photo) for photo in photos))
+            album = [buffer.getvalue() for buffer in buffers]
+            observed.set(bytes=sum(map(len, album)), photos=len(album))
+        photo_store.put_album(message.from_user.id, album)
+        await state.update_data(file_unique_id=None, album=[photo.file_unique_id for photo in photos],
+                                output="photo", previewed=False)
         
         await message.answer(
-            "✅ Изображение получено!\n\n"
-            "Выберите тип обработки:",
-            reply_markup=keyboard
+            f"✅ Получено изображений: {len(album)}\n\n"
+            "Выберите тип обработки, он будет применён ко всем:",
+            reply_markup=_effects_keyboard(album=True)
         )
         await state.set_state(ImageProcessingState.waiting_for_effect_choice)
     
     except Exception as e:
-        logger.error(f"Error in receive_image: {e}")
-        await message.answer("❌ Ошибка при загрузке изображения. Попробуйте еще раз.")
+        logger.error(f"Error in _receive_album: {e}")
+        await message.answer("❌ Ошибка при загрузке изображений. Попробуйте еще раз.")
+        await state.clear()
+
+
+@router.message(ImageProcessingState.waiting_for_image, F.video)
+async def receive_video(message: Message, state: FSMContext):
+    """Receive a video; it is downloaded only once the effect is chosen"""
+    try:
+        video = message.video
+        await state.update_data(video_file_id=video.file_id, file_unique_id=video.file_unique_id, album=None,
+                                output="video")
+        trimmed = f" (первые {VIDEO_EFFECT_MAX_SECONDS} сек.)" if video.duration > VIDEO_EFFECT_MAX_SECONDS else ""
+        
+        await message.answer(
+            "✅ Видео получено!\n\n"
+            f"Выберите тип обработки, он будет применён к каждому кадру{trimmed}:",
+            reply_markup=_effects_keyboard(output="video", video=True)
+        )
+        await state.set_state(ImageProcessingState.waiting_for_video_effect)
+    
+    except Exception as e:
+        logger.error(f"Error in receive_video: {e}")
+        await message.answer("❌ Ошибка при получении видео. Попробуйте еще раз.")
         await state.clear()
 
 
@@ -91,12 +179,17 @@ async def receive_image(message: Message, state: FSMContext):
 async def choose_spiral_params(callback: CallbackQuery, state: FSMContext):
     """Choose spiral parameters"""
     try:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        rows = [
             [InlineKeyboardButton(text="Тонкая (1)", callback_data="spiral_thick_1")],
             [InlineKeyboardButton(text="Средняя (2)", callback_data="spiral_thick_2")],
             [InlineKeyboardButton(text="Толстая (3)", callback_data="spiral_thick_3")],
             [InlineKeyboardButton(text="Очень толстая (4)", callback_data="spiral_thick_4")],
-        ])
+        ]
+        # Animations are drawn from a single photo
+        if not (await state.get_data()).get("album"):
+            rows.append([InlineKeyboardButton(text="🎬 Анимация рисования", callback_data="spiral_anim_animation")])
+            rows.append([InlineKeyboardButton(text="⭕ Анимация кружком", callback_data="spiral_anim_video_note")])
+        keyboard = InlineKeyboardMarkup(inline_keyboard=rows)
         
         await callback.message.edit_text(
             "🌀 **Спиральная обработка**\n\n"
@@ -110,240 +203,385 @@ async def choose_spiral_params(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
-@router.callback_query(ImageProcessingState.waiting_for_spiral_params, F.data.startswith("spiral_thick_"))
-async def process_spiral_image(callback: CallbackQuery, state: FSMContext):
-    """Process image with spiral effect"""
+def _effects_keyboard(numbered: bool = False, preview: bool = True, output: str = "photo",
+                      album: bool = False, video: bool = False) -> InlineKeyboardMarkup:
+    """
+    Effect choice keyboard; numbered buttons match the labels on the preview sheet.
+    An album or a video gets neither the preview nor the double spiral, which takes a second photo.
+    """
+    single = not (album or video)
+    rows = [
+        [InlineKeyboardButton(text=f"{number}. {text}" if numbered else text, callback_data=data)]
+        for number, (data, (effect, text)) in enumerate(EFFECT_BUTTONS.items(), 1)
+        if single or effect != "double_spiral"
+    ]
+    if preview and single:
+        rows.append([InlineKeyboardButton(text="👀 Превью всех эффектов", callback_data="effect_preview")])
+    outputs = VIDEO_OUTPUTS if video else OUTPUTS
+    rows.append([InlineKeyboardButton(text=outputs[output][0], callback_data="toggle_output")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def _render_params(data: dict, params: dict) -> tuple[dict, str]:
+    """Render parameters and render_pool mode ("image", "tiled" or "svg") for the output chosen on the keyboard"""
+    output = data.get("output", "photo")
+    if output == "highres":
+        return {"size": HIGHRES_SIZE, "source_size": HIGHRES_SOURCE_SIZE, "reference_size": IMAGE_SIZE,
+                "supersample": HIGHRES_SUPERSAMPLE, "n_shades": N_SHADES, **params}, "tiled"
+    return {"size": IMAGE_SIZE, "n_shades": N_SHADES, **params}, "svg" if output == "svg" else "image"
+
+
+def _cache_key(file_unique_id: str, effect: str, params: dict, mode: str) -> str:
+    # SVG and PNG renders of the same size share their parameters
+    return effect_cache.key(file_unique_id, f"{effect}_svg" if mode == "svg" else effect, params)
+
+
+async def _shared_gray_array(user_id: int):
+    """Preprocessed array of the stored photo, computed once and shared by all effects; None if the photo expired"""
+    key = (IMAGE_SIZE, N_SHADES)
+    gray_array = photo_store.get_array(user_id, key)
+    if gray_array is None:
+        image_bytes = photo_store.get(user_id)
+        if image_bytes is None:
+            return None
+        gray_array = await render_pool.preprocess(image_bytes, IMAGE_SIZE, N_SHADES)
+        photo_store.put_array(user_id, key, gray_array)
+    return gray_array
+
+
+def _stored_source(user_id: int, size: int):
+    """Preprocessed array of the stored photo if one of this size exists, else the photo itself; None if expired"""
+    source = photo_store.get_array(user_id, (size, N_SHADES))
+    return source if source is not None else photo_store.get(user_id)
+
+
+async def _send_result(bot: Bot, chat_id: int, kind: str, media, caption: str) -> Message:
+    """Send a result as a photo, document, animation or video note (media: file_id or input file)"""
+    if kind == "video_note":
+        # Video notes cannot have a caption
+        sent = await bot.send_video_note(chat_id, media, length=CIRCLE_SIZE)
+        await bot.send_message(chat_id, caption)
+        return sent
+    send = {"photo": bot.send_photo, "document": bot.send_document, "animation": bot.send_animation,
+            "video": bot.send_video}[kind]
+    return await send(chat_id, media, caption=caption)
+
+
+async def _send_cached_result(bot: Bot, chat_id: int, cache_key: str, caption: str, kind: str = "photo") -> bool:
+    """Send a previously rendered result by its file_id; False if there is none or Telegram rejected it"""
+    file_id = await effect_cache.get(cache_key)
+    if file_id is None:
+        return False
+    try:
+        await _send_result(bot, chat_id, kind, file_id, caption)
+        return True
+    except TelegramBadRequest as e:
+        logger.warning(f"Cached effect result rejected, rendering again: {e}")
+        await effect_cache.invalidate(cache_key)
+        return False
+
+
+async def _send_rendered_result(bot: Bot, chat_id: int, cache_key: str, caption: str, media, kind: str = "photo"):
+    """Upload a freshly rendered result and remember its file_id for repeat requests"""
+    sent = await _send_result(bot, chat_id, kind, media, caption)
+    uploaded = getattr(sent, kind)
+    if uploaded:
+        await effect_cache.put(cache_key, (uploaded[-1] if kind == "photo" else uploaded).file_id)
+
+
+def _result_file(result_bytes: bytes, mode: str, index: int = None) -> BufferedInputFile:
+    # High-res and SVG output go as files, so Telegram does not recompress and downscale them
+    name = f"processed_image_{HIGHRES_SIZE}px" if mode == "tiled" else "processed_image"
+    if index is not None:
+        name = f"{name}_{index}"
+    extension = "svg" if mode == "svg" else OUTPUT_EXTENSION
+    return BufferedInputFile(result_bytes, filename=f"{name}.{extension}")
+
+
+async def _send_album_results(bot: Bot, user_id: int, file_unique_ids: list[str], effect: str, params: dict,
+                              mode: str, caption: str) -> bool:
+    """
+    Apply an effect to every photo of an album and send the results back as one media group.
+    Cached results go by file_id, the rest are rendered together in the render pool.
+    The album is stored under user_id and the results go to that user's private chat.
+    Returns False if the photos expired.
+    """
+    cache_keys = [_cache_key(file_unique_id, effect, params, mode) for file_unique_id in file_unique_ids]
+    media = [await effect_cache.get(cache_key) for cache_key in cache_keys]
+    cached = [index for index, item in enumerate(media) if item is not None]
+    missing = [index for index, item in enumerate(media) if item is None]
+    if missing:
+        album = photo_store.get_album(user_id)
+        if album is None:
+            return False
+        results = await render_pool.render_batch(effect, [[album[index]] for index in missing], mode=mode, **params)
+        for index, result_bytes in zip(missing, results):
+            media[index] = _result_file(result_bytes, mode, index + 1)
+    
+    as_photos = mode == "image"
+    input_media = InputMediaPhoto if as_photos else InputMediaDocument
+    try:
+        sent = await bot.send_media_group(user_id, [
+            input_media(media=item, caption=caption if index == 0 else None) for index, item in enumerate(media)
+        ])
+    except TelegramBadRequest as e:
+        if not cached:
+            raise
+        logger.warning(f"Cached album results rejected, rendering again: {e}")
+        for index in cached:
+            await effect_cache.invalidate(cache_keys[index])
+        return await _send_album_results(bot, user_id, file_unique_ids, effect, params, mode, caption)
+    
+    for index in missing:
+        uploaded = sent[index].photo if as_photos else sent[index].document
+        if uploaded:
+            await effect_cache.put(cache_keys[index], (uploaded[-1] if as_photos else uploaded).file_id)
+    return True
+
+
+async def _apply_effect(callback: CallbackQuery, state: FSMContext, effect: str, caption: str, **params):
+    """Send an effect for the stored image: from the result cache or rendered in the render pool"""
     try:
         await callback.message.edit_text("⏳ Обработка изображения...")
         
-        thickness_map = {
-            "spiral_thick_1": 1,
-            "spiral_thick_2": 2,
-            "spiral_thick_3": 3,
-            "spiral_thick_4": 4,
-        }
-        thickness = thickness_map.get(callback.data, 2)
-        
         data = await state.get_data()
-        image_path = data.get("image_path")
-        
-        result_image = create_spiral_image(
-            image_path,
-            spiral_thickness=thickness,
-            spiral_turns=50,
-            size=300,
-            n_shades=16,
-            invert=False
-        )
-        
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await callback.message.bot.send_photo(
-            callback.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Спиральная обработка завершена!"
-        )
+        params, mode = _render_params(data, params)
+        cache_key = _cache_key(data.get("file_unique_id"), effect, params, mode)
+        bot, user_id = callback.message.bot, callback.from_user.id
+        
+        kind = "photo" if mode == "image" else "document"
+        if data.get("album"):
+            if not await _send_album_results(bot, user_id, data["album"], effect, params, mode, caption):
+                await callback.message.edit_text("⌛ Изображения устарели. Отправьте их заново: /phone_converter")
+                await state.clear()
+                return
+        elif not await _send_cached_result(bot, user_id, cache_key, caption, kind):
+            # After a preview the photo is already preprocessed; otherwise the worker decodes it
+            source = _stored_source(user_id, params.get("source_size", params["size"]))
+            if source is None:
+                await callback.message.edit_text("⌛ Изображение устарело. Отправьте его заново: /phone_converter")
+                await state.clear()
+                return
+            
+            result_bytes = await render_pool.render(effect, [source], mode=mode, **params)
+            await _send_rendered_result(bot, user_id, cache_key, caption, _result_file(result_bytes, mode), kind)
         
         await callback.message.delete()
         
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
+        photo_store.discard(user_id)
         await state.clear()
     
+    except RenderTimeout:
+        await callback.message.edit_text("❌ Обработка заняла слишком много времени. Попробуйте еще раз.")
+        await state.clear()
     except Exception as e:
-        logger.error(f"Error in process_spiral_image: {e}")
+        logger.error(f"Error applying {effect} effect: {e}")
         await callback.message.edit_text("❌ Ошибка при обработке изображения.")
         await state.clear()
 
 
-@router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_square")
-async def process_square_grid(callback: CallbackQuery, state: FSMContext):
-    """Process image with square grid effect"""
+@router.callback_query(ImageProcessingState.waiting_for_spiral_params, F.data.startswith("spiral_thick_"))
+@fair_job("light")
+async def process_spiral_image(callback: CallbackQuery, state: FSMContext):
+    """Process image with spiral effect"""
+    thickness_map = {
+        "spiral_thick_1": 1,
+        "spiral_thick_2": 2,
+        "spiral_thick_3": 3,
+        "spiral_thick_4": 4,
+    }
+    thickness = thickness_map.get(callback.data, 2)
+    await _apply_effect(callback, state, "spiral", "✅ Спиральная обработка завершена!",
+                        **{**EFFECT_PARAMS["spiral"], "spiral_thickness": thickness})
+
+
+@router.callback_query(ImageProcessingState.waiting_for_spiral_params, F.data.startswith("spiral_anim_"))
+@fair_job("light")
+async def process_spiral_animation(callback: CallbackQuery, state: FSMContext):
+    """Send the spiral being drawn as an animation or a video note"""
+    kind = callback.data.removeprefix("spiral_anim_")
     try:
-        await callback.message.edit_text("⏳ Обработка изображения...")
+        await callback.message.edit_text("⏳ Рисую анимацию спирали...")
         
         data = await state.get_data()
-        image_path = data.get("image_path")
-        
-        result_image = create_square_grid_image(
-            image_path,
-            grid_size=50,
-            size=300,
-            n_shades=16,
-            invert=False
-        )
-        
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await callback.message.bot.send_photo(
-            callback.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Квадратная сетка завершена!"
-        )
+        size = CIRCLE_SIZE if kind == "video_note" else SPIRAL_ANIMATION_SIZE
+        output_format = "mp4" if kind == "video_note" else SPIRAL_ANIMATION_FORMAT
+        params = {**EFFECT_PARAMS["spiral"], "size": size, "seconds": SPIRAL_ANIMATION_SECONDS,
+                  "fps": SPIRAL_ANIMATION_FPS, "format": output_format, "n_shades": N_SHADES}
+        cache_key = effect_cache.key(data.get("file_unique_id"), f"spiral_{kind}", params)
+        bot, user_id = callback.message.bot, callback.from_user.id
+        caption = "✅ Спираль нарисована!"
+        
+        if not await _send_cached_result(bot, user_id, cache_key, caption, kind):
+            source = _stored_source(user_id, size)
+            if source is None:
+                await callback.message.edit_text("⌛ Изображение устарело. Отправьте его заново: /phone_converter")
+                await state.clear()
+                return
+            
+            async with job_workspace("spiral_anim") as workspace:
+                output_path = workspace.scratch(f"spiral.{output_format}")
+                await render_pool.spiral_animation([source], output_path, **params)
+                await _send_rendered_result(bot, user_id, cache_key, caption, FSInputFile(output_path), kind)
         
         await callback.message.delete()
         
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
+        photo_store.discard(user_id)
         await state.clear()
     
+    except RenderTimeout:
+        await callback.message.edit_text("❌ Обработка заняла слишком много времени. Попробуйте еще раз.")
+        await state.clear()
     except Exception as e:
-        logger.error(f"Error in process_square_grid: {e}")
-        await callback.message.edit_text("❌ Ошибка при обработке изображения.")
+        logger.error(f"Error in process_spiral_animation: {e}")
+        await callback.message.edit_text("❌ Ошибка при создании анимации.")
         await state.clear()
 
 
+@router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_square")
+@fair_job("light")
+async def process_square_grid(callback: CallbackQuery, state: FSMContext):
+    """Process image with square grid effect"""
+    await _apply_effect(callback, state, "square", "✅ Квадратная сетка завершена!", **EFFECT_PARAMS["square"])
+
+
 @router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_hexagon")
+@fair_job("light")
 async def process_hexagon_grid(callback: CallbackQuery, state: FSMContext):
     """Process image with hexagon grid effect"""
-    try:
-        await callback.message.edit_text("⏳ Обработка изображения...")
-        
-        data = await state.get_data()
-        image_path = data.get("image_path")
-        
-        result_image = create_hexagon_grid_image(
-            image_path,
-            grid_size=50,
-            size=300,
-            n_shades=16,
-            invert=False
-        )
-        
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await callback.message.bot.send_photo(
-            callback.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Шестиугольная сетка завершена!"
-        )
-        
-        await callback.message.delete()
-        
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
-        await state.clear()
-    
-    except Exception as e:
-        logger.error(f"Error in process_hexagon_grid: {e}")
-        await callback.message.edit_text("❌ Ошибка при обработке изображения.")
-        await state.clear()
+    await _apply_effect(callback, state, "hexagon", "✅ Шестиугольная сетка завершена!", **EFFECT_PARAMS["hexagon"])
 
 
 @router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_triangle")
+@fair_job("light")
 async def process_triangle_grid(callback: CallbackQuery, state: FSMContext):
     """Process image with triangle grid effect"""
-    try:
-        await callback.message.edit_text("⏳ Обработка изображения...")
-        
-        data = await state.get_data()
-        image_path = data.get("image_path")
-        
-        result_image = create_triangle_grid_image(
-            image_path,
-            grid_size=50,
-            size=300,
-            n_shades=16,
-            invert=False
-        )
-        
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await callback.message.bot.send_photo(
-            callback.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Треугольная сетка завершена!"
-        )
-        
-        await callback.message.delete()
-        
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
-        await state.clear()
-    
-    except Exception as e:
-        logger.error(f"Error in process_triangle_grid: {e}")
-        await callback.message.edit_text("❌ Ошибка при обработке изображения.")
-        await state.clear()
+    await _apply_effect(callback, state, "triangle", "✅ Треугольная сетка завершена!", **EFFECT_PARAMS["triangle"])
 
 
 @router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_diamond")
+@fair_job("light")
 async def process_diamond_grid(callback: CallbackQuery, state: FSMContext):
     """Process image with diamond grid effect"""
+    await _apply_effect(callback, state, "diamond", "✅ Ромбовая сетка завершена!", **EFFECT_PARAMS["diamond"])
+
+
+@router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_pentagon")
+@fair_job("light")
+async def process_pentagon_grid(callback: CallbackQuery, state: FSMContext):
+    """Process image with pentagon grid effect"""
+    await _apply_effect(callback, state, "pentagon", "✅ Пятиугольная сетка завершена!", **EFFECT_PARAMS["pentagon"])
+
+
+@router.callback_query(StateFilter(ImageProcessingState.waiting_for_effect_choice,
+                                   ImageProcessingState.waiting_for_video_effect), F.data == "toggle_output")
+async def toggle_output(callback: CallbackQuery, state: FSMContext):
+    """Switch the output between a regular photo, a high-resolution file and an SVG file (a video or a video note)"""
     try:
-        await callback.message.edit_text("⏳ Обработка изображения...")
-        
         data = await state.get_data()
-        image_path = data.get("image_path")
-        
-        result_image = create_diamond_grid_image(
-            image_path,
-            grid_size=50,
-            size=300,
-            n_shades=16,
-            invert=False
+        video = await state.get_state() == ImageProcessingState.waiting_for_video_effect.state
+        choices = VIDEO_OUTPUTS if video else OUTPUTS
+        outputs = list(choices)
+        output = outputs[(outputs.index(data.get("output", outputs[0])) + 1) % len(outputs)]
+        await state.update_data(output=output)
+        previewed = data.get("previewed", False)
+        await callback.message.edit_reply_markup(
+            reply_markup=_effects_keyboard(numbered=previewed, preview=not previewed, output=output,
+                                           album=bool(data.get("album")), video=video)
         )
+        await callback.answer(choices[output][1])
+    except Exception as e:
+        logger.error(f"Error in toggle_output: {e}")
+        await callback.answer("❌ Ошибка", show_alert=True)
+
+
+@router.callback_query(ImageProcessingState.waiting_for_video_effect, F.data.in_(EFFECT_BUTTONS))
+@fair_job("heavy")
+async def process_video_effect(callback: CallbackQuery, state: FSMContext):
+    """Apply an effect to every frame of the video and send it back as a video or a video note"""
+    effect = EFFECT_BUTTONS[callback.data][0]
+    try:
+        await callback.message.edit_text("⏳ Обработка видео...")
         
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await callback.message.bot.send_photo(
-            callback.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Ромбовая сетка завершена!"
-        )
+        data = await state.get_data()
+        kind = data.get("output", "video")
+        size = CIRCLE_SIZE if kind == "video_note" else VIDEO_EFFECT_SIZE
+        # Line widths are chosen for photos of IMAGE_SIZE and scaled to the frame size
+        params = {**EFFECT_PARAMS[effect], "n_shades": N_SHADES, "reference_size": IMAGE_SIZE}
+        cache_key = effect_cache.key(data.get("file_unique_id"), f"{effect}_{kind}",
+                                     {**params, "size": size, "fps": VIDEO_EFFECT_FPS,
+                                      "seconds": VIDEO_EFFECT_MAX_SECONDS})
+        bot, user_id = callback.message.bot, callback.from_user.id
+        caption = "✅ Видео обработано!"
+        
+        if not await _send_cached_result(bot, user_id, cache_key, caption, kind):
+            async with job_workspace("video_effect") as workspace:
+                input_path = workspace.path("input.mp4")
+                with observe_stage("download") as observed:
+                    await bot.download(data["video_file_id"], destination=input_path)
+                    observed.set(bytes=os.path.getsize(input_path))
+                disk_manager.add(input_path)
+                output_path = workspace.path("output.mp4")
+                await apply_effect_to_video(input_path, output_path, effect, size, **params)
+                await _send_rendered_result(bot, user_id, cache_key, caption, FSInputFile(output_path), kind)
         
         await callback.message.delete()
-        
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
         await state.clear()
     
+    except RenderTimeout:
+        await callback.message.edit_text("❌ Обработка заняла слишком много времени. Попробуйте видео покороче.")
+        await state.clear()
+    except VideoEffectError as e:
+        logger.error(f"Error decoding or encoding video for {effect} effect: {e}")
+        await callback.message.edit_text("❌ Не удалось обработать это видео.")
+        await state.clear()
     except Exception as e:
-        logger.error(f"Error in process_diamond_grid: {e}")
-        await callback.message.edit_text("❌ Ошибка при обработке изображения.")
+        logger.error(f"Error applying {effect} effect to video: {e}")
+        await callback.message.edit_text("❌ Ошибка при обработке видео.")
         await state.clear()
 
 
-@router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_pentagon")
-async def process_pentagon_grid(callback: CallbackQuery, state: FSMContext):
-    """Process image with pentagon grid effect"""
+@router.callback_query(ImageProcessingState.waiting_for_effect_choice, F.data == "effect_preview")
+@fair_job("light")
+async def process_effects_preview(callback: CallbackQuery, state: FSMContext):
+    """Send thumbnails of all effects as one contact sheet, then offer the choice again"""
     try:
-        await callback.message.edit_text("⏳ Обработка изображения...")
-        
-        data = await state.get_data()
-        image_path = data.get("image_path")
-        
-        result_image = create_pentagon_grid_image(
-            image_path,
-            grid_size=50,
-            size=300,
-            n_shades=16,
-            invert=False
-        )
-        
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await callback.message.bot.send_photo(
-            callback.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Пятиугольная сетка завершена!"
+        await callback.message.edit_text("⏳ Готовлю превью всех эффектов...")
+        bot, user_id = callback.message.bot, callback.from_user.id
+        
+        gray_array = await _shared_gray_array(user_id)
+        if gray_array is None:
+            await callback.message.edit_text("⌛ Изображение устарело. Отправьте его заново: /phone_converter")
+            await state.clear()
+            return
+        
+        # The default font has no Cyrillic, so thumbnails are labelled with the button numbers
+        thumbnails = {
+            effect: (str(number), EFFECT_PARAMS[effect])
+            for number, (effect, _) in enumerate(EFFECT_BUTTONS.values(), 1)
+        }
+        sheet_bytes = await render_pool.contact_sheet(gray_array, thumbnails, PREVIEW_SIZE)
+        await bot.send_photo(
+            user_id,
+            photo=BufferedInputFile(sheet_bytes, filename=f"effects_preview.{OUTPUT_EXTENSION}"),
+            caption="👀 Превью эффектов (двойная спираль — с негативом этого же фото)"
         )
         
+        # A fresh text message: the effect handlers edit it in place
         await callback.message.delete()
-        
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
-        await state.clear()
+        data = await state.update_data(previewed=True)
+        await bot.send_message(
+            user_id,
+            "Выберите тип обработки:",
+            reply_markup=_effects_keyboard(numbered=True, preview=False, output=data.get("output", "photo"))
+        )
     
+    except RenderTimeout:
+        await callback.message.edit_text("❌ Обработка заняла слишком много времени. Попробуйте еще раз.")
+        await state.clear()
     except Exception as e:
-        logger.error(f"Error in process_pentagon_grid: {e}")
-        await callback.message.edit_text("❌ Ошибка при обработке изображения.")
+        logger.error(f"Error in process_effects_preview: {e}")
+        await callback.message.edit_text("❌ Ошибка при подготовке превью.")
         await state.clear()
 
 
@@ -360,48 +598,42 @@ async def process_double_spiral(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(ImageProcessingState.waiting_for_second_image, F.photo)
+@fair_job("light")
 async def receive_second_image(message: Message, state: FSMContext):
     """Receive second image for double spiral effect"""
     try:
         await message.answer("⏳ Обработка изображений...")
         
-        # Download the second photo
         photo = message.photo[-1]
-        file_info = await message.bot.get_file(photo.file_id)
-        
-        temp_dir = "./downloads"
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_file_2 = os.path.join(temp_dir, f"temp_image_2_{message.from_user.id}.jpg")
-        
-        await message.bot.download_file(file_info.file_path, temp_file_2)
-        
         data = await state.get_data()
-        image_path_1 = data.get("image_path")
-        
-        result_image = create_double_spiral_image(
-            image_path_1,
-            image_path_2=temp_file_2,
-            spiral_thickness=2,
-            spiral_turns=50,
-            size=300,
-            n_shades=16
-        )
-        
-        image_bytes = save_image_to_bytes(result_image)
-        
-        await message.bot.send_photo(
-            message.from_user.id,
-            photo=BufferedInputFile(image_bytes, filename="processed_image.png"),
-            caption="✅ Двойная спираль завершена!"
-        )
-        
-        if os.path.exists(image_path_1):
-            os.remove(image_path_1)
-        if os.path.exists(temp_file_2):
-            os.remove(temp_file_2)
-        
+        params, mode = _render_params(data, EFFECT_PARAMS["double_spiral"])
+        cache_key = _cache_key(f"{data.get('file_unique_id')}+{photo.file_unique_id}", "double_spiral", params, mode)
+        caption = "✅ Двойная спираль завершена!"
+        
+        kind = "photo" if mode == "image" else "document"
+        if not await _send_cached_result(message.bot, message.from_user.id, cache_key, caption, kind):
+            image_bytes_1 = photo_store.get(message.from_user.id)
+            if image_bytes_1 is None:
+                await message.answer("⌛ Первое изображение устарело. Начните заново: /phone_converter")
+                await state.clear()
+                return
+            
+            # Download the second photo into memory
+            with observe_stage("download") as observed:
+                buffer = await message.bot.download(photo)
+                image_bytes_2 = buffer.getvalue()
+                observed.set(bytes=len(image_bytes_2))
+            
+            result_bytes = await render_pool.render("double_spiral", [image_bytes_1, image_bytes_2], mode=mode, **params)
+            await _send_rendered_result(message.bot, message.from_user.id, cache_key, caption,
+                                        _result_file(result_bytes, mode), kind)
+        
+        photo_store.discard(message.from_user.id)
         await state.clear()
     
+    except RenderTimeout:
+        await message.answer("❌ Обработка заняла слишком много времени. Попробуйте еще раз.")
+        await state.clear()
     except Exception as e:
         logger.error(f"Error in receive_second_image: {e}")
         await message.answer("❌ Ошибка при обработке второй спирали.")
@@ -411,7 +643,7 @@ async def receive_second_image(message: Message, state: FSMContext):
 @router.message(F.text, ImageProcessingState.waiting_for_image)
 async def handle_text_instead_of_image(message: Message):
     """Handle cases where user sends text instead of image"""
-    await message.answer("Пожалуйста, отправьте изображение для обработки.")
+    await message.answer("Пожалуйста, отправьте изображение или видео для обработки.")
 
 
 @router.message(F.text, ImageProcessingState.waiting_for_second_image)
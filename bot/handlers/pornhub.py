@@ -1,32 +1,36 @@
 import asyncio
 import logging
-import tempfile
-import shutil
 import re
 import json
 from aiogram import types
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
-import yt_dlp
-
-import requests
-from bs4 import BeautifulSoup
 import os
 
 from bot.core.states import PHStates
 from bot.utils.helpers import send_with_retry
+from bot.utils.scheduler import fair_job
+from bot.utils.storage import disk_manager
+from bot.utils.workspace import JobWorkspace
 
 async def cmd_ph_download(message: types.Message, state: FSMContext):
     await message.answer("Отправьте ссылку на Pornhub видео. Я скачаю и отправлю полное видео или ссылку. 🔥")
     await state.set_state(PHStates.waiting_for_link)
 
 
+@fair_job("heavy")
 async def process_ph_link(message: types.Message, state: FSMContext):
+    # Ленивые импорты, чтобы не замедлять холодный старт
+    import yt_dlp
+    import requests
+    from bs4 import BeautifulSoup
+
     bot = message.bot
     await message.answer("Получил ссылку, скачиваю полностью... 📥")
     link = message.text
     chat_id = message.chat.id
-    temp_dir = tempfile.mkdtemp()
+    workspace = JobWorkspace("ph")
+    temp_dir = workspace.dir
     video_path = None
     method_used = ""
 
@@ -105,6 +109,7 @@ async def process_ph_link(message: types.Message, state: FSMContext):
             await bot.send_message(chat_id,
                                    "Не удалось скачать ни одним методом после попыток. Попробуй другую ссылку. ❌")
             return
+        disk_manager.add(video_path)
 
         # Отправляем полное видео
         await send_with_retry(
@@ -120,8 +125,7 @@ async def process_ph_link(message: types.Message, state: FSMContext):
         logging.error(f"Error processing PH link: {e}")
         await bot.send_message(chat_id, "Общая ошибка при скачивании/обработке. ❌")
     finally:
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        await workspace.cleanup()
         await state.clear()
 
 
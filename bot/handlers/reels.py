@@ -3,25 +3,30 @@ import shlex
 from aiogram import types
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
-from shazamio import Shazam
-import yt_dlp
 import os
 
 from bot.core.states import ReelsStates
-from bot.utils.helpers import cleanup_files, download_with_retry, send_with_retry
+from bot.utils.helpers import download_with_retry, send_with_retry
 from bot.utils.processing import run_ffmpeg_command
+from bot.utils.metrics import observe_stage
+from bot.utils.scheduler import fair_job
+from bot.utils.storage import disk_manager
+from bot.utils.workspace import JobWorkspace
 
 async def cmd_reels_download(message: types.Message, state: FSMContext):
     await message.answer("Отправьте ссылку на Instagram Reel. 📸")
     await state.set_state(ReelsStates.waiting_for_link)
 
+@fair_job("heavy")
 async def process_reels_link(message: types.Message, state: FSMContext):
+    import yt_dlp  # Ленивый импорт, чтобы не замедлять холодный старт
     bot = message.bot
     await message.answer("Получил ссылку, скачиваю полностью... 🚀")
     link = message.text
     chat_id = message.chat.id
-    video_path = f"./downloads/{chat_id}_reels_video.mp4"
-    audio_path = f"./downloads/{chat_id}_reels_audio.mp3"
+    workspace = JobWorkspace("reels")
+    video_path = workspace.path("video.mp4")
+    audio_path = workspace.scratch("audio.mp3")
 
     try:
         # Скачивание с retry
@@ -115,11 +120,14 @@ async def process_reels_link(message: types.Message, state: FSMContext):
                 # Продолжаем без Shazam, чтобы отправить хотя бы видео
                 track_info = "Не удалось извлечь аудио для Shazam. 🤷‍♀️"
             else:
+                disk_manager.add(audio_path)
                 # Shazam audio
                 track_info = "Не удалось распознать трек. 🤷‍♀️"
                 try:
+                    from shazamio import Shazam  # Ленивый импорт: shazamio тяжёлый и нужен не при каждом старте
                     shazam = Shazam()
-                    out = await shazam.recognize(audio_path)
+                    with observe_stage("recognize"):
+                        out = await shazam.recognize(audio_path)
                     if out and 'track' in out:
                         title = out['track'].get('title', 'N/A')
                         subtitle = out['track'].get('subtitle', 'N/A')
@@ -141,7 +149,7 @@ async def process_reels_link(message: types.Message, state: FSMContext):
         logging.error(f"Error processing Reels link: {e}")
         await bot.send_message(chat_id, "Ошибка при скачивании или обработке Instagram Reel. ❌")
     finally:
-        await cleanup_files(video_path, audio_path, delay=1)
+        await workspace.cleanup()
         await state.clear()
 
 def register_reels_handlers(dp):
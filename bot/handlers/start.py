@@ -1,6 +1,8 @@
-from aiogram import types
+from aiogram import Router, types
 from aiogram.filters.command import Command
 
+from bot.utils.media_group import media_groups
+
 async def cmd_start(message: types.Message):
     start_message = (
         "Привет! 👋 Я многофункциональный бот by @SS0100100. Вот что я умею:\n\n"
@@ -20,4 +22,23 @@ async def cmd_start(message: types.Message):
     await message.answer(start_message)
 
 def register_start_handlers(dp):
-    dp.message.register(cmd_start, Command("start"))
\ No newline at end of file
+    dp.message.register(cmd_start, Command("start"))
+
+
+async def unhandled_message(message: types.Message):
+    # Сюда попадает и ответ на шаг диалога, начатого до перезапуска бота: состояние не пережило процесс
+    if message.media_group_id and await media_groups.collect((message.from_user.id, message.media_group_id),
+                                                             message) is None:
+        return  # На альбом отвечаем один раз
+    await message.answer("Не понял, что с этим сделать 🤔 Если ты начинал какую-то команду, "
+                         "начни её заново. Все команды — в /start.")
+
+async def unhandled_callback(callback: types.CallbackQuery):
+    await callback.answer("Эта кнопка уже не работает, начни заново 🙏", show_alert=True)
+
+def register_fallback_handlers(dp):
+    # Отдельный роутер, подключённый последним: срабатывает, только если не подошёл ни один другой хэндлер
+    router = Router()
+    router.message.register(unhandled_message)
+    router.callback_query.register(unhandled_callback)
+    dp.include_router(router)
@@ -4,13 +4,15 @@ import shlex
 from aiogram import types
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
-from shazamio import Shazam
-import yt_dlp
 import os
 
 from bot.core.states import TikTokStates
-from bot.utils.helpers import cleanup_files, download_with_retry, send_with_retry
+from bot.utils.helpers import download_with_retry, send_with_retry
 from bot.utils.processing import run_ffmpeg_command
+from bot.utils.metrics import observe_stage
+from bot.utils.scheduler import fair_job
+from bot.utils.storage import disk_manager
+from bot.utils.workspace import JobWorkspace
 
 # --- TikTok Downloader Feature ---
 async def cmd_tiktok_download(message: types.Message, state: FSMContext):
@@ -18,15 +20,18 @@ async def cmd_tiktok_download(message: types.Message, state: FSMContext):
     await message.answer("Отправьте ссылку на TikTok видео. 🎶")
     await state.set_state(TikTokStates.waiting_for_link)
 
+@fair_job("heavy")
 async def process_tiktok_link(message: types.Message, state: FSMContext):
     """Processes the TikTok link provided by the user."""
+    import yt_dlp  # Ленивый импорт, чтобы не замедлять холодный старт
     bot = message.bot
     await message.answer("Получил ссылку, скачиваю полностью... 🚀")
     link = message.text
     chat_id = message.chat.id
-    # Используем tempfile или фиксированную папку
-    video_path = f"./downloads/{chat_id}_tiktok_video.mp4"
-    audio_path = f"./downloads/{chat_id}_tiktok_audio.mp3"
+    # У каждой задачи своя папка, поэтому параллельные запросы из одного чата не перезаписывают файлы
+    workspace = JobWorkspace("tiktok")
+    video_path = workspace.path("video.mp4")
+    audio_path = workspace.scratch("audio.mp3")
 
     try:
         # Скачивание с retry
@@ -50,12 +55,15 @@ async def process_tiktok_link(message: types.Message, state: FSMContext):
             logging.error(f"ffmpeg audio extraction error: {stderr.decode()}")
             await bot.send_message(chat_id, "Ошибка при извлечении аудио. 😔")
             return
+        disk_manager.add(audio_path)
 
         # Shazam audio
         track_info = "Не удалось распознать трек. 🤷‍♀️"
         try:
+            from shazamio import Shazam  # Ленивый импорт: shazamio тяжёлый и нужен не при каждом старте
             shazam = Shazam()
-            out = await shazam.recognize(audio_path)
+            with observe_stage("recognize"):
+                out = await shazam.recognize(audio_path)
             if out and 'track' in out:
                 title = out['track'].get('title', 'N/A')
                 subtitle = out['track'].get('subtitle', 'N/A')
@@ -75,7 +83,7 @@ async def process_tiktok_link(message: types.Message, state: FSMContext):
         logging.error(f"Error processing TikTok link: {e}")
         await bot.send_message(chat_id, "Ошибка при скачивании или обработке TikTok видео. ❌")
     finally:
-        await cleanup_files(video_path, audio_path, delay=1)
+        await workspace.cleanup()
         await state.clear()
 
 def register_tiktok_handlers(dp):
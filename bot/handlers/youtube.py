@@ -1,56 +1,90 @@
-import logging
-import re
-from aiogram import types
-from aiogram.filters.command import Command
-from aiogram.fsm.context import FSMContext
-import yt_dlp
-import os
-
-from bot.core.states import YouTubeStates
-from bot.utils.helpers import cleanup_files, download_with_retry, send_with_retry
-
-async def cmd_youtube_download(message: types.Message, command: Command, state: FSMContext):
-    quality = command.args if command.args else "480"
-    await state.update_data(quality=quality)
-    await message.answer(f"Отправьте ссылку на YouTube видео. Я скачаю его в качестве {quality}p. 🌟")
-    await state.set_state(YouTubeStates.waiting_for_link)
-
-async def process_youtube_link(message: types.Message, state: FSMContext):
-    """Processes the YouTube link provided by the user."""
-    bot = message.bot
-    await message.answer("Получил ссылку, скачиваю полностью... 📥")
-    link = message.text
-    chat_id = message.chat.id
-    user_data = await state.get_data()
-    quality = user_data.get("quality", "480")
-    video_path = f"./downloads/{chat_id}_youtube_video.mp4"
-
-    try:
-        ydl_opts = {
-            'format': f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
-            'outtmpl': video_path,
-            'noplaylist': True,
-        }
-        downloaded_path = await download_with_retry(yt_dlp, ydl_opts, link)
-        if not downloaded_path:
-            await bot.send_message(chat_id, "Не удалось скачать видео после попыток. 😔")
-            return
-        video_path = downloaded_path
-
-        await send_with_retry(
-            bot.send_video,
-            chat_id,
-            video=types.FSInputFile(video_path),
-            caption=f"Ваше YouTube видео в качестве {quality}p. 🎉"
-        )
-
-    except Exception as e:
-        logging.error(f"Error processing YouTube link: {e}")
-        await bot.send_message(chat_id, "Ошибка при скачивании YouTube видео. ❌")
-    finally:
-        await cleanup_files(video_path, delay=1)
-        await state.clear()
-
-def register_youtube_handlers(dp):
-    dp.message.register(cmd_youtube_download, Command(re.compile(r"yt_v_d(\d*)")))
-    dp.message.register(process_youtube_link, YouTubeStates.waiting_for_link)
\ No newline at end of file
+import logging
+import re
+from aiogram import types
+from aiogram.filters.command import Command
+from aiogram.fsm.context import FSMContext
+import os
+
+from bot.core.config import MAX_VIDEO_SIZE_BYTES, YOUTUBE_MIN_COMPRESSED_KBPS
+from bot.core.states import YouTubeStates
+from bot.utils.helpers import download_with_retry, extract_info, select_video_format, send_with_retry
+from bot.utils.processing import compress_video_if_needed
+from bot.utils.scheduler import fair_job
+from bot.utils.workspace import JobWorkspace
+
+async def cmd_youtube_download(message: types.Message, command: Command, state: FSMContext):
+    quality = command.args if command.args else "480"
+    await state.update_data(quality=quality)
+    await message.answer(f"Отправьте ссылку на YouTube видео. Я скачаю его в качестве {quality}p. 🌟")
+    await state.set_state(YouTubeStates.waiting_for_link)
+
+@fair_job("heavy")
+async def process_youtube_link(message: types.Message, state: FSMContext):
+    """Processes the YouTube link provided by the user."""
+    import yt_dlp  # Ленивый импорт, чтобы не замедлять холодный старт
+    bot = message.bot
+    await message.answer("Получил ссылку, скачиваю полностью... 📥")
+    link = message.text
+    chat_id = message.chat.id
+    user_data = await state.get_data()
+    quality = user_data.get("quality", "480")
+    workspace = JobWorkspace("youtube")
+    video_path = workspace.path("video.mp4")
+
+    try:
+        # Формат выбирается до скачивания по оценке размера, чтобы не качать то, что Telegram не примет
+        video_format = f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]'
+        info = await extract_info(yt_dlp, {'noplaylist': True}, link)
+        max_height = int(quality) if quality.isdigit() else 480
+        selected = select_video_format(info, max_height, MAX_VIDEO_SIZE_BYTES) if info else None
+        if selected:
+            format_id, estimated_size, fits = selected
+            logging.info(f"YouTube: формат {format_id}, оценка {estimated_size / 1024 / 1024:.1f} МБ")
+            # Если выбранный формат станет недоступен к моменту скачивания, yt-dlp возьмёт запасной
+            video_format = f"{format_id}/best[ext=mp4]/best"
+            if not fits:
+                duration = info.get('duration') or 0
+                # Для такого битрейта сжатие уже не поможет — не тратим трафик на скачивание
+                if duration and MAX_VIDEO_SIZE_BYTES * 8 / 1000 / duration < YOUTUBE_MIN_COMPRESSED_KBPS:
+                    await bot.send_message(chat_id, "Видео слишком длинное: даже сжатым оно не пройдёт "
+                                                    "по лимиту Telegram. 😔")
+                    return
+                await bot.send_message(chat_id, f"В {quality}p видео больше лимита Telegram, "
+                                                "скачаю самый лёгкий вариант и сожму. 🗜")
+
+        ydl_opts = {
+            'format': video_format,
+            'outtmpl': video_path,
+            'noplaylist': True,
+        }
+        downloaded_path = await download_with_retry(yt_dlp, ydl_opts, link, info=info)
+        if not downloaded_path:
+            await bot.send_message(chat_id, "Не удалось скачать видео после попыток. 😔")
+            return
+        video_path = downloaded_path
+
+        # Сжатие — только если ни один формат не поместился или оценка размера ошиблась
+        if os.path.getsize(video_path) > MAX_VIDEO_SIZE_BYTES:
+            compressed_path = workspace.path("compressed.mp4")
+            if not await compress_video_if_needed(video_path, compressed_path):
+                await bot.send_message(chat_id, "Не удалось сжать видео до лимита Telegram. 😔")
+                return
+            video_path = compressed_path
+
+        await send_with_retry(
+            bot.send_video,
+            chat_id,
+            video=types.FSInputFile(video_path),
+            caption=f"Ваше YouTube видео в качестве {quality}p. 🎉"
+        )
+
+    except Exception as e:
+        logging.error(f"Error processing YouTube link: {e}")
+        await bot.send_message(chat_id, "Ошибка при скачивании YouTube видео. ❌")
+    finally:
+        await workspace.cleanup()
+        await state.clear()
+
+def register_youtube_handlers(dp):
+    dp.message.register(cmd_youtube_download, Command(re.compile(r"yt_v_d(\d*)")))
+    dp.message.register(process_youtube_link, YouTubeStates.waiting_for_link)
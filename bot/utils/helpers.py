@@ -1,12 +1,14 @@
 import asyncio
+import copy
 import logging
 import os
 import shutil
 
-import yt_dlp
-
 
 from bot.core.config import MIN_FILE_SIZE_BYTES, RETRY_DOWNLOAD_ATTEMPTS, RETRY_SEND_ATTEMPTS
+from bot.utils.metrics import observe_stage, bytes_in_total, bytes_out_total
+from bot.utils.storage import disk_manager
+from bot.utils.tracing import span
 
 async def cleanup_files(*filenames, delay=0):
     """Безопасно удаляет указанные временные файлы с опциональной задержкой."""
@@ -57,29 +59,117 @@ async def validate_audio_file(audio_path: str, min_duration=1.0) -> bool:
     return True
 
 
-async def download_with_retry(ydl_class, ydl_opts, link, max_attempts=RETRY_DOWNLOAD_ATTEMPTS):
-    """Скачивает с retry и валидацией."""
+def _ydl_download(ydl_class, ydl_opts, link, info=None):
+    """
+    Синхронно скачивает ссылку через yt-dlp и возвращает путь к файлу. Если info уже
+    получена через extract_info(), метаданные повторно не запрашиваются.
+    """
+    with ydl_class.YoutubeDL(ydl_opts) as ydl:
+        if info is None:
+            info = ydl.extract_info(link, download=True)
+        else:
+            # process_ie_result дополняет info, а при повторной попытке она нужна нетронутой
+            info = ydl.process_ie_result(copy.deepcopy(info), download=True)
+        return ydl.prepare_filename(info)
+
+
+def _ydl_extract_info(ydl_class, ydl_opts, link):
+    """Синхронно получает информацию о ролике через yt-dlp, ничего не скачивая."""
+    with ydl_class.YoutubeDL({**ydl_opts, 'skip_download': True}) as ydl:
+        return ydl.extract_info(link, download=False)
+
+
+async def extract_info(ydl_class, ydl_opts, link) -> dict | None:
+    """Информация о ролике (форматы, длительность) до скачивания; None, если yt-dlp не смог её получить."""
+    try:
+        with observe_stage("extract"):
+            return await asyncio.to_thread(_ydl_extract_info, ydl_class, ydl_opts, link)
+    except Exception as e:
+        logging.warning(f"Не удалось получить информацию о ролике: {e}")
+        return None
+
+
+def estimate_format_size(fmt: dict, duration) -> float | None:
+    """Оценка размера формата yt-dlp в байтах: filesize, filesize_approx или битрейт tbr (кбит/с) × длительность."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    if fmt.get('tbr') and duration:
+        return fmt['tbr'] * 1000 / 8 * duration
+    return None
+
+
+def select_video_format(info: dict, max_height: int, max_bytes: int) -> tuple[str, float, bool] | None:
+    """
+    Выбирает формат по информации от yt-dlp до скачивания: mp4-видео не выше max_height
+    с m4a-аудио или готовый mp4 с тем и другим. Берётся лучший по качеству из тех, чья
+    оценка размера с запасом помещается в max_bytes; если не помещается ни один —
+    самый маленький, его придётся сжимать. Возвращает (format для yt-dlp, оценка
+    размера, помещается ли) или None, если размеры по info не оценить.
+    """
+    duration = info.get('duration')
+    formats = [f for f in info.get('formats') or [] if f.get('format_id')]
+    # Без высоты нельзя проверить max_height — такие форматы не берём
+    has_video = lambda f: f.get('vcodec') not in (None, 'none') and 0 < (f.get('height') or 0) <= max_height
+    has_audio = lambda f: f.get('acodec') not in (None, 'none')
+
+    candidates = []  # (качество: высота и битрейты, оценка размера, format)
+    audios = [f for f in formats if f.get('ext') == 'm4a' and f.get('vcodec') == 'none' and has_audio(f)]
+    for video in formats:
+        if video.get('ext') != 'mp4' or not has_video(video):
+            continue
+        video_size = estimate_format_size(video, duration)
+        if not video_size:
+            continue
+        quality = (video.get('height') or 0, video.get('tbr') or 0)
+        if has_audio(video):
+            candidates.append((quality + (0,), video_size, video['format_id']))
+            continue
+        for audio in audios:
+            audio_size = estimate_format_size(audio, duration)
+            if audio_size:
+                candidates.append((quality + (audio.get('tbr') or 0,), video_size + audio_size,
+                                   f"{video['format_id']}+{audio['format_id']}"))
+    if not candidates:
+        return None
+
+    # Запас на контейнер при склейке и неточность filesize_approx
+    fitting = [candidate for candidate in candidates if candidate[1] <= max_bytes * 0.95]
+    if fitting:
+        _, size, format_id = max(fitting, key=lambda candidate: candidate[0])
+    else:
+        _, size, format_id = min(candidates, key=lambda candidate: candidate[1])
+    return format_id, size, bool(fitting)
+
+
+async def download_with_retry(ydl_class, ydl_opts, link, max_attempts=RETRY_DOWNLOAD_ATTEMPTS, info=None):
+    """Скачивает с retry и валидацией; info — результат extract_info(), чтобы не запрашивать метаданные снова."""
+    # Не даём yt-dlp скачать файл больше, чем осталось в бюджете папки загрузок
+    ydl_opts = {'max_filesize': await asyncio.to_thread(disk_manager.available_bytes), **ydl_opts}
     for attempt in range(1, max_attempts + 1):
         # Инициализируем путь к файлу для корректной очистки, если произойдет сбой
         downloaded_file = None
         try:
-            with ydl_class.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(link, download=True)
-
-                downloaded_file = ydl.prepare_filename(info)
-
-                if not isinstance(downloaded_file, str):
-                    raise TypeError(f"ydl.prepare_filename вернул некорректный тип ({type(downloaded_file)}).")
-
-                # 3. Валидация
-                if not os.path.exists(downloaded_file):
-                    raise Exception(f"Файл {downloaded_file} не найден после скачивания.")
-
-                if await validate_video_file(downloaded_file):
-                    return downloaded_file
-                else:
-                    logging.warning(f"Попытка {attempt}: файл не валиден, удаляю")
-                    await cleanup_files(downloaded_file)  # Удаление невалидного файла
+            # yt-dlp блокирующий, поэтому скачиваем в отдельном потоке, чтобы не останавливать event loop
+            with observe_stage("download", attempt=attempt) as observed:
+                downloaded_file = await asyncio.to_thread(_ydl_download, ydl_class, ydl_opts, link, info)
+                if isinstance(downloaded_file, str) and os.path.exists(downloaded_file):
+                    observed.set(bytes=os.path.getsize(downloaded_file))
+
+            if not isinstance(downloaded_file, str):
+                raise TypeError(f"ydl.prepare_filename вернул некорректный тип ({type(downloaded_file)}).")
+
+            # 3. Валидация
+            if not os.path.exists(downloaded_file):
+                raise Exception(f"Файл {downloaded_file} не найден после скачивания.")
+
+            if await validate_video_file(downloaded_file):
+                bytes_in_total.inc(os.path.getsize(downloaded_file), stage="download")
+                disk_manager.add(downloaded_file)
+                return downloaded_file
+            else:
+                logging.warning(f"Попытка {attempt}: файл не валиден, удаляю")
+                await cleanup_files(downloaded_file)  # Удаление невалидного файла
 
         except Exception as e:
             # Логгирование ошибки и переход к следующей попытке
@@ -90,18 +180,33 @@ async def download_with_retry(ydl_class, ydl_opts, link, max_attempts=RETRY_DOWN
                 await cleanup_files(downloaded_file)
 
         if attempt < max_attempts:
-            await asyncio.sleep(5 * attempt)
+            with span("retry_wait", attempt=attempt):
+                await asyncio.sleep(5 * attempt)
 
     return None
 
 
+def _payload_size(value) -> int:
+    """Размер отправляемого файла: FSInputFile по пути, BufferedInputFile по данным."""
+    path = getattr(value, "path", None)
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    data = getattr(value, "data", None)
+    return len(data) if isinstance(data, (bytes, bytearray)) else 0
+
+
 async def send_with_retry(send_func, *args, max_attempts=RETRY_SEND_ATTEMPTS, **kwargs):
     """Отправляет с retry."""
     for attempt in range(1, max_attempts + 1):
         try:
-            return await send_func(*args, **kwargs)
+            payload_size = sum(_payload_size(value) for value in kwargs.values())
+            with observe_stage("upload", attempt=attempt, bytes=payload_size, method=getattr(send_func, "__name__", "")):
+                result = await send_func(*args, **kwargs)
+            bytes_out_total.inc(payload_size, stage="upload")
+            return result
         except Exception as e:
             logging.warning(f"Попытка {attempt} отправки провалилась: {e}")
             if attempt < max_attempts:
-                await asyncio.sleep(3 * attempt)
+                with span("retry_wait", attempt=attempt):
+                    await asyncio.sleep(3 * attempt)
     raise Exception("Не удалось отправить после всех попыток")
\ No newline at end of file
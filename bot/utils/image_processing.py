@@ -3,11 +3,16 @@ Image processing utilities for creating spiral and other artistic effects.
 Translated from R code at: https://github.com/cj-holmes/photos-on-spirals
 """
 
+import copy
+import functools
+import subprocess
 import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFont
 import io
 import logging
-from scipy import ndimage
+
+from bot.core.config import (DITHER, GEOMETRY_CACHE_ITEMS, MAX_IMAGE_PIXELS, OUTPUT_COMPRESS_LEVEL, OUTPUT_FORMAT,
+                             OUTPUT_SIZE_TARGET_BYTES, RENDER_TILE_SIZE, TONE_MAPPING)
 
 logger = logging.getLogger(__name__)
 
@@ -39,42 +44,596 @@ def spiral_coords(xo, yo, n_points, n_turns, r0, r1, offset_angle):
     return list(zip(x, y))
 
 
-def process_image_to_grayscale(image_path, size=300, n_shades=16, invert=False):
+def open_image(source, size):
+    """
+    Open an image for decoding close to a target size.
+
+    JPEGs are put in draft mode, so the decoder scales by 1/2, 1/4 or 1/8 in the DCT
+    and decodes only the luminance: a 4K photo never exists at full resolution.
+    Only the header is read here, so oversized images are rejected before decoding.
+
+    Args:
+        source: Path, file object or PIL Image
+        size: Smallest side the decoded image must keep
+
+    Returns:
+        PIL Image (not yet loaded, unless a loaded Image was passed)
+
+    Raises:
+        Image.DecompressionBombError: If the image has more than MAX_IMAGE_PIXELS pixels
+    """
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise Image.DecompressionBombError(
+            f"Image of {img.width}x{img.height} exceeds the limit of {MAX_IMAGE_PIXELS} pixels"
+        )
+    if img.format == 'JPEG':
+        img.draft('L', (size, size))
+    return img
+
+
+def _bayer_thresholds(order):
+    """Ordered dithering thresholds in (0, 1): the 2**order x 2**order Bayer matrix."""
+    matrix = np.zeros((1, 1))
+    for _ in range(order):
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix + 0.5) / matrix.size
+
+
+BAYER_THRESHOLDS = _bayer_thresholds(3)
+TONE_MAPPINGS = ("even", "equalize")
+DITHERS = ("none", "floyd-steinberg", "ordered")
+
+
+@functools.lru_cache(maxsize=32)
+def shade_levels(n_shades):
+    """The n_shades gray levels spread evenly over 0..255, as a uint8 array."""
+    return np.round(np.arange(n_shades) * (255 / max(n_shades - 1, 1))).astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=32)
+def shade_lut(n_shades):
+    """The nearest of shade_levels(n_shades) for every gray level 0..255."""
+    step = 255 / max(n_shades - 1, 1)
+    return shade_levels(n_shades).take(np.round(np.arange(256) / step).astype(np.intp))
+
+
+def equalization_curve(gray_array):
+    """
+    Tone curve that spreads the gray levels of an image evenly over 0..255.
+
+    Each level goes to the middle of its span in the cumulative histogram, so after
+    even quantization every shade covers about the same share of the pixels.
+    """
+    histogram = np.bincount(gray_array.ravel(), minlength=256)
+    cdf = np.cumsum(histogram) - histogram / 2
+    return np.round(cdf * (255 / gray_array.size)).astype(np.uint8)
+
+
+def quantize_tones(gray_array, n_shades=16, tones=TONE_MAPPING, dither=DITHER):
+    """
+    Reduce a luminance array to n_shades gray levels.
+
+    Without dithering this is a single lookup table. Floyd-Steinberg diffuses the
+    rounding error to the neighbours (done by PIL against a fixed gray palette, not
+    with a palette search), ordered dithering adds a Bayer threshold pattern; both
+    keep the local mean brightness that the effects average over.
+
+    Args:
+        gray_array: 2D uint8 luminance array
+        n_shades: Number of gray levels in the result
+        tones: 'even' for levels evenly spaced over 0..255, 'equalize' to equalize
+            the histogram first
+        dither: 'none', 'floyd-steinberg' or 'ordered'
+
+    Returns:
+        2D uint8 luminance array with values from shade_levels(n_shades)
+    """
+    if tones == 'equalize':
+        gray_array = equalization_curve(gray_array).take(gray_array)
+    elif tones != 'even':
+        raise ValueError(f"Unknown tone mapping {tones!r}, expected one of {TONE_MAPPINGS}")
+
+    levels = shade_levels(n_shades)
+    if dither == 'none':
+        return shade_lut(n_shades).take(gray_array)
+    if dither == 'ordered':
+        height, width = gray_array.shape
+        thresholds = np.tile(BAYER_THRESHOLDS, (-(-height // 8), -(-width // 8)))[:height, :width]
+        indices = gray_array * (max(n_shades - 1, 1) / 255) + thresholds
+        return levels.take(np.minimum(indices.astype(np.intp), n_shades - 1))
+    if dither == 'floyd-steinberg':
+        palette = Image.new('P', (1, 1))
+        palette.putpalette(np.repeat(levels, 3).tolist())
+        # PIL dithers against a given palette only from RGB; from L it would copy the values
+        indices = Image.fromarray(gray_array).convert('RGB').quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+        return levels.take(np.asarray(indices))
+    raise ValueError(f"Unknown dither {dither!r}, expected one of {DITHERS}")
+
+
+def process_image_to_grayscale(image_path, size=300, n_shades=16, invert=False, tones=TONE_MAPPING, dither=DITHER):
     """
     Process image: resize, crop to square, convert to grayscale, quantize, and flip.
     
     Args:
-        image_path: Path to image file or PIL Image object
+        image_path: Path to image file, file object or PIL Image object
         size: Size of the square output (default 300)
         n_shades: Number of gray shades (default 16)
         invert: Whether to invert the image (default False)
+        tones: Tone mapping before quantization, see quantize_tones
+        dither: Dithering when quantizing, see quantize_tones
     
     Returns:
-        PIL Image object (grayscale, quantized) and numpy array
+        PIL Image object (grayscale, quantized) and numpy array of its luminance
     """
-    if isinstance(image_path, Image.Image):
-        img = image_path
-    else:
-        img = Image.open(image_path)
-    
-    # Resize image
-    img = img.resize((size, size), Image.Resampling.LANCZOS)
+    img = open_image(image_path, size)
     
-    # Convert to grayscale
+    # Convert to grayscale first, so resampling works on a single channel
     img = img.convert('L')
     
-    # Quantize to reduce number of shades
-    img = img.quantize(colors=n_shades)
+    # Resize image; formats without draft mode are first shrunk by an integer factor with Image.reduce
+    img = img.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
     
     # Flip vertically
     img = img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
     
+    # Quantize to reduce number of shades
+    gray_array = quantize_tones(np.asarray(img), n_shades, tones, dither)
+    
     # Invert if needed
     if invert:
-        img = Image.eval(img, lambda x: 255 - x)
+        gray_array = 255 - gray_array
     
-    gray_array = np.array(img)
-    return img, gray_array
+    return Image.fromarray(gray_array), gray_array
+
+
+class BilinearSampler:
+    """
+    Bilinear interpolation of 2D arrays of one shape at fixed fractional points.
+
+    Neighbour indices and weights depend only on the points, so they are computed
+    once; every array sampled afterwards costs four gathers and three lerps.
+    """
+
+    def __init__(self, shape, x, y):
+        """
+        Args:
+            shape: (height, width) of the arrays to sample (rows are y)
+            x, y: Arrays of coordinates in pixel space, pixel centers at +0.5
+        """
+        h, w = shape
+        self.shape = tuple(shape)
+        # One extra row and column in the sampled array so the +1 neighbours never need bounds checks
+        stride = w + 1
+        x = np.clip(np.asarray(x, dtype=np.float32) - 0.5, 0, w - 1)
+        y = np.clip(np.asarray(y, dtype=np.float32) - 0.5, 0, h - 1)
+        x0 = x.astype(np.intp)
+        y0 = y.astype(np.intp)
+        self.fx = x - x0
+        self.fy = y - y0
+        self.top = y0 * stride + x0
+        self.bottom = self.top + stride
+
+    def __call__(self, array):
+        """float32 array of interpolated values, one per point."""
+        values = np.pad(array.astype(np.float32, copy=False), ((0, 1), (0, 1)), mode='edge').ravel()
+        top_left = values.take(self.top)
+        top = top_left + (values.take(self.top + 1) - top_left) * self.fx
+        bottom_left = values.take(self.bottom)
+        bottom = bottom_left + (values.take(self.bottom + 1) - bottom_left) * self.fx
+        return top + (bottom - top) * self.fy
+
+
+def sample_bilinear(array, x, y):
+    """
+    Sample a 2D array at fractional pixel coordinates with bilinear interpolation.
+
+    Args:
+        array: 2D numpy array (rows are y)
+        x, y: Arrays of coordinates in pixel space, pixel centers at +0.5
+
+    Returns:
+        float32 array of interpolated values, same shape as x
+    """
+    return BilinearSampler(array.shape, x, y)(array)
+
+
+class SpiralGeometry:
+    """
+    Pixel-space description of an Archimedean spiral for distance-field rendering.
+
+    The spiral is sampled at roughly one point per pixel of its outer turn. For
+    every pixel the two nearest arms along the radius (inward and outward) are
+    found analytically: they are the same angular bin one turn apart, so a single
+    sample index plus the distances to both arms is stored. A render then needs
+    one brightness sample per spiral point and two gathers per pixel instead of a
+    draw call per segment.
+    """
+
+    # Pixels per row band when building the per-pixel tables
+    _BAND_PIXELS = 1 << 16
+
+    def __init__(self, size, n_turns, r0, r1, offset_angle=0, window=None):
+        """
+        Args:
+            size: Side of the square canvas in pixels
+            n_turns: Number of turns in spiral
+            r0: Spiral inner radius (fraction of size)
+            r1: Spiral outer radius (fraction of size)
+            offset_angle: Offset angle for start of spiral (in degrees)
+            window: (left, top, width, height) part of the canvas to build the per-pixel
+                tables for (default: the whole canvas); see tile()
+        """
+        self.size = size
+        self._center = size / 2
+        self._r0 = r0 * size
+        r1_px = r1 * size
+        self._offset_rad = offset_angle * np.pi / 180
+        self._b = (r1_px - self._r0) / (2 * np.pi * n_turns)
+        self.arm_step = max(2 * np.pi * self._b, 1e-6)
+        two_pi = np.float32(2 * np.pi)
+
+        # Samples along the spiral, one per angular bin
+        self.per_turn = max(64, int(np.ceil(2 * np.pi * max(r1_px, self._r0))))
+        self.n_samples = int(self.per_turn * n_turns)
+        self.turn_count = int(np.ceil(n_turns))
+        phi = (np.arange(self.n_samples, dtype=np.float32) + 0.5) * (two_pi / self.per_turn)
+        radius = np.float32(self._r0) + np.float32(self._b) * phi
+        self.sample_x = self._center + radius * np.cos(phi + np.float32(self._offset_rad))
+        self.sample_y = self._center + radius * np.sin(phi + np.float32(self._offset_rad))
+        self._samplers = {}
+
+        self._build_tables(window or (0, 0, size, size))
+
+    def tile(self, window):
+        """The same spiral with per-pixel tables for another (left, top, width, height) window."""
+        tile = copy.copy(self)
+        tile._build_tables(window)
+        return tile
+
+    def sampler(self, shape):
+        """BilinearSampler at the spiral samples for arrays of the given shape, scaled to the canvas."""
+        sampler = self._samplers.get(tuple(shape))
+        if sampler is None:
+            scale = shape[0] / self.size
+            sampler = BilinearSampler(shape, self.sample_x * scale, self.sample_y * scale)
+            # Only whole-canvas geometries are reused; a tiled render's sampler would just hold memory
+            if self.window == (0, 0, self.size, self.size):
+                self._samplers[tuple(shape)] = sampler
+        return sampler
+
+    def _build_tables(self, window):
+        left, top, width, height = window
+        self.window = window
+        two_pi = np.float32(2 * np.pi)
+        offset_rad = np.float32(self._offset_rad)
+
+        # Polar coordinates of every pixel center; angle measured from the spiral start.
+        # Computed in row bands so the float temporaries stay in cache.
+        axis_x = np.arange(left, left + width, dtype=np.float32) + np.float32(0.5 - self._center)
+        axis_y = np.arange(top, top + height, dtype=np.float32) + np.float32(0.5 - self._center)
+        self.index = np.empty((height, width), dtype=np.intp)
+        self.distance_in = np.empty((height, width), dtype=np.float32)
+        self.distance_out = np.empty((height, width), dtype=np.float32)
+        step = np.float32(self.arm_step)
+        bins_per_rad = np.float32(self.per_turn / (2 * np.pi))
+        rows = max(1, self._BAND_PIXELS // max(width, 1))
+        for band_top in range(0, height, rows):
+            band = slice(band_top, band_top + rows)
+            dx, dy = axis_x[None, :], axis_y[band, None]
+            rho = np.hypot(dx, dy)
+            phi0 = np.arctan2(dy, dx)
+            phi0 -= offset_rad
+            phi0 -= np.floor(phi0 / two_pi) * two_pi
+
+            # Fractional turn index of the pixel between arms; clamped so the last arm still reaches outward
+            q = rho
+            q -= np.float32(self._r0)
+            q -= np.float32(self._b) * phi0
+            q /= step
+            turn = np.floor(q)
+            np.clip(turn, -1, self.turn_count - 1, out=turn)
+            distance_in = self.distance_in[band]
+            np.subtract(q, turn, out=distance_in)
+            np.abs(distance_in, out=distance_in)
+            distance_in *= step
+            np.abs(step - distance_in, out=self.distance_out[band])
+
+            # Index into the padded reach table: one turn of sentinels before the samples
+            phi0 *= bins_per_rad
+            angle_bin = phi0.astype(np.intp)
+            np.minimum(angle_bin, self.per_turn - 1, out=angle_bin)
+            index = turn.astype(np.intp)
+            index += 1
+            index *= self.per_turn
+            index += angle_bin
+            self.index[band] = index
+        # Geometries are shared through spiral_geometry(), so the tables must stay as built
+        for table in (self.index, self.distance_in, self.distance_out):
+            table.setflags(write=False)
+
+    def coverage(self, widths):
+        """
+        Anti-aliased ink coverage (0..1, float32 over the window) for per-sample line widths.
+
+        Coverage falls off linearly over one pixel at the stroke edge, which is the
+        box-filtered distance to a line of the given width.
+        """
+        reach = np.full((self.turn_count + 2) * self.per_turn, -1, dtype=np.float32)
+        reach[self.per_turn:self.per_turn + self.n_samples] = 0.5 * widths + 0.5
+        coverage = reach.take(self.index)
+        coverage -= self.distance_in
+        outer = reach.take(self.index + self.per_turn)
+        outer -= self.distance_out
+        np.maximum(coverage, outer, out=coverage)
+        return np.clip(coverage, 0, 1, out=coverage)
+
+    def strokes(self, widths):
+        """
+        Every (pixel, arm) pair with ink, for drawing the spiral incrementally.
+
+        A pixel is inked by at most two samples, of the arms inside and outside it;
+        the maximum of the two coverages is what coverage() returns.
+
+        Returns:
+            (pixels, samples, coverage): flat pixel indices into the window, indices
+            of the spiral samples that ink them and the coverage (0..1) they give
+        """
+        reach = np.full((self.turn_count + 2) * self.per_turn, -1, dtype=np.float32)
+        reach[self.per_turn:self.per_turn + self.n_samples] = 0.5 * widths + 0.5
+        parts = []
+        for shift, distance in ((0, self.distance_in), (self.per_turn, self.distance_out)):
+            index = self.index.ravel() + shift
+            coverage = reach.take(index)
+            coverage -= distance.ravel()
+            # Sentinels have negative reach, so pixels past either end of the line drop out here
+            pixels = np.flatnonzero(coverage > 0)
+            parts.append((pixels, index.take(pixels) - self.per_turn, np.minimum(coverage.take(pixels), 1)))
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    def outline(self, widths, step=3.0, min_per_turn=32):
+        """
+        The line as one closed polygon, for vector output.
+
+        Samples are merged into stretches of about step pixels along the line (at
+        least min_per_turn per turn near the center), each with its average width.
+        The edges are offset radially by half the width, as coverage() measures
+        distance, and the polygon runs out along the outer edge and back along the
+        inner one, so it is filled with the nonzero rule where thick arms overlap.
+
+        Returns:
+            (1, n, 2) array: one ring of vertices in canvas pixels
+        """
+        dphi = 2 * np.pi / self.per_turn
+        phi = (np.arange(self.n_samples) + 0.5) * dphi
+        radius = self._r0 + self._b * phi
+        arc = np.cumsum(np.maximum(radius, min_per_turn * step / (2 * np.pi))) * dphi
+        starts = np.unique(np.searchsorted(arc, np.arange(0, arc[-1], step)))
+        counts = np.diff(np.append(starts, self.n_samples))
+        phi = np.add.reduceat(phi, starts) / counts
+        half = np.add.reduceat(np.asarray(widths, dtype=np.float64), starts) / counts / 2
+        radius = self._r0 + self._b * phi
+        angle = phi + self._offset_rad
+        direction = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+        outer = self._center + (radius + half)[:, None] * direction
+        inner = self._center + np.maximum(radius - half, 0)[:, None] * direction
+        return np.concatenate([outer, inner[::-1]])[None]
+
+
+def brightness_to_width(brightness, thin, thick):
+    """Line width for a brightness of 0..255: thick on dark areas, thin on light ones."""
+    normalized = np.asarray(brightness, dtype=np.float32) / 255
+    return thin + (thick - thin) * (1 - normalized)
+
+
+@functools.lru_cache(maxsize=64)
+def width_lut(thin, thick):
+    """
+    brightness_to_width for every gray level, as a float32 table indexed by a uint8 array.
+
+    The mapping is linear, so looking up the gray array and then interpolating the
+    widths gives the same result as interpolating the brightness first.
+    """
+    lut = brightness_to_width(np.arange(256), thin, thick).astype(np.float32)
+    lut.setflags(write=False)
+    return lut
+
+
+@functools.lru_cache(maxsize=GEOMETRY_CACHE_ITEMS)
+def _cached_spiral_geometry(size, n_turns, r0, r1, offset_angle):
+    return SpiralGeometry(size, n_turns, r0, r1, offset_angle)
+
+
+@functools.lru_cache(maxsize=GEOMETRY_CACHE_ITEMS)
+def _cached_tiling_geometry(tiling, size, cell_size):
+    return TilingGeometry(tiling, size, cell_size)
+
+
+def spiral_geometry(size, n_turns, r0, r1, offset_angle=0, window=None):
+    """
+    SpiralGeometry, shared between renders of the whole canvas with the same arguments.
+
+    The per-pixel tables and samples depend only on these arguments, so repeated
+    renders in a worker skip all trigonometry and the bilinear sampling setup.
+    Windowed (tiled high-res) geometries are large and built per render instead.
+    """
+    if window is None:
+        return _cached_spiral_geometry(size, n_turns, r0, r1, offset_angle)
+    return SpiralGeometry(size, n_turns, r0, r1, offset_angle, window)
+
+
+def tiling_geometry(tiling, size, cell_size, window=None):
+    """TilingGeometry, shared between renders of the whole canvas; see spiral_geometry."""
+    if window is None:
+        return _cached_tiling_geometry(tiling, size, cell_size)
+    return TilingGeometry(tiling, size, cell_size, window)
+
+
+def color_ramp(col_bg, color):
+    """RGB color for each coverage level 0..255 of color over col_bg, as a (256, 3) uint8 array."""
+    levels = np.arange(256)[:, None] / 255
+    return np.round(np.asarray(col_bg) + (np.asarray(color) - np.asarray(col_bg)) * levels).astype(np.uint8)
+
+
+def composite_layers(size, col_bg, layers):
+    """
+    Paint coverage layers over a background in order.
+
+    Args:
+        size: Side of the square canvas, or (width, height) of a part of it
+        col_bg: Background RGB color
+        layers: Iterable of (coverage array 0..1, RGB color)
+
+    Returns:
+        PIL Image in RGB mode
+    """
+    if isinstance(size, int):
+        size = (size, size)
+    output = None
+    for coverage, color in layers:
+        mask = Image.fromarray((coverage * 255 + 0.5).astype(np.uint8), 'L')
+        if output is None:
+            # First layer over a flat background is a per-channel lookup table
+            ramp = color_ramp(col_bg, color)
+            bands = [mask.point(ramp[:, channel].tolist()) for channel in range(3)]
+            output = Image.merge('RGB', bands)
+        else:
+            output = Image.composite(Image.new('RGB', size, color), output, mask)
+    return output if output is not None else Image.new('RGB', size, col_bg)
+
+
+def render_layers(size, col_bg, layers):
+    """Rasterize (geometry, widths, color) layers over their geometries' window."""
+    return composite_layers(size, col_bg, [(geometry.coverage(widths), color) for geometry, widths, color in layers])
+
+
+def spiral_layers(gray_array, size, spiral_thickness=2, spiral_turns=50, spiral_r1_f=1, thick_f=0.95,
+                  col_line=(0, 0, 0), line_scale=1, window=None):
+    """
+    Geometry, per-sample widths and color of a spiral on a canvas of the given size.
+
+    Brightness is sampled bilinearly from gray_array at every spiral point (the array
+    may be smaller than the canvas) and mapped to a continuous line width.
+
+    Returns:
+        List of (SpiralGeometry, widths, color) layers, see render_layers
+    """
+    geometry = spiral_geometry(size, spiral_turns, 0, 0.5 * spiral_r1_f, window=window)
+    thick = max(1, spiral_thickness * thick_f)
+    lut = width_lut(0.5 * line_scale, thick * line_scale)
+    return [(geometry, geometry.sampler(gray_array.shape)(lut.take(gray_array)), col_line)]
+
+
+def render_spiral(gray_array, spiral_thickness=2, spiral_turns=50, spiral_r1_f=1, thick_f=0.95,
+                  col_line=(0, 0, 0), col_bg=(255, 255, 255)):
+    """
+    Render a preprocessed grayscale array (see process_image_to_grayscale) on a spiral line.
+
+    Brightness is sampled bilinearly at every spiral point and mapped to a continuous
+    line width, then the whole line is rasterized in one distance-field pass.
+    """
+    size = gray_array.shape[0]
+    layers = spiral_layers(gray_array, size, spiral_thickness, spiral_turns, spiral_r1_f, thick_f, col_line)
+    return render_layers(size, col_bg, layers)
+
+
+def spiral_animation_frames(gray_array, size, n_frames, hold_frames=0, spiral_thickness=2, spiral_turns=50,
+                            spiral_r1_f=1, thick_f=0.95, col_line=(0, 0, 0), col_bg=(255, 255, 255), line_scale=1):
+    """
+    Frames of the spiral line being drawn from the center outwards.
+
+    The finished spiral is split once into per-sample pixel updates (see
+    SpiralGeometry.strokes), ordered by the frame that draws their sample. Each
+    frame applies only its own updates to the previous canvas, so the total cost
+    is linear in the length of the line, not in frames x pixels. The last frame
+    equals render_spiral at this size.
+
+    Args:
+        gray_array: Preprocessed grayscale array, resampled to the canvas as needed
+        size: Side of the frames
+        n_frames: Frames in which the line is drawn
+        hold_frames: Extra copies of the finished image at the end
+
+    Yields:
+        The same (size, size, 3) uint8 canvas, updated in place; use it before advancing
+    """
+    [(geometry, widths, _)] = spiral_layers(gray_array, size, spiral_thickness, spiral_turns, spiral_r1_f, thick_f,
+                                            line_scale=line_scale)
+    pixels, samples, coverage = geometry.strokes(widths)
+    frame_of = samples * n_frames // max(geometry.n_samples, 1)
+    order = np.argsort(frame_of, kind='stable')
+    pixels, coverage, frame_of = pixels[order], coverage[order], frame_of[order]
+    bounds = np.searchsorted(frame_of, np.arange(n_frames + 1))
+
+    ramp = color_ramp(col_bg, col_line)
+    ink = np.zeros(size * size, dtype=np.float32)
+    canvas = np.empty((size * size, 3), dtype=np.uint8)
+    canvas[:] = col_bg
+    frame = canvas.reshape(size, size, 3)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        touched = pixels[start:end]
+        # A pixel can be reached by both of its arms within one frame, hence maximum.at
+        np.maximum.at(ink, touched, coverage[start:end])
+        canvas[touched] = ramp.take((ink.take(touched) * 255 + 0.5).astype(np.uint8), axis=0)
+        yield frame
+    for _ in range(hold_frames):
+        yield frame
+
+
+def encode_animation(frames, output_path, size, fps, format='mp4'):
+    """
+    Encode RGB frames by piping them raw into ffmpeg's stdin; no frame touches the disk.
+
+    Args:
+        frames: Iterable of (size, size, 3) uint8 arrays
+        output_path: Where ffmpeg writes the result
+        size: Side of the frames
+        fps: Frame rate
+        format: 'mp4' (H.264, for animations and video notes) or 'gif'
+
+    Raises:
+        RuntimeError: If ffmpeg fails
+    """
+    command = ['ffmpeg', '-y', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{size}x{size}',
+               '-r', str(fps), '-i', 'pipe:0']
+    if format == 'gif':
+        command += ['-vf', 'split[a][b];[a]palettegen=max_colors=64[p];[b][p]paletteuse', '-loop', '0']
+    else:
+        command += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+                    '-movflags', '+faststart', '-an']
+    process = subprocess.Popen(command + [output_path], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for frame in frames:
+            process.stdin.write(frame.data)
+        process.stdin.close()
+    except BrokenPipeError:
+        # ffmpeg exited early; its stderr explains why
+        pass
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to encode the animation: {stderr.decode(errors='replace')[-500:]}")
+
+
+def render_spiral_animation(sources, output_path, size=480, seconds=6, fps=25, hold_seconds=1.5, format='mp4',
+                            n_shades=16, invert=False, reference_size=300, **params):
+    """
+    Render the spiral effect as an animation of the line being drawn.
+
+    Args:
+        sources: One photo or preprocessed array, as for render_effect
+        output_path: Where the encoded animation is written
+        size: Side of the video
+        seconds: Duration of the drawing
+        fps: Frame rate
+        hold_seconds: How long the finished image stays on screen
+        format: 'mp4' or 'gif', see encode_animation
+        reference_size: Output size the line widths in params are meant for
+        **params: Spiral parameters (spiral_thickness, spiral_turns, colors...)
+    """
+    [gray_array] = _prepare_arrays("spiral", sources, size, n_shades, invert)
+    frames = spiral_animation_frames(gray_array, size, round(seconds * fps), round(hold_seconds * fps),
+                                     line_scale=size / reference_size, **params)
+    encode_animation(frames, output_path, size, fps, format)
 
 
 def create_spiral_image(image_path, spiral_thickness=2, spiral_turns=50, 
@@ -87,138 +646,309 @@ def create_spiral_image(image_path, spiral_thickness=2, spiral_turns=50,
     """
     try:
         gray_img, gray_array = process_image_to_grayscale(image_path, size, n_shades, invert)
-        
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Generate spiral coordinates
-        spiral_r1 = 0.5 * spiral_r1_f
-        spiral_points = min(5000, size * 20)
-        
-        spiral = spiral_coords(
-            xo=0.5,
-            yo=0.5,
-            n_points=int(spiral_points),
-            n_turns=spiral_turns,
-            r0=0,
-            r1=spiral_r1,
-            offset_angle=0
-        )
-        
-        # Normalize spiral coordinates to pixel space
-        spiral_pixels = [(int(x * size), int(y * size)) for x, y in spiral]
-        
-        # Calculate thickness values based on image brightness
-        thin = 0.5
-        thick = max(1, int(spiral_thickness * thick_f))
-        
-        # Draw spiral with varying thickness based on image brightness
-        for i in range(len(spiral_pixels) - 1):
-            x1, y1 = spiral_pixels[i]
-            x2, y2 = spiral_pixels[i + 1]
-            
-            # Get brightness at this point
-            if 0 <= x1 < size and 0 <= y1 < size:
-                brightness = gray_array[y1, x1]
-                normalized_brightness = brightness / 255.0
-                line_thickness = int(thin + (thick - thin) * (1 - normalized_brightness))
-                line_thickness = max(1, line_thickness)
-                
-                draw.line([(x1, y1), (x2, y2)], fill=col_line, width=line_thickness)
-        
-        return output
+        return render_spiral(gray_array, spiral_thickness, spiral_turns, spiral_r1_f, thick_f, col_line, col_bg)
     
     except Exception as e:
         logger.error(f"Error creating spiral image: {e}")
         raise
 
 
-def create_square_grid_image(image_path, grid_size=50, size=300, n_shades=16, 
-                            invert=False, col_line=(0, 0, 0), col_bg=(255, 255, 255)):
+class Tiling:
     """
-    Create a square grid image effect.
-    The grid lines get thicker for darker areas and thinner for lighter areas.
+    A periodic tiling of the plane by convex polygons.
+
+    The tiling is a lattice (two basis vectors) plus the prototiles of one period:
+    every cell is a prototile translated by an integer combination of the basis.
+    Coordinates are in cell units; TilingGeometry scales them to pixels.
+    """
+
+    def __init__(self, basis, prototiles):
+        """
+        Args:
+            basis: Two lattice vectors, as rows
+            prototiles: Convex polygons (lists of (x, y) vertices) covering one period
+        """
+        self.basis = np.asarray(basis, dtype=np.float64)
+        self.prototiles = [np.asarray(vertices, dtype=np.float64) for vertices in prototiles]
+        self.to_lattice = np.linalg.inv(self.basis)
+
+        # Half-planes of every prototile translate that can contain a point of the
+        # fundamental parallelogram; a point is classified against these only
+        self.candidates = []
+        for kind, vertices in enumerate(self.prototiles):
+            lattice = vertices @ self.to_lattice
+            low = np.floor(lattice.min(axis=0) + 1e-9).astype(int)
+            high = np.ceil(lattice.max(axis=0) - 1e-9).astype(int)
+            for i in range(-high[0] + 1, -low[0] + 1):
+                for j in range(-high[1] + 1, -low[1] + 1):
+                    normals, offsets = _half_planes(vertices + i * self.basis[0] + j * self.basis[1])
+                    self.candidates.append((kind, i, j, normals, offsets))
+
+
+def _half_planes(vertices):
+    """Outward unit normals and offsets of a convex polygon's edges: inside is normal @ p <= offset."""
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    normals = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    if np.sum(edges[:, 0] * np.roll(edges[:, 1], -1) - edges[:, 1] * np.roll(edges[:, 0], -1)) < 0:
+        normals = -normals
+    return normals, np.einsum('ij,ij->i', normals, vertices)
+
+
+class TilingGeometry:
+    """
+    Per-pixel cell membership and distance to the cell outline for a tiling on a canvas.
+
+    Each pixel is assigned to the cell whose polygon contains it; for convex cells
+    the distance to the outline is the smallest distance to an edge line. Cells
+    are numbered densely so per-cell statistics are a single bincount.
+    """
+
+    # Pixels per row band when building the per-pixel tables
+    _BAND_PIXELS = 1 << 16
+
+    def __init__(self, tiling, size, cell_size, window=None):
+        """
+        Args:
+            tiling: Tiling to lay out
+            size: Side of the square canvas in pixels
+            cell_size: Length of one tiling unit in pixels
+            window: (left, top, width, height) part of the canvas to build the per-pixel
+                tables for (default: the whole canvas); see tile()
+        """
+        self.tiling = tiling
+        self.size = size
+        self.cell_size = cell_size
+
+        # Lattice coordinates of the canvas corners bound the cell indices that occur.
+        # The extent is rounded so canvases of any size with the same number of units
+        # across number their cells identically.
+        extent = round(size / cell_size, 6)
+        corners = np.array([[0, 0], [1, 0], [0, 1], [1, 1]]) * extent @ tiling.to_lattice
+        shifts = np.array([(i, j) for _, i, j, _, _ in tiling.candidates])
+        self.low = np.floor(corners.min(axis=0)).astype(int) + shifts.min(axis=0)
+        high = np.floor(corners.max(axis=0)).astype(int) + shifts.max(axis=0)
+        self.span = high - self.low + 1
+        self.n_kinds = len(tiling.prototiles)
+        self.n_cells = int(self.span[0] * self.span[1] * self.n_kinds)
+        # Dense id of each candidate relative to the lattice cell of the pixel
+        self._candidate_ids = np.array([(i * self.span[1] + j) * self.n_kinds + kind
+                                        for kind, i, j, _, _ in tiling.candidates], dtype=np.intp)
+
+        self._build_tables(window or (0, 0, size, size))
+
+    def tile(self, window):
+        """The same layout with per-pixel tables for another (left, top, width, height) window."""
+        tile = copy.copy(self)
+        tile._build_tables(window)
+        return tile
+
+    def _build_tables(self, window):
+        left, top, width, height = window
+        self.window = window
+        tiling, cell_size = self.tiling, self.cell_size
+        axis_x = (np.arange(left, left + width, dtype=np.float32) + np.float32(0.5)) / np.float32(cell_size)
+        axis_y = (np.arange(top, top + height, dtype=np.float32) + np.float32(0.5)) / np.float32(cell_size)
+        to_lattice = tiling.to_lattice.astype(np.float32)
+        basis = tiling.basis.astype(np.float32)
+        self.cell = np.empty((height, width), dtype=np.intp)
+        self.distance = np.empty((height, width), dtype=np.float32)
+        rows = max(1, self._BAND_PIXELS // max(width, 1))
+        for band_top in range(0, height, rows):
+            band = slice(band_top, band_top + rows)
+            x = np.broadcast_to(axis_x[None, :], (len(axis_y[band]), width))
+            y = np.broadcast_to(axis_y[band, None], x.shape)
+
+            # Reduce every point into the fundamental parallelogram of its lattice cell
+            a = np.floor(x * to_lattice[0, 0] + y * to_lattice[1, 0])
+            c = np.floor(x * to_lattice[0, 1] + y * to_lattice[1, 1])
+            local_x = x - a * basis[0, 0] - c * basis[1, 0]
+            local_y = y - a * basis[0, 1] - c * basis[1, 1]
+
+            # The containing polygon is the one whose farthest edge line is least positive
+            best = np.full(x.shape, np.inf, dtype=np.float32)
+            choice = np.zeros(x.shape, dtype=np.intp)
+            outside = np.empty(x.shape, dtype=np.float32)
+            edge = np.empty(x.shape, dtype=np.float32)
+            closer = np.empty(x.shape, dtype=bool)
+            for index, (_, _, _, normals, offsets) in enumerate(tiling.candidates):
+                outside.fill(-np.inf)
+                for (nx, ny), offset in zip(normals.astype(np.float32), offsets.astype(np.float32)):
+                    np.multiply(local_x, nx, out=edge)
+                    edge += local_y * ny
+                    edge -= offset
+                    np.maximum(outside, edge, out=outside)
+                np.less(outside, best, out=closer)
+                np.minimum(outside, best, out=best)
+                np.copyto(choice, index, where=closer)
+
+            np.multiply(best, np.float32(-cell_size), out=self.distance[band])
+            cell = (a.astype(np.intp) - self.low[0]) * self.span[1] + (c.astype(np.intp) - self.low[1])
+            cell *= self.n_kinds
+            cell += self._candidate_ids.take(choice)
+            self.cell[band] = cell
+        # Geometries are shared through tiling_geometry(), so the tables must stay as built
+        for table in (self.cell, self.distance):
+            table.setflags(write=False)
+
+    def cell_means(self, array):
+        """Area-averaged value of a size x size array over every cell (NaN for cells off the canvas)."""
+        flat = self.cell.ravel()
+        totals = np.bincount(flat, weights=array.ravel(), minlength=self.n_cells)
+        counts = np.bincount(flat, minlength=self.n_cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return totals / counts
+
+    def cells(self, ids):
+        """
+        Polygons of the given cells in pixel coordinates.
+
+        Returns:
+            (centers, vertices) arrays of shape (n, 2) and (n, k, 2)
+        """
+        ids = np.asarray(ids)
+        kinds = ids % self.n_kinds
+        lattice = ids // self.n_kinds
+        offsets = np.stack([lattice // self.span[1] + self.low[0], lattice % self.span[1] + self.low[1]], axis=1)
+        prototiles = np.stack(self.tiling.prototiles)
+        vertices = (prototiles[kinds] + (offsets @ self.tiling.basis)[:, None, :]) * self.cell_size
+        return vertices.mean(axis=1), vertices
+
+    def bands(self, widths):
+        """
+        Every cell on the canvas as a stroke along the inside of its outline, for vector output.
+
+        coverage() inks each cell up to half its width inwards from the outline; the
+        same band is a stroke of that width along the polygon inset by half of it
+        (with mitered corners). Bands wider than the cell fill it completely.
+
+        Returns:
+            (rings, stroke_widths): (n, k, 2) array of the inset polygons of the n
+            cells that touch the canvas, in canvas pixels, and their stroke widths
+        """
+        centers, vertices = self.cells(np.arange(self.n_cells))
+        visible = ((vertices.min(axis=1) < self.size) & (vertices.max(axis=1) > 0)).all(axis=1)
+        centers, vertices = centers[visible], vertices[visible]
+
+        # Inward unit normals of the edges; consecutive offset edge lines meet at the inset vertices
+        edges = np.roll(vertices, -1, axis=1) - vertices
+        normals = np.stack([-edges[..., 1], edges[..., 0]], axis=-1)
+        normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+        inward = np.einsum('nkd,nkd->nk', normals, centers[:, None, :] - vertices)
+        normals *= np.sign(inward)[..., None]
+        previous = np.roll(normals, 1, axis=1)
+        bisectors = (previous + normals) / (1 + np.einsum('nkd,nkd->nk', previous, normals))[..., None]
+
+        # The distance from the center to the nearest edge bounds how far a band can reach
+        band = np.minimum(0.5 * np.asarray(widths, dtype=np.float64)[visible], np.abs(inward).min(axis=1))
+        return vertices + (0.5 * band)[:, None, None] * bisectors, band
+
+    def coverage(self, widths):
+        """
+        Anti-aliased outline coverage (0..1, float32 over the window) for per-cell line widths.
+
+        Every cell strokes its own side of the outline, so a shared edge is as wide
+        as the average of its two cells.
+        """
+        reach = (0.5 * np.asarray(widths, dtype=np.float32) + 0.5).take(self.cell)
+        reach -= self.distance
+        return np.clip(reach, 0, 1, out=reach)
+
+
+def _cairo_pentagons():
+    """The four pentagons of one period of the Cairo tiling, on a square grid of side 2."""
+    h = (np.sqrt(7) - 1) / 6  # half of the short edge; makes all edges equal
+    pentagons = [
+        [(0.5 + h, 0.5), (1, 0), (1.5, 0.5 - h), (1.5, 0.5 + h), (1, 1)],
+        [(1.5, 0.5 - h), (2, 0), (2.5 - h, 0.5), (2, 1), (1.5, 0.5 + h)],
+        [(1, 1), (1.5, 0.5 + h), (2, 1), (1.5 + h, 1.5), (1.5 - h, 1.5)],
+        [(1, 0), (1.5 - h, -0.5), (1.5 + h, -0.5), (2, 0), (1.5, 0.5 - h)],
+    ]
+    return [np.array(pentagon) * 2 for pentagon in pentagons]
+
+
+SQUARE_TILING = Tiling([(1, 0), (0, 1)], [[(0, 0), (1, 0), (1, 1), (0, 1)]])
+TRIANGLE_TILING = Tiling(
+    [(1, 0), (0.5, np.sqrt(3) / 2)],
+    [[(0, 0), (1, 0), (0.5, np.sqrt(3) / 2)], [(1, 0), (1.5, np.sqrt(3) / 2), (0.5, np.sqrt(3) / 2)]],
+)
+DIAMOND_TILING = Tiling([(1, 0), (0.5, 0.5)], [[(0.5, 0), (1, 0.5), (0.5, 1), (0, 0.5)]])
+HEXAGON_TILING = Tiling(
+    [(1.5, np.sqrt(3) / 2), (0, np.sqrt(3))],
+    [[(np.cos(angle), np.sin(angle)) for angle in np.arange(6) * np.pi / 3]],
+)
+PENTAGON_TILING = Tiling([(2, 2), (2, -2)], _cairo_pentagons())
+
+
+def tiling_layers(gray_array, tiling, size, grid_size=50, thin=0.5, thick=2, col_line=(0, 0, 0),
+                  line_scale=1, window=None):
+    """
+    Geometry, per-cell widths and color of a tiling's outlines on a canvas of the given size.
+
+    Cell brightness is averaged at the resolution of gray_array; a canvas of another
+    size numbers its cells the same way, so the widths carry over.
+
+    Returns:
+        List of (TilingGeometry, widths, color) layers, see render_layers
+    """
+    source_size = gray_array.shape[0]
+    source = tiling_geometry(tiling, source_size, source_size / grid_size)
+    brightness = np.nan_to_num(source.cell_means(gray_array), nan=255)
+    widths = brightness_to_width(brightness, thin * line_scale, thick * line_scale)
+    if size == source_size and window is None:
+        return [(source, widths, col_line)]
+    return [(tiling_geometry(tiling, size, size / grid_size, window), widths, col_line)]
+
+
+def render_tiling(gray_array, tiling, grid_size=50, thin=0.5, thick=2,
+                  col_line=(0, 0, 0), col_bg=(255, 255, 255)):
+    """
+    Render a preprocessed grayscale array as the outlines of a tiling.
+
+    Every cell is stroked with a width set by the average brightness under it:
+    thicker for darker areas, thinner for lighter ones.
+
+    Args:
+        gray_array: Square 2D array from process_image_to_grayscale
+        tiling: Tiling to draw
+        grid_size: Number of tiling units across the canvas
+
+    Returns:
+        PIL Image in RGB mode
     """
+    size = gray_array.shape[0]
+    return render_layers(size, col_bg, tiling_layers(gray_array, tiling, size, grid_size, thin, thick, col_line))
+
+
+def _create_grid_image(name, tiling, image_path, grid_size, size, n_shades, invert, col_line, col_bg):
+    """Shared body of the create_*_grid_image effects: preprocess, then render the tiling."""
     try:
         gray_img, gray_array = process_image_to_grayscale(image_path, size, n_shades, invert)
-        
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Create square grid
-        cell_size = size // grid_size
-        thin = 0.5
-        thick = 2
-        
-        for y in range(0, size, cell_size):
-            for x in range(0, size, cell_size):
-                if y < size and x < size:
-                    brightness = gray_array[y, x]
-                    normalized = brightness / 255.0
-                    line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                    line_thickness = max(1, line_thickness)
-                    
-                    # Draw square
-                    x1, y1 = x, y
-                    x2, y2 = min(x + cell_size, size), min(y + cell_size, size)
-                    draw.rectangle([x1, y1, x2, y2], outline=col_line, width=line_thickness)
-        
-        return output
-    
+        return render_tiling(gray_array, tiling, grid_size, col_line=col_line, col_bg=col_bg)
+
     except Exception as e:
-        logger.error(f"Error creating square grid image: {e}")
+        logger.error(f"Error creating {name} grid image: {e}")
         raise
 
 
+def create_square_grid_image(image_path, grid_size=50, size=300, n_shades=16, 
+                            invert=False, col_line=(0, 0, 0), col_bg=(255, 255, 255)):
+    """
+    Create a square grid image effect.
+    The grid lines get thicker for darker areas and thinner for lighter areas.
+    """
+    return _create_grid_image("square", SQUARE_TILING, image_path, grid_size, size, n_shades, invert,
+                              col_line, col_bg)
+
+
 def create_hexagon_grid_image(image_path, grid_size=50, size=300, n_shades=16, 
                              invert=False, col_line=(0, 0, 0), col_bg=(255, 255, 255)):
     """
     Create a hexagon grid image effect.
     The hexagon lines get thicker for darker areas and thinner for lighter areas.
     """
-    try:
-        gray_img, gray_array = process_image_to_grayscale(image_path, size, n_shades, invert)
-        
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Create hexagon grid
-        hex_size = size / grid_size
-        thin = 0.5
-        thick = 2
-        
-        for y in range(0, size, int(hex_size * 1.5)):
-            for x in range(0, size, int(hex_size * 1.5)):
-                if y < size and x < size:
-                    brightness = gray_array[min(y, size-1), min(x, size-1)]
-                    normalized = brightness / 255.0
-                    line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                    line_thickness = max(1, line_thickness)
-                    
-                    # Draw hexagon
-                    hex_points = create_hexagon_points(x, y, hex_size)
-                    if hex_points:
-                        draw.polygon(hex_points, outline=col_line, width=line_thickness)
-        
-        return output
-    
-    except Exception as e:
-        logger.error(f"Error creating hexagon grid image: {e}")
-        raise
-
-
-def create_hexagon_points(cx, cy, size):
-    """Create points for a hexagon centered at (cx, cy)"""
-    points = []
-    for i in range(6):
-        angle = i * 60 * np.pi / 180
-        x = cx + size * np.cos(angle)
-        y = cy + size * np.sin(angle)
-        points.append((x, y))
-    return points
+    return _create_grid_image("hexagon", HEXAGON_TILING, image_path, grid_size, size, n_shades, invert,
+                              col_line, col_bg)
 
 
 def create_triangle_grid_image(image_path, grid_size=50, size=300, n_shades=16, 
@@ -226,39 +956,8 @@ def create_triangle_grid_image(image_path, grid_size=50, size=300, n_shades=16,
     """
     Create a triangle grid image effect.
     """
-    try:
-        gray_img, gray_array = process_image_to_grayscale(image_path, size, n_shades, invert)
-        
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Create triangle grid
-        cell_size = size // grid_size
-        thin = 0.5
-        thick = 2
-        
-        for y in range(0, size, cell_size):
-            for x in range(0, size, cell_size):
-                if y < size and x < size:
-                    brightness = gray_array[y, x]
-                    normalized = brightness / 255.0
-                    line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                    line_thickness = max(1, line_thickness)
-                    
-                    # Draw triangle
-                    x1, y1 = x, y
-                    x2, y2 = x + cell_size, y
-                    x3, y3 = x + cell_size // 2, y + cell_size
-                    
-                    triangle = [(x1, y1), (x2, y2), (x3, y3)]
-                    draw.polygon(triangle, outline=col_line, width=line_thickness)
-        
-        return output
-    
-    except Exception as e:
-        logger.error(f"Error creating triangle grid image: {e}")
-        raise
+    return _create_grid_image("triangle", TRIANGLE_TILING, image_path, grid_size, size, n_shades, invert,
+                              col_line, col_bg)
 
 
 def create_diamond_grid_image(image_path, grid_size=50, size=300, n_shades=16, 
@@ -266,90 +965,40 @@ def create_diamond_grid_image(image_path, grid_size=50, size=300, n_shades=16,
     """
     Create a diamond/rhombus grid image effect.
     """
-    try:
-        gray_img, gray_array = process_image_to_grayscale(image_path, size, n_shades, invert)
-        
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Create diamond grid
-        cell_size = size // grid_size
-        thin = 0.5
-        thick = 2
-        
-        for y in range(0, size, cell_size):
-            for x in range(0, size, cell_size):
-                if y < size and x < size:
-                    brightness = gray_array[y, x]
-                    normalized = brightness / 255.0
-                    line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                    line_thickness = max(1, line_thickness)
-                    
-                    # Draw diamond
-                    cx = x + cell_size // 2
-                    cy = y + cell_size // 2
-                    diamond = [
-                        (cx, y),
-                        (x + cell_size, cy),
-                        (cx, y + cell_size),
-                        (x, cy)
-                    ]
-                    draw.polygon(diamond, outline=col_line, width=line_thickness)
-        
-        return output
-    
-    except Exception as e:
-        logger.error(f"Error creating diamond grid image: {e}")
-        raise
+    return _create_grid_image("diamond", DIAMOND_TILING, image_path, grid_size, size, n_shades, invert,
+                              col_line, col_bg)
 
 
 def create_pentagon_grid_image(image_path, grid_size=50, size=300, n_shades=16, 
                               invert=False, col_line=(0, 0, 0), col_bg=(255, 255, 255)):
     """
-    Create a pentagon grid image effect.
+    Create a pentagon (Cairo tiling) grid image effect.
     """
-    try:
-        gray_img, gray_array = process_image_to_grayscale(image_path, size, n_shades, invert)
-        
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Create pentagon grid
-        pentagon_size = size / grid_size
-        thin = 0.5
-        thick = 2
-        
-        for y in range(0, size, int(pentagon_size * 1.5)):
-            for x in range(0, size, int(pentagon_size * 1.5)):
-                if y < size and x < size:
-                    brightness = gray_array[min(y, size-1), min(x, size-1)]
-                    normalized = brightness / 255.0
-                    line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                    line_thickness = max(1, line_thickness)
-                    
-                    # Draw pentagon
-                    pentagon_points = create_pentagon_points(x, y, pentagon_size)
-                    if pentagon_points:
-                        draw.polygon(pentagon_points, outline=col_line, width=line_thickness)
-        
-        return output
-    
-    except Exception as e:
-        logger.error(f"Error creating pentagon grid image: {e}")
-        raise
+    return _create_grid_image("pentagon", PENTAGON_TILING, image_path, grid_size, size, n_shades, invert,
+                              col_line, col_bg)
+
 
+def double_spiral_layers(gray_array1, gray_array2, size, spiral_thickness=2, spiral_turns=50,
+                         col_line1=(255, 0, 0), col_line2=(0, 0, 255), line_scale=1, window=None):
+    """Layers of two interleaved spirals, one per image; see spiral_layers."""
+    lut = width_lut(0.5 * line_scale, max(1, spiral_thickness * 0.95) * line_scale)
+    layers = []
+    for gray_array, (r0, r1), color in ((gray_array1, (0, 0.5), col_line1),
+                                        (gray_array2, (0.05, 0.45), col_line2)):
+        geometry = spiral_geometry(size, spiral_turns, r0, r1, window=window)
+        layers.append((geometry, geometry.sampler(gray_array.shape)(lut.take(gray_array)), color))
+    return layers
 
-def create_pentagon_points(cx, cy, size):
-    """Create points for a pentagon centered at (cx, cy)"""
-    points = []
-    for i in range(5):
-        angle = (i * 72 - 90) * np.pi / 180
-        x = cx + size * np.cos(angle)
-        y = cy + size * np.sin(angle)
-        points.append((x, y))
-    return points
+
+def render_double_spiral(gray_array1, gray_array2, spiral_thickness=2, spiral_turns=50,
+                         col_line1=(255, 0, 0), col_line2=(0, 0, 255), col_bg=(255, 255, 255)):
+    """
+    Render two preprocessed grayscale arrays on two interleaved spirals in a single pass.
+    """
+    size = gray_array1.shape[0]
+    layers = double_spiral_layers(gray_array1, gray_array2, size, spiral_thickness, spiral_turns,
+                                  col_line1, col_line2)
+    return render_layers(size, col_bg, layers)
 
 
 def create_double_spiral_image(image_path1, image_path2=None, spiral_thickness=2, 
@@ -362,84 +1011,348 @@ def create_double_spiral_image(image_path1, image_path2=None, spiral_thickness=2
     try:
         gray_img1, gray_array1 = process_image_to_grayscale(image_path1, size, n_shades, False)
         
-        # If second image not provided, use inverted first image
+        # If second image not provided, use inverted first image (same as preprocessing it with invert=True)
         if image_path2 is None:
-            gray_img2, gray_array2 = process_image_to_grayscale(image_path1, size, n_shades, True)
+            gray_array2 = 255 - gray_array1
         else:
             gray_img2, gray_array2 = process_image_to_grayscale(image_path2, size, n_shades, False)
         
-        # Create output image
-        output = Image.new('RGB', (size, size), col_bg)
-        draw = ImageDraw.Draw(output, 'RGBA')
-        
-        # Generate spiral coordinates
-        spiral_r1 = 0.5
-        spiral_points = min(5000, size * 20)
-        
-        spiral = spiral_coords(
-            xo=0.5,
-            yo=0.5,
-            n_points=int(spiral_points),
-            n_turns=spiral_turns,
-            r0=0,
-            r1=spiral_r1,
-            offset_angle=0
-        )
-        
-        spiral_pixels = [(int(x * size), int(y * size)) for x, y in spiral]
-        
-        thin = 0.5
-        thick = max(1, int(spiral_thickness * 0.95))
-        
-        # Draw first spiral
-        for i in range(len(spiral_pixels) - 1):
-            x1, y1 = spiral_pixels[i]
-            x2, y2 = spiral_pixels[i + 1]
-            
-            if 0 <= x1 < size and 0 <= y1 < size:
-                brightness = gray_array1[y1, x1]
-                normalized = brightness / 255.0
-                line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                line_thickness = max(1, line_thickness)
-                draw.line([(x1, y1), (x2, y2)], fill=col_line1, width=line_thickness)
-        
-        # Draw second spiral (offset)
-        offset_spiral = spiral_coords(
-            xo=0.5,
-            yo=0.5,
-            n_points=int(spiral_points),
-            n_turns=spiral_turns,
-            r0=0.05,
-            r1=0.45,
-            offset_angle=0
-        )
-        
-        offset_spiral_pixels = [(int(x * size), int(y * size)) for x, y in offset_spiral]
-        
-        for i in range(len(offset_spiral_pixels) - 1):
-            x1, y1 = offset_spiral_pixels[i]
-            x2, y2 = offset_spiral_pixels[i + 1]
-            
-            if 0 <= x1 < size and 0 <= y1 < size:
-                brightness = gray_array2[y1, x1]
-                normalized = brightness / 255.0
-                line_thickness = int(thin + (thick - thin) * (1 - normalized))
-                line_thickness = max(1, line_thickness)
-                draw.line([(x1, y1), (x2, y2)], fill=col_line2, width=line_thickness)
-        
-        return output
+        return render_double_spiral(gray_array1, gray_array2, spiral_thickness, spiral_turns,
+                                    col_line1, col_line2, col_bg)
     
     except Exception as e:
         logger.error(f"Error creating double spiral image: {e}")
         raise
 
 
-def save_image_to_bytes(image, format='PNG'):
+def compact_image(image):
+    """
+    Losslessly convert an RGB image to the smallest mode that holds its colors.
+
+    Effects mostly draw one anti-aliased color over a flat background, so the
+    result is pure gray (saved as L) or has a handful of colors (saved as P, which
+    PNG writes with 1, 2 or 4 bits per pixel). Images with more than 256 colors
+    are returned unchanged.
+
+    Args:
+        image: PIL Image
+
+    Returns:
+        PIL Image in L, P or the original mode
+    """
+    if image.mode != 'RGB':
+        return image
+    colors = image.getcolors(256)
+    if colors is None:
+        return image
+    # Sorted tuples are also sorted as packed 24-bit values, which searchsorted needs below
+    palette = np.array(sorted(color for _, color in colors), dtype=np.uint32)
+    gray = bool(np.all(palette == palette[:, :1]))
+    if gray and len(palette) > 16:
+        return image.convert('L')
+    if gray:
+        lut = np.zeros(256, dtype=np.uint8)
+        lut[palette[:, 0]] = np.arange(len(palette))
+        indices = image.convert('L').point(lut.tolist())
+    else:
+        keys = (palette[:, 0] << 16) | (palette[:, 1] << 8) | palette[:, 2]
+        pixels = np.asarray(image).astype(np.uint32)
+        packed = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        indices = Image.fromarray(np.searchsorted(keys, packed).astype(np.uint8))
+    # L -> P keeps the values as indices; the palette then maps them back to the exact colors
+    compact = indices.convert('P')
+    compact.putpalette(palette.astype(np.uint8).ravel().tolist())
+    return compact
+
+
+# Compression levels tried by save_image_to_bytes when none is fixed: fastest first.
+# Level 9 costs several times longer than 6 for a few percent, so it is only used when configured.
+AUTO_COMPRESS_LEVELS = (1, 6)
+
+
+def _encoder_options(format, level):
+    """Pillow save() options for a zlib-like compression level 0..9."""
+    if format.upper() == 'WEBP':
+        return {'lossless': True, 'method': round(level * 6 / 9)}
+    return {'compress_level': level}
+
+
+def save_image_to_bytes(image, format=OUTPUT_FORMAT, compress_level=OUTPUT_COMPRESS_LEVEL,
+                        size_target=OUTPUT_SIZE_TARGET_BYTES):
+    """
+    Save PIL Image to bytes, compactly and losslessly.
+
+    The image is first reduced to the mode that holds its colors (see compact_image).
+    Without a fixed compress_level, AUTO_COMPRESS_LEVELS are tried in order and the
+    first output within size_target is returned, otherwise the smallest one.
+
+    Args:
+        image: PIL Image
+        format: 'PNG' or 'WEBP' (lossless)
+        compress_level: zlib level 0-9 (for WebP mapped to the method), -1 for automatic
+        size_target: Output size in bytes that is good enough
+
+    Returns:
+        Encoded image bytes
+    """
+    image = compact_image(image)
+    levels = AUTO_COMPRESS_LEVELS if compress_level < 0 else (compress_level,)
+    best = None
+    for level in levels:
+        img_bytes = io.BytesIO()
+        image.save(img_bytes, format=format, **_encoder_options(format, level))
+        if best is None or img_bytes.tell() < len(best):
+            best = img_bytes.getvalue()
+        if len(best) <= size_target:
+            break
+    return best
+
+
+# Effect name -> renderer taking image path(s) or file objects
+EFFECTS = {
+    "spiral": create_spiral_image,
+    "double_spiral": create_double_spiral_image,
+    "square": create_square_grid_image,
+    "hexagon": create_hexagon_grid_image,
+    "triangle": create_triangle_grid_image,
+    "diamond": create_diamond_grid_image,
+    "pentagon": create_pentagon_grid_image,
+}
+
+# Effect name -> renderer taking preprocessed arrays (see render_effect)
+RENDERERS = {
+    "spiral": render_spiral,
+    "double_spiral": render_double_spiral,
+    "square": functools.partial(render_tiling, tiling=SQUARE_TILING),
+    "hexagon": functools.partial(render_tiling, tiling=HEXAGON_TILING),
+    "triangle": functools.partial(render_tiling, tiling=TRIANGLE_TILING),
+    "diamond": functools.partial(render_tiling, tiling=DIAMOND_TILING),
+    "pentagon": functools.partial(render_tiling, tiling=PENTAGON_TILING),
+}
+
+
+# Effect name -> builder of layers for a canvas of any size (see render_effect_tiled)
+LAYERS = {
+    "spiral": spiral_layers,
+    "double_spiral": double_spiral_layers,
+    "square": functools.partial(tiling_layers, tiling=SQUARE_TILING),
+    "hexagon": functools.partial(tiling_layers, tiling=HEXAGON_TILING),
+    "triangle": functools.partial(tiling_layers, tiling=TRIANGLE_TILING),
+    "diamond": functools.partial(tiling_layers, tiling=DIAMOND_TILING),
+    "pentagon": functools.partial(tiling_layers, tiling=PENTAGON_TILING),
+}
+
+
+def resize_gray(gray_array, size):
+    """Resample a preprocessed array to another square size, e.g. for thumbnails."""
+    if gray_array.shape[0] == size:
+        return gray_array
+    return np.asarray(Image.fromarray(gray_array).resize((size, size), Image.Resampling.BILINEAR))
+
+
+def _prepare_arrays(effect, sources, size, n_shades, invert):
+    """Preprocessed arrays of the given size for render_effect and render_effect_tiled."""
+    arrays = []
+    for source in sources:
+        if isinstance(source, np.ndarray):
+            array = resize_gray(source, size)
+            arrays.append(255 - array if invert else array)
+        else:
+            arrays.append(process_image_to_grayscale(source, size, n_shades, invert)[1])
+    if effect == "double_spiral" and len(arrays) == 1:
+        arrays.append(255 - arrays[0])
+    return arrays
+
+
+def render_effect(effect, sources, size=300, n_shades=16, invert=False, **params):
+    """
+    Render an effect from photos or from arrays that were already preprocessed.
+
+    Passing the array from process_image_to_grayscale lets several effects and
+    sizes share one decode and quantization of the photo.
+
+    Args:
+        effect: Key of RENDERERS
+        sources: Photos (path, file object or PIL Image) or preprocessed arrays;
+            one for every effect, or two for the double spiral
+        size: Side of the output; arrays of another size are resampled
+        n_shades: Number of gray shades when preprocessing photos
+        invert: Whether to invert the image
+        **params: Effect parameters (spiral_thickness, spiral_turns, grid_size, colors...)
+
+    Returns:
+        PIL Image in RGB mode
+    """
+    arrays = _prepare_arrays(effect, sources, size, n_shades, invert)
+    return RENDERERS[effect](*arrays, **params)
+
+
+def render_effect_tiled(effect, sources, size=4096, source_size=1024, reference_size=300, n_shades=16,
+                        invert=False, tile_size=RENDER_TILE_SIZE, supersample=2, col_bg=(255, 255, 255), **params):
     """
-    Save PIL Image to bytes.
+    Render an effect at high resolution, one tile at a time.
+
+    Only the per-pixel tables of a single tile exist at any moment, so memory is
+    bounded by tile_size and not by size. Each tile is rendered supersample times
+    larger and box-filtered down. Line widths are scaled so the result looks like
+    the reference_size render, only sharper.
+
+    Args:
+        effect: Key of LAYERS
+        sources: Photos or preprocessed arrays, as for render_effect
+        size: Side of the output
+        source_size: Resolution the brightness is taken at (at most size)
+        reference_size: Output size the line widths in params are meant for
+        tile_size: Side of one tile in output pixels
+        supersample: Samples per output pixel along each axis
+        **params: Effect parameters (spiral_thickness, spiral_turns, grid_size, colors...)
+
+    Returns:
+        PIL Image in RGB mode
+    """
+    arrays = _prepare_arrays(effect, sources, min(source_size, size), n_shades, invert)
+    canvas = size * supersample
+    # Empty window: the per-pixel tables are built tile by tile below
+    layers = LAYERS[effect](*arrays, size=canvas, line_scale=canvas / reference_size, window=(0, 0, 0, 0), **params)
+    image = Image.new('RGB', (size, size), col_bg)
+    for top in range(0, size, tile_size):
+        for left in range(0, size, tile_size):
+            width, height = min(tile_size, size - left), min(tile_size, size - top)
+            window = (left * supersample, top * supersample, width * supersample, height * supersample)
+            tile_layers = [(geometry.tile(window), widths, color) for geometry, widths, color in layers]
+            tile = render_layers(window[2:], col_bg, tile_layers)
+            if supersample > 1:
+                tile = tile.reduce(supersample)
+            image.paste(tile, (left, top))
+    return image
+
+
+def render_frames(effect, frames, output, n_shades=16, invert=False, reference_size=300, col_bg=(255, 255, 255),
+                  **params):
+    """
+    Render an effect on a batch of video frames, writing into a preallocated array.
+
+    The geometry of a size is cached, so after the first frame each one costs only
+    the quantization, the width lookup and one rasterization pass.
+
+    Args:
+        effect: Key of LAYERS except the double spiral, which takes two images
+        frames: (n, size, size) uint8 luminance frames as decoded
+        output: (n, size, size, 3) uint8 array the RGB results are written to
+        reference_size: Output size the line widths in params are meant for
+        **params: Effect parameters (spiral_thickness, spiral_turns, grid_size, colors...)
     """
-    img_bytes = io.BytesIO()
-    image.save(img_bytes, format=format)
-    img_bytes.seek(0)
-    return img_bytes.getvalue()
+    size = frames.shape[1]
+    for frame, result in zip(frames, output):
+        # Unlike photos, frames are not flipped, so the video plays the right way up
+        gray_array = quantize_tones(frame, n_shades)
+        if invert:
+            gray_array = 255 - gray_array
+        layers = LAYERS[effect](gray_array, size=size, line_scale=size / reference_size, **params)
+        result[...] = np.asarray(render_layers(size, col_bg, layers))
 
+
+SVG_UNITS_PER_PIXEL = 10
+
+
+def svg_color(color):
+    return '#%02x%02x%02x' % tuple(color)
+
+
+def svg_path_data(rings, scale=SVG_UNITS_PER_PIXEL):
+    """
+    Path data for closed polygons, formatted in a single % operation.
+
+    Vertices are rounded to 1/scale of a pixel and written as relative integer
+    steps: each ring starts with 'm' from the start of the previous one, and the
+    rest of its vertices are implicit relative line-tos.
+
+    Args:
+        rings: (n, k, 2) array of n polygons with k vertices each
+        scale: Path units per pixel
+
+    Returns:
+        str for the d attribute of a <path>
+    """
+    points = np.round(np.asarray(rings) * scale).astype(np.int64)
+    if points.size == 0:
+        return ""
+    steps = points.copy()
+    steps[:, 1:] -= points[:, :-1]
+    steps[1:, 0] -= points[:-1, 0]
+    n_rings, n_vertices, _ = points.shape
+    template = ("m%d %d" + " %d %d" * (n_vertices - 1) + "z") * n_rings
+    # A minus sign separates numbers by itself
+    return (template % tuple(steps.ravel().tolist())).replace(" -", "-")
+
+
+def svg_layer(geometry, widths, color, scale=SVG_UNITS_PER_PIXEL):
+    """
+    SVG for one (geometry, widths, color) layer: a spiral as one filled outline,
+    a tiling as stroked cell bands, one path per stroke width.
+    """
+    if isinstance(geometry, SpiralGeometry):
+        return f'<path fill="{svg_color(color)}" d="{svg_path_data(geometry.outline(widths), scale)}"/>'
+    rings, bands = geometry.bands(widths)
+    stroke_widths = np.maximum(np.round(bands * scale).astype(np.int64), 1)
+    paths = [f'<path stroke-width="{width}" d="{svg_path_data(rings[stroke_widths == width], scale)}"/>'
+             for width in np.unique(stroke_widths)]
+    return f'<g fill="none" stroke="{svg_color(color)}">' + "".join(paths) + '</g>'
+
+
+def render_effect_svg(effect, sources, size=300, n_shades=16, invert=False, col_bg=(255, 255, 255), **params):
+    """
+    Render an effect as an SVG document: filled outlines instead of pixels.
+
+    Paths are written from the geometry arrays in bulk (see svg_path_data), so the
+    file stays small even with thousands of cells and prints sharp at any size.
+
+    Args:
+        effect: Key of LAYERS
+        sources: Photos or preprocessed arrays, as for render_effect
+        size: Nominal side in pixels; line widths and brightness are taken at this size
+        n_shades: Number of gray shades when preprocessing photos
+        invert: Whether to invert the image
+        col_bg: Background RGB color
+        **params: Effect parameters (spiral_thickness, spiral_turns, grid_size, colors...)
+
+    Returns:
+        SVG document as UTF-8 bytes
+    """
+    arrays = _prepare_arrays(effect, sources, size, n_shades, invert)
+    units = size * SVG_UNITS_PER_PIXEL
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {units} {units}">',
+        f'<rect width="{units}" height="{units}" fill="{svg_color(col_bg)}"/>',
+    ]
+    parts.extend(svg_layer(geometry, widths, color) for geometry, widths, color in LAYERS[effect](*arrays, size=size,
+                                                                                                 **params))
+    parts.append('</svg>')
+    return "\n".join(parts).encode()
+
+
+def create_contact_sheet(images, labels, columns=4, padding=8, col_bg=(255, 255, 255)):
+    """
+    Lay out equally sized images in a grid with a caption under each.
+
+    Args:
+        images: List of PIL Images of the same size
+        labels: Caption for each image
+        columns: Images per row
+
+    Returns:
+        PIL Image in RGB mode
+    """
+    width, height = images[0].size
+    font = ImageFont.load_default()
+    label_height = 20
+    rows = -(-len(images) // columns)
+    sheet = Image.new('RGB', (columns * (width + padding) + padding,
+                              rows * (height + label_height + padding) + padding), col_bg)
+    draw = ImageDraw.Draw(sheet)
+    for i, (image, label) in enumerate(zip(images, labels)):
+        x = padding + (i % columns) * (width + padding)
+        y = padding + (i // columns) * (height + label_height + padding)
+        sheet.paste(image, (x, y))
+        draw.text((x + width / 2, y + height + label_height / 2), label, fill=(0, 0, 0), font=font, anchor='mm')
+    return sheet
@@ -0,0 +1,34 @@
+import asyncio
+
+from bot.core.config import MEDIA_GROUP_WAIT_SECONDS
+
+
+class MediaGroupCollector:
+    """
+    Собирает сообщения одного альбома (media group). Telegram присылает альбом
+    отдельными апдейтами без признака последнего, поэтому альбом считается
+    полным, когда новых сообщений не было wait_seconds. Весь альбом получает
+    хэндлер первого сообщения, остальным достаётся None.
+    """
+
+    def __init__(self, wait_seconds=MEDIA_GROUP_WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._groups = {}  # ключ -> список собранных элементов
+
+    async def collect(self, key, item) -> list | None:
+        group = self._groups.get(key)
+        if group is not None:
+            group.append(item)
+            return None
+        group = self._groups[key] = [item]
+        try:
+            collected = 0
+            while collected != len(group):
+                collected = len(group)
+                await asyncio.sleep(self.wait_seconds)
+        finally:
+            del self._groups[key]
+        return group
+
+
+media_groups = MediaGroupCollector()
@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import logging
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+
+from bot.core.config import METRICS_HOST, METRICS_PORT
+from bot.utils.tracing import Span
+
+# Имя хэндлера текущей задачи; выставляется планировщиком, чтобы метрики этапов знали, чья это работа
+current_handler = contextvars.ContextVar("current_handler", default="none")
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        # render идёт в отдельном потоке, inc — в event loop'е: читаем снимок
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        # callback() -> {tuple меток: значение}; вызывается при каждом сборе метрик
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logging.warning(f"Метрика {self.name}: ошибка сбора: {e}")
+                values = {}
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        # observe меняет список counts на месте: без копии под блокировкой бакеты могли бы обогнать _sum
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(self.labelnames + ("le",), key + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    "bot_stage_duration_seconds", "Длительность этапов обработки по хэндлерам", ("handler", "stage")))
+errors_total = registry.register(Counter(
+    "bot_errors_total", "Ошибки по этапам и типам исключений", ("stage", "type")))
+bytes_in_total = registry.register(Counter(
+    "bot_bytes_in_total", "Байт получено (скачано)", ("stage",)))
+bytes_out_total = registry.register(Counter(
+    "bot_bytes_out_total", "Байт отправлено в Telegram", ("stage",)))
+ffmpeg_active = registry.register(Gauge(
+    "bot_ffmpeg_processes_active", "Запущенные сейчас процессы ffmpeg/ffprobe"))
+cache_requests_total = registry.register(Counter(
+    "bot_cache_requests_total", "Обращения к кэшам: попадания и промахи", ("cache", "result")))
+reencode_fallbacks_total = registry.register(Counter(
+    "bot_reencode_fallbacks_total", "Повторные, более агрессивные перекодирования", ("stage",)))
+
+
+def _scheduler_values():
+    from bot.utils.scheduler import scheduler
+    values = {}
+    for lane, stats in scheduler.stats().items():
+        values[(lane, "active")] = stats["active"]
+        values[(lane, "queued")] = stats["queued"]
+    return values
+
+
+def _photo_store_values():
+    from bot.utils.photo_store import photo_store
+    return {("photos",): len(photo_store), ("bytes",): photo_store.used_bytes}
+
+
+def _disk_values():
+    from bot.utils.storage import disk_manager
+    return {(name,): value for name, value in disk_manager.usage().items() if isinstance(value, int)}
+
+
+registry.register(Gauge(
+    "bot_jobs", "Задачи в планировщике по полосам: активные и в очереди", ("lane", "state"),
+    callback=_scheduler_values))
+registry.register(Gauge(
+    "bot_downloads_dir", "Использование папки загрузок", ("field",), callback=_disk_values))
+registry.register(Gauge(
+    "bot_photo_store", "Фото для эффектов в памяти: число и байты", ("field",), callback=_photo_store_values))
+
+
+def record_cache(cache: str, hit: bool):
+    cache_requests_total.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class observe_stage(ContextDecorator):
+    """
+    Замеряет этап (download, probe, encode, recognize, upload, render) текущего хэндлера.
+    Работает как контекстный менеджер и как декоратор синхронных функций.
+    Исключения внутри этапа считаются в bot_errors_total. Каждый этап также
+    пишется span'ом в трассу задачи; атрибуты span'а дополняются через set().
+    """
+
+    def __init__(self, stage: str, **attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def _recreate_cm(self):
+        # Для декоратора: отдельный экземпляр на каждый вызов, иначе параллельные вызовы делят _started
+        return type(self)(self.stage, **self.attrs)
+
+    def set(self, **attrs):
+        self._span.set(**attrs)
+
+    def __enter__(self):
+        self._span = Span(self.stage, **self.attrs).__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stage_seconds.observe(time.perf_counter() - self._started, handler=current_handler.get(), stage=self.stage)
+        if exc_type is not None:
+            errors_total.inc(stage=self.stage, type=exc_type.__name__)
+        self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode(errors="replace").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = (await asyncio.to_thread(registry.render)).encode()
+            status = "200 OK"
+        else:
+            body, status = b"not found\n", "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logging.warning(f"Ошибка HTTP-эндпоинта метрик: {e}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Запускает локальный HTTP-эндпоинт /metrics. Порт 0 отключает метрики."""
+    if not port:
+        return None
+    try:
+        # reuse_port: во время передачи работы при обновлении оба процесса могут слушать один порт
+        server = await asyncio.start_server(
+            _handle_http, host, port, reuse_port=hasattr(socket, "SO_REUSEPORT"))
+    except OSError as e:
+        logging.error(f"Не удалось запустить эндпоинт метрик на {host}:{port}: {e}")
+        return None
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
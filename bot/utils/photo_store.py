@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+
+from bot.core.config import PHOTO_STORE_MAX_BYTES, PHOTO_STORE_TTL_SECONDS
+from bot.utils.metrics import record_cache
+
+
+class _Entry:
+    __slots__ = ("photos", "stored_at", "arrays")
+
+    def __init__(self, photos: tuple):
+        self.photos = photos  # одно фото или все фото альбома
+        self.stored_at = time.monotonic()
+        self.arrays = {}  # (size, n_shades) -> подготовленный массив оттенков первого фото
+
+    @property
+    def nbytes(self) -> int:
+        return sum(map(len, self.photos)) + sum(array.nbytes for array in self.arrays.values())
+
+
+class PhotoStore:
+    """
+    Фото, присланные для эффектов, хранятся в памяти, а не во временных файлах:
+    по одному (или по одному альбому) на пользователя, вместе с уже подготовленными из него массивами
+    оттенков, чтобы разные эффекты не декодировали фото заново. Общий объём
+    ограничен байтовым бюджетом (вытесняются давно не использованные),
+    устаревшие по TTL фото отбрасываются при обращении.
+    """
+
+    def __init__(self, max_bytes=PHOTO_STORE_MAX_BYTES, ttl_seconds=PHOTO_STORE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.used_bytes = 0
+        self._items = OrderedDict()  # user_id -> _Entry
+
+    def __len__(self):
+        return len(self._items)
+
+    def _drop(self, user_id):
+        self.used_bytes -= self._items.pop(user_id).nbytes
+
+    def _evict(self):
+        while self.used_bytes > self.max_bytes and len(self._items) > 1:
+            self._drop(next(iter(self._items)))
+
+    def _entry(self, user_id: int) -> _Entry | None:
+        entry = self._items.get(user_id)
+        if entry is not None and time.monotonic() - entry.stored_at > self.ttl_seconds:
+            self._drop(user_id)
+            return None
+        if entry is not None:
+            self._items.move_to_end(user_id)
+        return entry
+
+    def put(self, user_id: int, data: bytes):
+        self.put_album(user_id, [data])
+
+    def put_album(self, user_id: int, photos: list[bytes]):
+        if user_id in self._items:
+            self._drop(user_id)
+        entry = self._items[user_id] = _Entry(tuple(photos))
+        self.used_bytes += entry.nbytes
+        self._evict()
+
+    def get(self, user_id: int) -> bytes | None:
+        """Возвращает фото (первое фото альбома) или None, если его нет, оно вытеснено или устарело."""
+        entry = self._entry(user_id)
+        record_cache("photo_store", entry is not None)
+        return entry.photos[0] if entry is not None else None
+
+    def get_album(self, user_id: int) -> list[bytes] | None:
+        """Все фото альбома по порядку или None, как get()."""
+        entry = self._entry(user_id)
+        record_cache("photo_store", entry is not None)
+        return list(entry.photos) if entry is not None else None
+
+    def get_array(self, user_id: int, key: tuple):
+        """Подготовленный массив оттенков для фото пользователя или None."""
+        entry = self._entry(user_id)
+        array = entry.arrays.get(key) if entry is not None else None
+        record_cache("photo_array", array is not None)
+        return array
+
+    def put_array(self, user_id: int, key: tuple, array):
+        entry = self._items.get(user_id)
+        if entry is None:
+            return
+        if key in entry.arrays:
+            self.used_bytes -= entry.arrays[key].nbytes
+        entry.arrays[key] = array
+        self.used_bytes += array.nbytes
+        self._evict()
+
+    def discard(self, user_id: int):
+        if user_id in self._items:
+            self._drop(user_id)
+
+
+photo_store = PhotoStore()
@@ -6,6 +6,8 @@ import shlex
 
 from bot.core.config import MAX_DURATION_SECONDS, MAX_VIDEO_SIZE_BYTES, MAX_FILE_SIZE_BYTES, CIRCLE_SIZE
 from bot.utils.helpers import validate_video_file
+from bot.utils.metrics import observe_stage, ffmpeg_active, errors_total, reencode_fallbacks_total
+from bot.utils.storage import disk_manager
 
 
 async def check_ffmpeg_installed() -> bool:
@@ -39,12 +41,21 @@ async def check_ffmpeg_installed() -> bool:
 
 async def run_ffmpeg_command(command: str) -> tuple[bytes, bytes, int]:
     """Runs an FFmpeg command and returns stdout, stderr, and return code."""
-    process = await asyncio.create_subprocess_shell(
-        command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await process.communicate()
+    stage = "probe" if command.lstrip().startswith("ffprobe") else "encode"
+    with observe_stage(stage, cmd=command[:300]) as observed:
+        ffmpeg_active.inc()
+        try:
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+        finally:
+            ffmpeg_active.dec()
+        observed.set(exit_code=process.returncode)
+    if process.returncode != 0:
+        errors_total.inc(stage=stage, type="NonZeroExit")
     return stdout, stderr, process.returncode
 
 
@@ -80,6 +91,7 @@ async def split_video_chunks(input_path: str, chunk_dir: str, max_duration=MAX_D
     if duration <= max_duration:
         output_path = os.path.join(chunk_dir, 'chunk_001.mp4')
         shutil.copy2(input_path, output_path)
+        disk_manager.add(output_path)
         if await validate_video_file(output_path):
             return [output_path]
         return []
@@ -95,6 +107,7 @@ async def split_video_chunks(input_path: str, chunk_dir: str, max_duration=MAX_D
     chunks = sorted([f for f in os.listdir(chunk_dir) if f.endswith('.mp4')])
     for chunk in chunks:
         chunk_path = os.path.join(chunk_dir, chunk)
+        disk_manager.add(chunk_path)
         if await validate_video_file(chunk_path):
             valid_chunks.append(chunk_path)
         else:
@@ -108,6 +121,7 @@ async def compress_video_if_needed(input_path: str, output_path: str, max_size=M
     file_size = os.path.getsize(input_path)
     if file_size <= max_size:
         shutil.copy2(input_path, output_path)
+        disk_manager.add(output_path)
         return await validate_video_file(output_path)
 
     # Сжатие с первым проходом
@@ -125,6 +139,7 @@ async def compress_video_if_needed(input_path: str, output_path: str, max_size=M
     # Проверка и агрессивное сжатие
     new_size = os.path.getsize(output_path)
     if new_size > max_size:
+        reencode_fallbacks_total.inc(stage="compress")
         cmd2 = (
             f"ffmpeg -i {shlex.quote(output_path)} "
             f"-vf scale=-2:480 "
@@ -138,6 +153,7 @@ async def compress_video_if_needed(input_path: str, output_path: str, max_size=M
             logging.warning(f"Video still too large: {new_size} bytes")
             return False
 
+    disk_manager.add(output_path)
     return await validate_video_file(output_path)
 
 
@@ -165,6 +181,7 @@ async def process_video_to_circle(input_path: str, chat_id: int, bot):
         final_size = os.path.getsize(output_path)
         if final_size > MAX_FILE_SIZE_BYTES:
             logging.warning(f"File too large: {final_size} bytes. Compressing further.")
+            reencode_fallbacks_total.inc(stage="circle")
             temp_path = f"{output_path}.temp.mp4"
             cmd_compress = (
                 f"ffmpeg -i {shlex.quote(output_path)} "
@@ -183,6 +200,7 @@ async def process_video_to_circle(input_path: str, chat_id: int, bot):
                 await bot.send_message(chat_id, f"Видео всё ещё слишком большое ({final_size // 1024 // 1024} МБ). 😔")
                 return
 
+        disk_manager.add(output_path)
         if not await validate_video_file(output_path):
             await bot.send_message(chat_id, "Обработанный кружок не валиден. 😔")
             return
@@ -0,0 +1,283 @@
+"""
+Пул процессов для эффектов над изображениями.
+
+Рендер и кодирование PNG занимают процессор на десятки и сотни миллисекунд,
+поэтому выполняются в отдельных процессах, а не в потоке event loop'а.
+Воркеры стартуют с уже импортированными numpy, PIL и image_processing;
+туда и обратно передаются только байты фото, подготовленные массивы оттенков и PNG,
+а кадры видео — через общую память, по имени блока и смещению.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bot.core.config import RENDER_WORKERS, RENDER_TIMEOUT_SECONDS
+from bot.utils.metrics import current_handler, observe_stage, stage_seconds
+from bot.utils.storage import disk_manager
+from bot.utils.tracing import span
+
+RENDER_MODULES = ["bot.utils.image_processing"]
+
+
+class RenderTimeout(Exception):
+    """Эффект не уложился в RENDER_TIMEOUT_SECONDS."""
+
+
+def _init_worker():
+    # Ctrl+C получает основной процесс, он и завершает пул
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for name in RENDER_MODULES:
+        __import__(name)
+
+
+def _render(effect: str, sources: list, params: dict, mode: str) -> tuple[bytes, float, float]:
+    """
+    Выполняется в воркере: рендерит эффект и кодирует результат. Возвращает PNG
+    (или SVG для mode="svg") и время обоих этапов.
+    """
+    from bot.utils.image_processing import render_effect, render_effect_svg, render_effect_tiled, save_image_to_bytes
+
+    started = time.perf_counter()
+    sources = [io.BytesIO(source) if isinstance(source, bytes) else source for source in sources]
+    if mode == "svg":
+        # SVG сразу получается текстом, отдельного этапа кодирования нет
+        return render_effect_svg(effect, sources, **params), time.perf_counter() - started, 0.0
+    image = (render_effect_tiled if mode == "tiled" else render_effect)(effect, sources, **params)
+    rendered = time.perf_counter()
+    png = save_image_to_bytes(image)
+    return png, rendered - started, time.perf_counter() - rendered
+
+
+def _render_batch(effect: str, batch: list, params: dict, mode: str) -> tuple[list[bytes], float]:
+    """Выполняется в воркере: один эффект для нескольких фото подряд, геометрия и таблицы строятся один раз."""
+    pngs, encode_seconds = [], 0.0
+    for sources in batch:
+        png, _, encoded = _render(effect, sources, params, mode)
+        pngs.append(png)
+        encode_seconds += encoded
+    return pngs, encode_seconds
+
+
+def _preprocess(image_bytes: bytes, size: int, n_shades: int):
+    from bot.utils.image_processing import process_image_to_grayscale
+
+    return process_image_to_grayscale(io.BytesIO(image_bytes), size, n_shades)[1]
+
+
+def _render_thumbnail(effect: str, gray_array, size: int, params: dict):
+    from bot.utils.image_processing import render_effect
+
+    return render_effect(effect, [gray_array], size=size, **params)
+
+
+def _contact_sheet(thumbnails: list, labels: list[str]) -> bytes:
+    from bot.utils.image_processing import create_contact_sheet, save_image_to_bytes
+
+    return save_image_to_bytes(create_contact_sheet(thumbnails, labels))
+
+
+def _spiral_animation(sources: list, output_path: str, params: dict):
+    from bot.utils.image_processing import render_spiral_animation
+
+    sources = [io.BytesIO(source) if isinstance(source, bytes) else source for source in sources]
+    render_spiral_animation(sources, output_path, **params)
+
+
+def _render_frames(effect: str, memory_name: str, offset: int, count: int, size: int, params: dict):
+    """
+    Выполняется в воркере: рендерит count кадров из блока общей памяти. По offset лежат
+    кадры оттенков серого, сразу за ними — место под RGB-результат; ничего не копируется
+    между процессами.
+    """
+    from multiprocessing import shared_memory
+
+    import numpy as np
+    from bot.utils.image_processing import render_frames
+
+    memory = shared_memory.SharedMemory(memory_name)
+    try:
+        frames = np.ndarray((count, size, size), np.uint8, memory.buf, offset)
+        output = np.ndarray((count, size, size, 3), np.uint8, memory.buf, offset + frames.nbytes)
+        render_frames(effect, frames, output, **params)
+        # Пока на буфер есть ссылки из массивов, блок нельзя закрыть
+        del frames, output
+    finally:
+        memory.close()
+
+
+def _mp_context():
+    """forkserver: воркеры форкаются от чистого процесса с предзагруженными модулями рендера."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(RENDER_MODULES)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class RenderPool:
+    """
+    Ограниченный пул процессов под эффекты: не больше задач одновременно, чем воркеров,
+    остальные ждут своей очереди в event loop'е. Упавший воркер ломает пул целиком,
+    и он пересоздаётся сразу. Пул с зависшей задачей уходит в отставку: новые задачи
+    идут в свежий пул, а его процессы останавливаются, когда доработают чужие задачи.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, timeout=RENDER_TIMEOUT_SECONDS):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self._executor = None
+        self._semaphore = None
+        self._inflight = {}  # пул -> его незавершённые задачи
+        self._retiring = {}  # пул в отставке -> задача, которая его остановит
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=_mp_context(), initializer=_init_worker)
+        return self._executor
+
+    @staticmethod
+    def _terminate(executor):
+        # В Python 3.11/3.12 нет terminate_workers(): без этого зависший рендер держал бы процесс
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _recycle(self, executor):
+        """Останавливает сломанный пул вместе с воркерами; следующая задача создаст новый."""
+        if executor is not self._executor:
+            return
+        self._executor = None
+        self._inflight.pop(executor, None)
+        self._terminate(executor)
+
+    def _retire(self, executor):
+        """
+        Отправляет пул с зависшей задачей в отставку. Убить только её воркер нельзя:
+        ProcessPoolExecutor считает пул сломанным при смерти любого процесса и роняет
+        все задачи в нём. Поэтому новые задачи идут в новый пул, а старый останавливается
+        после того, как его остальные задачи завершатся или сами упрутся в таймаут.
+        """
+        if executor is self._executor:
+            self._executor = None
+        if executor not in self._retiring:
+            self._retiring[executor] = asyncio.create_task(self._stop_when_idle(executor))
+
+    async def _stop_when_idle(self, executor):
+        while self._inflight.get(executor):
+            await asyncio.sleep(0.5)
+        self._inflight.pop(executor, None)
+        self._retiring.pop(executor, None)
+        self._terminate(executor)
+
+    async def run(self, func, *args, stage="render", timeout=None, **attrs):
+        """Выполняет func(*args) в воркере с таймаутом (по умолчанию self.timeout); attrs пишутся в span этапа."""
+        timeout = timeout or self.timeout
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        name = attrs.get("effect", func.__name__)
+        with span("render_wait", **attrs):
+            await self._semaphore.acquire()
+        try:
+            # Один повтор, если пул сломался из-за падения воркера с чужой задачей
+            for attempt in range(2):
+                executor = self._get_executor()
+                inflight = self._inflight.setdefault(executor, set())
+                task = executor.submit(func, *args)
+                inflight.add(task)
+                try:
+                    with observe_stage(stage, attempt=attempt, **attrs):
+                        return await asyncio.wait_for(asyncio.wrap_future(task), timeout)
+                except asyncio.TimeoutError:
+                    logging.error(f"Задача {name} не уложилась в {timeout}с, пул рендера уходит в отставку")
+                    self._retire(executor)
+                    raise RenderTimeout(name) from None
+                except BrokenProcessPool:
+                    logging.warning(f"Пул рендера сломан, задача {name}: попытка {attempt + 1}")
+                    self._recycle(executor)
+                    if attempt:
+                        raise
+                finally:
+                    inflight.discard(task)
+        finally:
+            self._semaphore.release()
+
+    async def render(self, effect: str, sources: list, mode: str = "image", **params) -> bytes:
+        """
+        Рендерит эффект (ключ image_processing.RENDERERS) и возвращает PNG. Источники —
+        байты фото или уже подготовленные массивы из preprocess(). mode="tiled" — высокое
+        разрешение через render_effect_tiled: по плиткам, с ограниченной памятью;
+        mode="svg" — векторный SVG через render_effect_svg.
+        """
+        png, _, encode_seconds = await self.run(_render, effect, sources, params, mode, effect=effect, mode=mode)
+        # PNG кодируется в воркере, но этап png_encode в метриках остаётся отдельным
+        stage_seconds.observe(encode_seconds, handler=current_handler.get(), stage="png_encode")
+        return png
+
+    async def render_batch(self, effect: str, batch: list, mode: str = "image", **params) -> list[bytes]:
+        """
+        Один эффект для нескольких фото (альбома): batch — список источников для
+        каждого фото, результат — PNG в том же порядке. Фото делятся между воркерами
+        поровну, каждый рендерит свою часть одной задачей: одна пересылка туда и
+        обратно, геометрия из кэша воркера, а не отдельный запуск на каждое фото.
+        """
+        parts = min(self.workers, len(batch))
+        results = await asyncio.gather(*(
+            self.run(_render_batch, effect, batch[part::parts], params, mode,
+                     timeout=self.timeout * len(batch[part::parts]), effect=effect, mode=mode,
+                     photos=len(batch[part::parts]))
+            for part in range(parts)
+        ))
+        pngs = [None] * len(batch)
+        for part, (part_pngs, encode_seconds) in enumerate(results):
+            pngs[part::parts] = part_pngs
+            stage_seconds.observe(encode_seconds, handler=current_handler.get(), stage="png_encode")
+        return pngs
+
+    async def preprocess(self, image_bytes: bytes, size: int, n_shades: int):
+        """Декодирует и квантует фото один раз; массив можно отдавать в render() для любых эффектов."""
+        return await self.run(_preprocess, image_bytes, size, n_shades, stage="preprocess")
+
+    async def contact_sheet(self, gray_array, thumbnails: dict, size: int) -> bytes:
+        """
+        Превью нескольких эффектов одним PNG: миниатюры рендерятся параллельно
+        из общего массива. thumbnails: эффект -> (подпись, параметры).
+        """
+        images = await asyncio.gather(*(
+            self.run(_render_thumbnail, effect, gray_array, size, params, effect=effect)
+            for effect, (_, params) in thumbnails.items()
+        ))
+        labels = [label for label, _ in thumbnails.values()]
+        return await self.run(_contact_sheet, list(images), labels, stage="png_encode")
+
+    async def spiral_animation(self, sources: list, output_path: str, **params):
+        """
+        Анимация рисования спирали: кадры рендерятся инкрементально и идут в ffmpeg
+        через stdin прямо в воркере, на диск попадает только готовое видео в output_path.
+        """
+        await self.run(_spiral_animation, sources, output_path, params, effect="spiral_animation")
+        disk_manager.add(output_path)
+
+    async def render_frames(self, effect: str, memory_name: str, offset: int, count: int, size: int, **params):
+        """Рендерит пачку кадров видео в общей памяти на месте, см. _render_frames."""
+        await self.run(_render_frames, effect, memory_name, offset, count, size, params, effect=effect, frames=count)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        for executor, stopper in list(self._retiring.items()):
+            stopper.cancel()
+            self._terminate(executor)
+        self._retiring.clear()
+        self._inflight.clear()
+
+
+render_pool = RenderPool()
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from bot.core.config import DITHER, DOWNLOADS_DIR, EFFECT_CACHE_MEMORY_ITEMS, EFFECT_CACHE_MAX_ROWS, TONE_MAPPING
+from bot.utils.metrics import record_cache
+from bot.utils.storage import disk_manager
+
+# Увеличить, когда меняется внешний вид эффектов: старые file_id перестанут находиться
+CACHE_VERSION = 2
+# Файлы, которые SQLite создаёт рядом с базой в разных режимах журнала
+SQLITE_SIDECARS = ("", "-journal", "-wal", "-shm")
+
+
+class EffectResultCache:
+    """
+    Кэш готовых эффектов: фото (file_unique_id) + эффект + параметры -> file_id
+    отправленного результата. Повторный запрос — один send_photo по file_id без
+    рендера. Горячие ключи лежат в LRU в памяти, все — в SQLite в папке загрузок,
+    поэтому кэш переживает перезапуск. Файлы базы защищены от уборщика с момента
+    создания объекта — ещё до уборки при старте, а не с первого обращения к кэшу.
+    """
+
+    def __init__(self, path=None, memory_items=EFFECT_CACHE_MEMORY_ITEMS, max_rows=EFFECT_CACHE_MAX_ROWS):
+        self.path = path or os.path.join(DOWNLOADS_DIR, "effect_cache.sqlite3")
+        self.memory_items = memory_items
+        self.max_rows = max_rows
+        self._memory = OrderedDict()  # ключ -> file_id
+        self._db = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        for suffix in SQLITE_SIDECARS:
+            disk_manager.protect(self.path + suffix)
+
+    @staticmethod
+    def key(file_unique_id: str, effect: str, params: dict) -> str:
+        # Настройки квантования оттенков из конфига тоже меняют вид результата
+        payload = json.dumps([CACHE_VERSION, TONE_MAPPING, DITHER, file_unique_id, effect, sorted(params.items())],
+                             default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, file_id TEXT NOT NULL, used_at REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)")
+        return self._db
+
+    def _remember(self, key: str, file_id: str):
+        self._memory[key] = file_id
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> str | None:
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT file_id FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE results SET used_at = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+        return row[0] if row else None
+
+    def _store(self, key: str, file_id: str):
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO results (key, file_id, used_at) VALUES (?, ?, ?)",
+                       (key, file_id, time.time()))
+            self._writes += 1
+            # Изредка подрезаем самые давно не использованные записи
+            if self._writes % 1000 == 0:
+                db.execute("DELETE FROM results WHERE key IN "
+                           "(SELECT key FROM results ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+            db.commit()
+
+    def _delete(self, key: str):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM results WHERE key = ?", (key,))
+            db.commit()
+
+    async def get(self, key: str) -> str | None:
+        file_id = self._memory.get(key)
+        if file_id is None:
+            try:
+                file_id = await asyncio.to_thread(self._load, key)
+            except sqlite3.Error as e:
+                logging.error(f"Кэш эффектов: ошибка чтения: {e}")
+            if file_id is not None:
+                self._remember(key, file_id)
+        else:
+            self._memory.move_to_end(key)
+        record_cache("effect_result", file_id is not None)
+        return file_id
+
+    async def put(self, key: str, file_id: str):
+        self._remember(key, file_id)
+        try:
+            await asyncio.to_thread(self._store, key, file_id)
+        except sqlite3.Error as e:
+            logging.error(f"Кэш эффектов: ошибка записи: {e}")
+
+    async def invalidate(self, key: str):
+        """Убирает запись, например если Telegram больше не принимает file_id."""
+        self._memory.pop(key, None)
+        try:
+            await asyncio.to_thread(self._delete, key)
+        except sqlite3.Error as e:
+            logging.error(f"Кэш эффектов: ошибка удаления: {e}")
+
+
+effect_cache = EffectResultCache()
@@ -0,0 +1,267 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+from aiogram import types
+
+from bot.core.config import (
+    DOWNLOAD_RESERVE_BYTES,
+    SCHEDULER_HEAVY_SLOTS,
+    SCHEDULER_LIGHT_SLOTS,
+    MAX_ACTIVE_JOBS_PER_USER,
+    MAX_ACTIVE_JOBS_PER_CHAT,
+    MAX_QUEUED_JOBS_PER_USER,
+    MAX_QUEUED_JOBS,
+)
+from bot.utils.metrics import current_handler
+from bot.utils.storage import disk_manager
+from bot.utils.tracing import new_trace, span
+
+# Стоимость задачи в "виртуальном времени" WFQ: тяжёлые задачи (скачивание,
+# ffmpeg) двигают виртуальные часы пользователя сильнее, чем лёгкие (эффекты).
+JOB_COSTS = {
+    "light": 1.0,
+    "heavy": 10.0,
+}
+
+
+class QueueFull(Exception):
+    """Очередь пользователя или общая очередь переполнена."""
+
+
+class _Job:
+    __slots__ = ("user_id", "chat_id", "kind", "future")
+
+    def __init__(self, user_id, chat_id, kind, future):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.kind = kind
+        self.future = future
+
+
+class FairScheduler:
+    """
+    Планировщик задач с взвешенной справедливой очередью (WFQ) по пользователям.
+
+    Лёгкие и тяжёлые задачи идут по отдельным полосам со своими слотами,
+    поэтому эффекты для картинок не ждут чужих часовых загрузок с YouTube.
+    Внутри полосы следующей запускается задача с наименьшим виртуальным
+    временем окончания среди тех, чей пользователь и чат не упёрлись в лимит.
+    """
+
+    def __init__(self, slots=None, max_per_user=MAX_ACTIVE_JOBS_PER_USER,
+                 max_per_chat=MAX_ACTIVE_JOBS_PER_CHAT,
+                 max_queued_per_user=MAX_QUEUED_JOBS_PER_USER,
+                 max_queued=MAX_QUEUED_JOBS):
+        self.slots = slots or {"light": SCHEDULER_LIGHT_SLOTS, "heavy": SCHEDULER_HEAVY_SLOTS}
+        self.max_per_user = max_per_user
+        self.max_per_chat = max_per_chat
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued = max_queued
+        self.weights = {}
+
+        self._virtual_time = {kind: 0.0 for kind in self.slots}
+        self._last_finish = defaultdict(float)  # (kind, user_id) -> виртуальное время
+        self._queues = {kind: [] for kind in self.slots}  # куча (finish_tag, seq, start_tag, job)
+        self._seq = itertools.count()
+        self._active = {kind: 0 for kind in self.slots}
+        self._active_users = defaultdict(int)  # (kind, user_id) -> число задач
+        self._active_chats = defaultdict(int)  # (kind, chat_id) -> число задач
+        self._queued_users = defaultdict(int)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def set_weight(self, user_id, weight: float):
+        """Задаёт вес пользователя: чем больше вес, тем большая доля слотов ему достаётся."""
+        self.weights[user_id] = max(weight, 0.01)
+
+    def stats(self) -> dict:
+        """Возвращает текущие глубины очередей и число активных задач по полосам."""
+        return {
+            kind: {"active": self._active[kind], "queued": len(self._queues[kind])}
+            for kind in self.slots
+        }
+
+    def queued_count(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def position(self, future) -> int:
+        """Позиция задачи в своей полосе (1 — следующая на запуск), 0 если уже не в очереди."""
+        for queue in self._queues.values():
+            ordered = sorted(queue, key=lambda item: item[:2])
+            for index, (_, _, _, job) in enumerate(ordered, 1):
+                if job.future is future:
+                    return index
+        return 0
+
+    def _can_start(self, job) -> bool:
+        return (
+            self._active_users[(job.kind, job.user_id)] < self.max_per_user
+            and self._active_chats[(job.kind, job.chat_id)] < self.max_per_chat
+        )
+
+    def _start(self, job):
+        self._active[job.kind] += 1
+        self._active_users[(job.kind, job.user_id)] += 1
+        self._active_chats[(job.kind, job.chat_id)] += 1
+        job.future.set_result(None)
+
+    def _dispatch(self, kind):
+        queue = self._queues[kind]
+        while queue and self._active[kind] < self.slots[kind]:
+            # Ищем самую раннюю по виртуальному времени задачу, которую можно запустить.
+            skipped = []
+            chosen = None
+            while queue:
+                item = heapq.heappop(queue)
+                if self._can_start(item[3]):
+                    chosen = item
+                    break
+                skipped.append(item)
+            for item in skipped:
+                heapq.heappush(queue, item)
+            if chosen is None:
+                return
+            _, _, start_tag, job = chosen
+            self._queued_users[job.user_id] -= 1
+            self._virtual_time[kind] = max(self._virtual_time[kind], start_tag)
+            self._start(job)
+
+    def submit(self, user_id, chat_id, kind="heavy") -> asyncio.Future:
+        """Ставит задачу в очередь. Возвращает future, который завершится, когда задаче выдан слот."""
+        if kind not in self.slots:
+            raise ValueError(f"Неизвестный тип задачи: {kind}")
+        if self._queued_users[user_id] >= self.max_queued_per_user or self.queued_count() >= self.max_queued:
+            raise QueueFull(f"Очередь переполнена для пользователя {user_id}")
+
+        weight = self.weights.get(user_id, 1.0)
+        start_tag = max(self._virtual_time[kind], self._last_finish[(kind, user_id)])
+        finish_tag = start_tag + JOB_COSTS[kind] / weight
+        self._last_finish[(kind, user_id)] = finish_tag
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(user_id, chat_id, kind, future)
+        self._queued_users[user_id] += 1
+        heapq.heappush(self._queues[kind], (finish_tag, next(self._seq), start_tag, job))
+        self._idle.clear()
+        self._dispatch(kind)
+        return future
+
+    def _withdraw(self, future, user_id, kind):
+        """Убирает из очереди задачу, которую отменили до получения слота."""
+        queue = self._queues[kind]
+        queue[:] = [item for item in queue if item[3].future is not future]
+        heapq.heapify(queue)
+        self._queued_users[user_id] -= 1
+        self._update_idle()
+
+    def _update_idle(self):
+        if not any(self._active.values()) and not self.queued_count():
+            self._idle.set()
+
+    def release(self, user_id, chat_id, kind="heavy"):
+        """Освобождает слот завершившейся задачи и запускает следующие из очереди."""
+        self._active[kind] -= 1
+        self._active_users[(kind, user_id)] -= 1
+        self._active_chats[(kind, chat_id)] -= 1
+        self._dispatch(kind)
+        self._update_idle()
+
+    async def drain(self):
+        """Ждёт, пока не останется ни активных, ни ожидающих задач."""
+        await self._idle.wait()
+
+    @asynccontextmanager
+    async def slot(self, user_id, chat_id, kind="heavy", on_queued=None):
+        """Контекстный менеджер: ждёт слот, выполняет тело и освобождает слот."""
+        future = self.submit(user_id, chat_id, kind)
+        try:
+            with span("queue_wait", lane=kind, queued=not future.done()):
+                if not future.done() and on_queued is not None:
+                    await on_queued(self.position(future))
+                await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release(user_id, chat_id, kind)
+            else:
+                self._withdraw(future, user_id, kind)
+            raise
+        try:
+            yield
+        finally:
+            self.release(user_id, chat_id, kind)
+
+
+scheduler = FairScheduler()
+
+
+def _job_origin(args, kwargs):
+    """
+    Находит в аргументах хэндлера сообщение или callback, по которым определяется владелец
+    задачи. Возвращает (user_id, chat_id, функция ответа пользователю текстом).
+    """
+    for value in itertools.chain(args, kwargs.values()):
+        if isinstance(value, types.CallbackQuery):
+            if value.message is None:
+                # Кнопка под inline-сообщением: чата нет, отвечаем пользователю в личку
+                user_id = value.from_user.id
+                return user_id, user_id, functools.partial(value.bot.send_message, user_id)
+            return value.from_user.id, value.message.chat.id, value.message.answer
+        if isinstance(value, types.Message):
+            return value.from_user.id, value.chat.id, value.answer
+    return None, None, None
+
+
+@contextmanager
+def job_trace(handler_name: str, user_id: int, chat_id: int, **attrs):
+    """
+    Новая трасса с корневым span "job" для задачи пользователя. Её открывает fair_job,
+    а хэндлеры вне планировщика (например, приём фото) — сами.
+    """
+    current_handler.set(handler_name)
+    trace_id = new_trace()
+    logging.info(f"Задача {handler_name} пользователя {user_id}: trace {trace_id}")
+    with span("job", handler=handler_name, user_id=user_id, chat_id=chat_id, **attrs) as job:
+        yield job
+
+
+def fair_job(kind="heavy"):
+    """Декоратор хэндлера: выполняет его только после получения слота в планировщике."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            user_id, chat_id, answer = _job_origin(args, kwargs)
+            if user_id is None:
+                current_handler.set(handler.__name__)
+                return await handler(*args, **kwargs)
+            with job_trace(handler.__name__, user_id, chat_id, lane=kind):
+                return await _run_scheduled(handler, kind, user_id, chat_id, answer, args, kwargs)
+        return wrapper
+    return decorator
+
+
+async def _run_scheduled(handler, kind, user_id, chat_id, answer, args, kwargs):
+    """Ждёт слот в планировщике и выполняет хэндлер; отвечает пользователю про очередь и нехватку места."""
+
+    async def notify_queued(position):
+        await answer(f"⏳ Задача поставлена в очередь (позиция {position}). Начну, как только освободится место.")
+
+    state = kwargs.get("state")
+    try:
+        async with scheduler.slot(user_id, chat_id, kind, on_queued=notify_queued):
+            if kind == "heavy" and not await asyncio.to_thread(disk_manager.ensure_space, DOWNLOAD_RESERVE_BYTES):
+                logging.warning(f"Нет места на диске, задача пользователя {user_id} отклонена")
+                await answer("🗄 Хранилище бота заполнено. Попробуйте немного позже.")
+                if state is not None:
+                    await state.clear()
+                return
+            return await handler(*args, **kwargs)
+    except QueueFull:
+        logging.warning(f"Очередь переполнена, задача пользователя {user_id} отклонена")
+        await answer("🚦 Слишком много задач в очереди. Дождитесь завершения текущих и попробуйте снова.")
+        if state is not None:
+            await state.clear()
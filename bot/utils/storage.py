@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+
+from bot.core.config import (
+    DOWNLOADS_DIR,
+    DOWNLOADS_BUDGET_BYTES,
+    ORPHAN_TTL_SECONDS,
+    JANITOR_INTERVAL_SECONDS,
+    MIN_DISK_FREE_BYTES,
+)
+
+
+def _entry_size_and_mtime(path: str) -> tuple[int, float]:
+    """Возвращает суммарный размер и самое свежее время изменения файла или папки."""
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    total, newest = 0, os.stat(path).st_mtime
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
+
+
+def _remove_entry(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+
+class DiskManager:
+    """
+    Следит за размером ./downloads: держит байтовый бюджет и вычищает осиротевшие
+    файлы старше TTL. Занятое место — текущий итог, а не обход дерева на каждый
+    запрос: его пересчитывает каждый проход уборщика, а между проходами итог
+    поправляют готовые файлы (add) и удалённые рабочие папки (release_path).
+    Итог ведётся по записям верхнего уровня, поэтому папка задачи при удалении
+    вычитает ровно то, что было за ней учтено.
+    """
+
+    def __init__(self, root=DOWNLOADS_DIR, budget_bytes=DOWNLOADS_BUDGET_BYTES,
+                 ttl_seconds=ORPHAN_TTL_SECONDS, min_disk_free=MIN_DISK_FREE_BYTES):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.ttl_seconds = ttl_seconds
+        self.min_disk_free = min_disk_free
+        self._protected = set()
+        self._used_bytes = None  # до первого прохода уборщика неизвестно
+        self._counted = {}  # запись верхнего уровня -> учтённые за ней байты
+        self._lock = threading.Lock()
+
+    def protect(self, path: str):
+        """Исключает путь из уборки (например, файлы, которые держит открытыми сам бот)."""
+        self._protected.add(os.path.abspath(path))
+
+    def unprotect(self, path: str):
+        self._protected.discard(os.path.abspath(path))
+
+    def _is_protected(self, path: str) -> bool:
+        return os.path.abspath(path) in self._protected
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [os.path.join(self.root, name) for name in os.listdir(self.root)]
+
+    def _top_entry(self, path: str) -> str | None:
+        """Запись верхнего уровня в root, внутри которой лежит path; None, если path вне root."""
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        if relative == os.curdir or relative.startswith(os.pardir):
+            return None
+        return os.path.join(os.path.abspath(self.root), relative.split(os.sep)[0])
+
+    def add(self, path: str):
+        """
+        Учитывает готовый файл до следующего прохода уборщика. Вызывается, когда файл
+        дописан; файлы вне root (например, scratch на tmpfs) не учитываются.
+        """
+        entry = self._top_entry(path)
+        if entry is None:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            self._counted[entry] = self._counted.get(entry, 0) + size
+            if self._used_bytes is not None:
+                self._used_bytes += size
+
+    def release_path(self, path: str):
+        """Вычитает всё, что учтено за файлом или папкой верхнего уровня, которые сейчас будут удалены."""
+        entry = self._top_entry(path)
+        with self._lock:
+            size = self._counted.pop(entry, 0)
+            if self._used_bytes is not None:
+                self._used_bytes = max(self._used_bytes - size, 0)
+
+    def used_bytes(self) -> int:
+        if self._used_bytes is None:
+            self.sweep(ttl_seconds=float("inf"))
+        return self._used_bytes
+
+    def usage(self) -> dict:
+        """Статистика занятого места в рабочей папке и на диске."""
+        used = self.used_bytes()
+        disk = shutil.disk_usage(self.root if os.path.isdir(self.root) else ".")
+        return {
+            "root": self.root,
+            "used_bytes": used,
+            "budget_bytes": self.budget_bytes,
+            "budget_free_bytes": max(self.budget_bytes - used, 0),
+            "entries": len(self._entries()),
+            "disk_free_bytes": disk.free,
+        }
+
+    def available_bytes(self) -> int:
+        """Сколько ещё можно записать, не выходя ни за бюджет, ни за резерв свободного места на диске."""
+        usage = self.usage()
+        return max(min(usage["budget_free_bytes"], usage["disk_free_bytes"] - self.min_disk_free), 0)
+
+    def ensure_space(self, needed_bytes: int) -> bool:
+        """Проверяет, что под задачу есть needed_bytes."""
+        return self.available_bytes() >= needed_bytes
+
+    def sweep(self, ttl_seconds=None) -> tuple[int, int]:
+        """
+        Удаляет осиротевшие файлы и папки старше TTL и заодно пересчитывает занятое
+        место по оставшимся. Возвращает (число удалённых, байт).
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        deadline = time.time() - ttl
+        removed, freed, counted = 0, 0, {}
+        for path in self._entries():
+            try:
+                size, mtime = _entry_size_and_mtime(path)
+                if self._is_protected(path) or mtime > deadline:
+                    counted[os.path.abspath(path)] = size
+                    continue
+                _remove_entry(path)
+            except OSError as e:
+                logging.error(f"Уборщик: не удалось удалить {path}: {e}")
+                continue
+            removed += 1
+            freed += size
+            logging.info(f"Уборщик: удалён осиротевший {path} ({size // 1024} КБ)")
+        with self._lock:
+            self._counted = counted
+            self._used_bytes = sum(counted.values())
+        return removed, freed
+
+    async def run_janitor(self, interval=JANITOR_INTERVAL_SECONDS):
+        """Фоновая задача: периодически чистит папку и пишет статистику в лог."""
+        while True:
+            try:
+                removed, freed = await asyncio.to_thread(self.sweep)
+                usage = await asyncio.to_thread(self.usage)
+                logging.info(
+                    f"Уборщик: удалено {removed} ({freed // 1024 // 1024} МБ), занято "
+                    f"{usage['used_bytes'] // 1024 // 1024}/{usage['budget_bytes'] // 1024 // 1024} МБ"
+                )
+            except Exception as e:
+                logging.error(f"Ошибка уборщика: {e}")
+            await asyncio.sleep(interval)
+
+
+disk_manager = DiskManager()
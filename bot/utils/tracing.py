@@ -0,0 +1,191 @@
+"""
+Трассировка задач: у каждой задачи свой trace id, каждый этап пишет span в JSONL.
+
+Отчёты по файлу трасс:
+    python -m bot.utils.tracing critical-path <trace_id>
+    python -m bot.utils.tracing stats --since 3600
+"""
+
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+
+from bot.core.config import TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUP_COUNT
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+_trace_logger = None
+
+
+def _get_trace_logger():
+    """Отдельный логгер с ротацией: по строке JSON на span, без форматирования и без проброса в общий лог."""
+    global _trace_logger
+    if _trace_logger is None:
+        logger = logging.getLogger("bot.trace")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if TRACE_FILE:
+            os.makedirs(os.path.dirname(os.path.abspath(TRACE_FILE)), exist_ok=True)
+            handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT,
+                                          encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        else:
+            logger.addHandler(logging.NullHandler())
+        _trace_logger = logger
+    return _trace_logger
+
+
+def new_trace() -> str:
+    """Начинает новую трассу в текущем контексте и возвращает её id."""
+    trace_id = uuid.uuid4().hex[:16]
+    current_trace.set(trace_id)
+    current_span.set(None)
+    return trace_id
+
+
+class Span:
+    """Этап задачи. Атрибуты (bytes, exit_code, attempt...) можно дописать через set() до завершения."""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = None
+        self.start = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.parent_id = current_span.get()
+        self._token = current_span.set(self.span_id)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.time()
+        current_span.reset(self._token)
+        trace_id = current_trace.get()
+        if trace_id is None:
+            return False
+        record = {
+            "trace_id": trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "end": round(end, 6),
+            "duration": round(end - self.start, 6),
+            **self.attrs,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        try:
+            _get_trace_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+        except Exception as e:
+            logging.warning(f"Не удалось записать span {self.name}: {e}")
+        return False
+
+
+span = Span
+
+
+# --- CLI ---
+
+def load_spans(path=TRACE_FILE, since=None) -> list[dict]:
+    """Читает спаны из файла трасс и его ротированных копий."""
+    spans = []
+    for filename in sorted(glob.glob(f"{path}*")):
+        with open(filename, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or record.get("start", 0) >= since:
+                    spans.append(record)
+    return spans
+
+
+def critical_path(spans: list[dict]) -> list[dict]:
+    """
+    Критический путь задачи: идём от конца корневого span назад и каждый раз берём
+    дочерний этап, закончившийся последним до текущей точки.
+    """
+    roots = [s for s in spans if s["parent_id"] is None]
+    if not roots:
+        return []
+    root = max(roots, key=lambda s: s["duration"])
+    children = sorted((s for s in spans if s["parent_id"] == root["span_id"]), key=lambda s: s["end"])
+    path, cursor = [], root["end"]
+    for child in reversed(children):
+        if child["end"] <= cursor + 1e-6:
+            path.append(child)
+            cursor = child["start"]
+    return [root] + list(reversed(path))
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _cmd_critical_path(args):
+    spans = [s for s in load_spans(args.file) if s["trace_id"] == args.trace_id]
+    if not spans:
+        print(f"Трасса {args.trace_id} не найдена")
+        return 1
+    path = critical_path(spans)
+    root = path[0]
+    print(f"Задача {args.trace_id}: {root.get('handler', root['name'])}, всего {root['duration']:.2f}с")
+    covered = 0.0
+    for s in path[1:]:
+        covered += s["duration"]
+        extra = ", ".join(f"{k}={s[k]}" for k in ("attempt", "bytes", "exit_code", "error") if k in s)
+        print(f"  +{s['start'] - root['start']:8.2f}с  {s['name']:<12} {s['duration']:8.2f}с  {extra}")
+    print(f"  вне этапов (ожидание, сообщения, паузы): {max(root['duration'] - covered, 0):.2f}с")
+    return 0
+
+
+def _cmd_stats(args):
+    since = time.time() - args.since if args.since else None
+    by_stage = {}
+    for s in load_spans(args.file, since=since):
+        by_stage.setdefault(s["name"], []).append(s["duration"])
+    if not by_stage:
+        print("Нет спанов за указанный период")
+        return 1
+    print(f"{'этап':<14}{'кол-во':>8}{'p50, с':>10}{'p95, с':>10}{'макс, с':>10}")
+    for name, durations in sorted(by_stage.items()):
+        print(f"{name:<14}{len(durations):>8}{_percentile(durations, 0.5):>10.2f}"
+              f"{_percentile(durations, 0.95):>10.2f}{max(durations):>10.2f}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчёты по трассам задач бота")
+    parser.add_argument("--file", default=TRACE_FILE, help="JSONL-файл трасс")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cp = sub.add_parser("critical-path", help="критический путь одной задачи")
+    cp.add_argument("trace_id")
+    cp.set_defaults(func=_cmd_critical_path)
+    st = sub.add_parser("stats", help="p50/p95 по этапам")
+    st.add_argument("--since", type=int, default=3600, help="окно в секундах (0 — всё время)")
+    st.set_defaults(func=_cmd_stats)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
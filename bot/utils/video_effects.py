@@ -0,0 +1,175 @@
+"""
+Эффекты для видео: каждый кадр рисуется теми же рендерерами, что и фото.
+
+Первый ffmpeg декодирует видео сразу в сырые квадратные кадры оттенков серого
+нужного размера и частоты. Кадры пачками кладутся в общую память
+(multiprocessing.shared_memory), воркеры пула рендера рисуют пачки параллельно
+прямо в ней, а готовые RGB-кадры по порядку уходят в stdin второго ffmpeg,
+который кодирует H.264 и берёт звук из исходника. Ни один кадр не пишется на
+диск, между процессами передаются только имя блока памяти и смещения.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from multiprocessing import shared_memory
+
+from bot.core.config import VIDEO_EFFECT_BATCH_FRAMES, VIDEO_EFFECT_FPS, VIDEO_EFFECT_MAX_SECONDS
+from bot.utils.metrics import errors_total, ffmpeg_active, observe_stage
+from bot.utils.render_pool import render_pool
+from bot.utils.storage import disk_manager
+
+
+class VideoEffectError(Exception):
+    """ffmpeg не смог декодировать или закодировать видео."""
+
+
+def _decode_command(input_path: str, size: int, fps: int, max_seconds: int) -> list[str]:
+    # Центральный квадрат, как у кружков, сразу в нужном размере и в оттенках серого
+    filters = f"crop=min(iw\\,ih):min(iw\\,ih),scale={size}:{size},fps={fps},format=gray"
+    return ["ffmpeg", "-v", "error", "-t", str(max_seconds), "-i", input_path, "-an", "-vf", filters,
+            "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"]
+
+
+def _encode_command(input_path: str, output_path: str, size: int, fps: int, max_seconds: int) -> list[str]:
+    # Видео из pipe:0, звук (если есть) из исходного файла
+    return ["ffmpeg", "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size}x{size}",
+            "-r", str(fps), "-i", "pipe:0", "-t", str(max_seconds), "-i", input_path,
+            "-map", "0:v", "-map", "1:a?", "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "64k", "-shortest", "-movflags", "+faststart",
+            output_path]
+
+
+class _FFmpegProcess:
+    """ffmpeg с каналами в event loop'е; stderr читается в фоне, чтобы поток ошибок не заблокировал процесс."""
+
+    def __init__(self, process: asyncio.subprocess.Process, stage: str):
+        self.process = process
+        self.stage = stage
+        self._stderr = asyncio.ensure_future(process.stderr.read())
+        self._active = True
+
+    @classmethod
+    async def start(cls, command: list[str], stage: str, **pipes):
+        process = await asyncio.create_subprocess_exec(*command, stderr=asyncio.subprocess.PIPE, **pipes)
+        ffmpeg_active.inc()
+        return cls(process, stage)
+
+    async def finish(self):
+        """Ждёт завершения; ненулевой код возврата — VideoEffectError с концом stderr."""
+        try:
+            returncode = await self.process.wait()
+            stderr = await self._stderr
+        finally:
+            self.kill()
+        if returncode != 0:
+            errors_total.inc(stage=self.stage, type="NonZeroExit")
+            raise VideoEffectError(f"ffmpeg ({self.stage}): {stderr.decode(errors='replace')[-500:]}")
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+        if not self._stderr.done():
+            self._stderr.cancel()
+        if self._active:
+            self._active = False
+            ffmpeg_active.dec()
+
+
+class _FrameSlots:
+    """
+    Блок общей памяти из нескольких слотов. Слот — пачка до batch кадров оттенков
+    серого и место под те же кадры в RGB сразу за ними (см. render_pool._render_frames).
+    """
+
+    def __init__(self, slots: int, batch: int, size: int):
+        self.batch = batch
+        self.size = size
+        self.frame_bytes = size * size
+        self.slot_bytes = batch * self.frame_bytes * 4
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self.free = deque(range(slots))
+
+    def offset(self, slot: int) -> int:
+        return slot * self.slot_bytes
+
+    async def read(self, slot: int, stream: asyncio.StreamReader) -> int:
+        """Читает из декодера до batch кадров в слот; возвращает число целых кадров, 0 — конец видео."""
+        position, end = self.offset(slot), self.offset(slot) + self.batch * self.frame_bytes
+        while position < end:
+            chunk = await stream.read(end - position)
+            if not chunk:
+                break
+            self.memory.buf[position:position + len(chunk)] = chunk
+            position += len(chunk)
+        return (position - self.offset(slot)) // self.frame_bytes
+
+    def rendered(self, slot: int, count: int) -> memoryview:
+        start = self.offset(slot) + self.batch * self.frame_bytes
+        return self.memory.buf[start:start + count * self.frame_bytes * 3]
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+async def apply_effect_to_video(input_path: str, output_path: str, effect: str, size: int, fps=VIDEO_EFFECT_FPS,
+                                max_seconds=VIDEO_EFFECT_MAX_SECONDS, **params) -> int:
+    """
+    Применяет эффект (ключ image_processing.LAYERS) к каждому кадру видео и пишет в
+    output_path квадратное видео size x size со звуком исходника. params — параметры
+    эффекта и image_processing.render_frames. Возвращает число кадров.
+    """
+    # Вдвое больше слотов, чем воркеров: пока одни пачки рендерятся, следующие уже декодированы
+    slots = _FrameSlots(2 * render_pool.workers, VIDEO_EFFECT_BATCH_FRAMES, size)
+    pending = deque()  # (слот, кадров, задача рендера) в порядке кадров
+    frames = 0
+    decoder = encoder = None
+    with observe_stage("video_effect", effect=effect, size=size, fps=fps) as observed:
+        try:
+            decoder = await _FFmpegProcess.start(_decode_command(input_path, size, fps, max_seconds), "decode",
+                                                 stdout=asyncio.subprocess.PIPE)
+            encoder = await _FFmpegProcess.start(_encode_command(input_path, output_path, size, fps, max_seconds),
+                                                 "encode", stdin=asyncio.subprocess.PIPE)
+            try:
+                while True:
+                    if not slots.free:
+                        await _write_rendered(slots, pending.popleft(), encoder)
+                    slot = slots.free.popleft()
+                    count = await slots.read(slot, decoder.process.stdout)
+                    if not count:
+                        break
+                    render = asyncio.ensure_future(render_pool.render_frames(
+                        effect, slots.memory.name, slots.offset(slot), count, size, **params))
+                    pending.append((slot, count, render))
+                    frames += count
+                while pending:
+                    await _write_rendered(slots, pending.popleft(), encoder)
+                encoder.process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                # Кодировщик завершился раньше времени, причина — в его stderr
+                logging.warning("ffmpeg-кодировщик эффекта для видео закрыл вход")
+            await encoder.finish()
+            await decoder.finish()
+            disk_manager.add(output_path)
+            observed.set(frames=frames)
+        finally:
+            for _, _, render in pending:
+                render.cancel()
+            await asyncio.gather(*(render for _, _, render in pending), return_exceptions=True)
+            for process in (decoder, encoder):
+                if process is not None:
+                    process.kill()
+            slots.close()
+    if not frames:
+        raise VideoEffectError("в видео нет кадров")
+    return frames
+
+
+async def _write_rendered(slots: _FrameSlots, item: tuple, encoder: _FFmpegProcess):
+    """Дожидается рендера пачки, отдаёт её кадры кодировщику и освобождает слот."""
+    slot, count, render = item
+    await render
+    encoder.process.stdin.write(slots.rendered(slot, count))
+    await encoder.process.stdin.drain()
+    slots.free.append(slot)
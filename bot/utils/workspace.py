@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+
+from bot.core.config import DOWNLOADS_DIR, JOB_TMPFS_DIR, JOB_TMPFS_MIN_FREE_BYTES
+from bot.utils.storage import DiskManager, disk_manager
+
+# Корень для короткоживущих файлов в RAM (tmpfs). Пустая строка в конфиге отключает tmpfs.
+SCRATCH_ROOT = os.path.join(JOB_TMPFS_DIR, "tg_bot_scratch") if JOB_TMPFS_DIR else ""
+
+
+def _tmpfs_available() -> bool:
+    return bool(SCRATCH_ROOT) and os.path.isdir(JOB_TMPFS_DIR) and os.access(JOB_TMPFS_DIR, os.W_OK)
+
+
+def _remove_atomically(path: str):
+    """Сначала переименовывает папку, затем удаляет: наполовину удалённая папка никогда не видна под исходным именем."""
+    if not path or not os.path.exists(path):
+        return
+    trash = os.path.join(os.path.dirname(path), f".trash-{uuid.uuid4().hex}")
+    try:
+        os.rename(path, trash)
+    except OSError:
+        trash = path
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+class JobWorkspace:
+    """
+    Собственная папка задачи. Имена файлов внутри фиксированные ("video.mp4"),
+    а сама папка уникальна, поэтому параллельные задачи одного чата не пересекаются.
+    Мелкие промежуточные файлы можно класть в scratch на tmpfs.
+    """
+
+    def __init__(self, prefix: str):
+        os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+        self.dir = tempfile.mkdtemp(prefix=f"job_{prefix}_", dir=DOWNLOADS_DIR)
+        self._prefix = prefix
+        self._scratch_dir = None
+        disk_manager.protect(self.dir)
+
+    def path(self, name: str) -> str:
+        """Путь к файлу в папке задачи на диске."""
+        return os.path.join(self.dir, name)
+
+    def scratch(self, name: str, expected_bytes: int = 0) -> str:
+        """Путь к промежуточному файлу: на tmpfs, если там хватает места, иначе в папке задачи."""
+        return os.path.join(self.scratch_dir(expected_bytes), name)
+
+    def scratch_dir(self, expected_bytes: int = 0) -> str:
+        if self._scratch_dir is None:
+            if _tmpfs_available() and shutil.disk_usage(JOB_TMPFS_DIR).free - expected_bytes > JOB_TMPFS_MIN_FREE_BYTES:
+                os.makedirs(SCRATCH_ROOT, exist_ok=True)
+                self._scratch_dir = tempfile.mkdtemp(prefix=f"job_{self._prefix}_", dir=SCRATCH_ROOT)
+            else:
+                self._scratch_dir = os.path.join(self.dir, "scratch")
+                os.makedirs(self._scratch_dir, exist_ok=True)
+        return self._scratch_dir
+
+    def cleanup_sync(self):
+        if self._scratch_dir and not self._scratch_dir.startswith(self.dir):
+            _remove_atomically(self._scratch_dir)
+        disk_manager.release_path(self.dir)
+        _remove_atomically(self.dir)
+        disk_manager.unprotect(self.dir)
+        logging.info(f"Рабочая папка задачи {self.dir} удалена.")
+
+    async def cleanup(self):
+        """Удаляет папку задачи и её scratch целиком."""
+        await asyncio.to_thread(self.cleanup_sync)
+
+
+@asynccontextmanager
+async def job_workspace(prefix: str):
+    """Создаёт рабочую папку на время задачи и гарантированно удаляет её по выходу."""
+    workspace = JobWorkspace(prefix)
+    try:
+        yield workspace
+    finally:
+        await workspace.cleanup()
+
+
+def sweep_scratch():
+    """Чистит осиротевшие scratch-папки на tmpfs (например, после os.execv)."""
+    if not _tmpfs_available() or not os.path.isdir(SCRATCH_ROOT):
+        return 0, 0
+    return DiskManager(root=SCRATCH_ROOT, budget_bytes=0, min_disk_free=0).sweep()
@@ -1,14 +1,23 @@
+from bot.core.startup import startup_report  # Первым: отсюда отсчитывается время холодного старта
+
 import asyncio
 import logging
 import os
 import sys
-import subprocess
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from bot.core.config import BOT_TOKEN
+from bot.core.config import BOT_TOKEN, DOWNLOADS_DIR
+from bot.core.updater import Handover, Updater, release_process
 from bot.handlers import register_all_handlers
 
+from bot.utils.metrics import start_metrics_server
 from bot.utils.processing import check_ffmpeg_installed
+from bot.utils.render_pool import render_pool
+from bot.utils.scheduler import scheduler
+from bot.utils.storage import disk_manager
+from bot.utils.workspace import sweep_scratch
+
+startup_report.mark("imports")
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -16,56 +25,21 @@ logging.basicConfig(level=logging.INFO)
 
 
 
-if not os.path.exists("./downloads"):
-    os.makedirs("./downloads")
+if not os.path.exists(DOWNLOADS_DIR):
+    os.makedirs(DOWNLOADS_DIR)
 
 bot = Bot(
     token=BOT_TOKEN,
     default=DefaultBotProperties(parse_mode='HTML')
 )
 dp = Dispatcher()
+bot.session.middleware(startup_report.request_middleware())
 
 
-async def check_for_updates():
-    """Checks for and applies updates from the Git repository."""
-    try:
-        # 1. Проверяем, являемся ли мы в Git-репозитории
-        subprocess.run(['git', 'status'], check=True, capture_output=True)
-        
-        print("Проверка обновлений из репозитория...")
-        
-        # 2. Получаем последние изменения
-        result = subprocess.run(
-            ['git', 'pull', 'origin', 'master'], 
-            check=True, 
-            capture_output=True, 
-            text=True
-        )
-        
-        if "Already up to date." not in result.stdout and "Already up-to-date." not in result.stdout:
-            print("Обнаружены и применены обновления кода. Установка зависимостей...")
-            
-            # 3. Обновляем зависимости с помощью Poetry
-            subprocess.run(['poetry', 'install'], check=True)
-
-            print("Обновления применены. Перезапуск для применения изменений...")
-            # 4. Перезапускаем скрипт (критически важно для применения изменений)
-            os.execv(sys.executable, ['python'] + sys.argv)
-        else:
-            print("Код уже актуален. Запуск бота...")
-
-    except subprocess.CalledProcessError as e:
-        # Если git status не сработал или git pull не сработал
-        print("Не удалось выполнить git-команды. Возможно, это не Git-репозиторий или нет прав доступа.")
-        # Продолжаем выполнение, если не удалось обновиться
-    except FileNotFoundError:
-        print("Команда 'git' или 'poetry' не найдена. Проверьте ваш PATH.")
-        # Продолжаем выполнение, если не удалось обновить зависимости
-    except Exception as e:
-        print(f"Ошибка при самообновлении: {e}")
-
-async def main():
-    await check_for_updates()
+async def main() -> bool:
+    """Работает до остановки; True, если работа передана преемнику после обновления."""
+    # Если нас запустил старый процесс после обновления — мы преемник и поллинг начнём только по его сигналу
+    handover = Handover.from_env()
 
     if not await check_ffmpeg_installed():
         error_msg = (
@@ -78,15 +52,67 @@ async def main():
         )
         print(error_msg, file=sys.stderr)
         sys.exit(1)
+    startup_report.mark("ffmpeg_check")
 
+    # Убираем то, что осталось от прошлых запусков (падения, перезапуски), и запускаем уборщика
+    removed, freed = disk_manager.sweep()
+    sweep_scratch()
+    logging.info(f"Уборка при старте: удалено {removed} ({freed // 1024 // 1024} МБ). {disk_manager.usage()}")
+    janitor_task = asyncio.create_task(disk_manager.run_janitor())
+    metrics_server = await start_metrics_server()
 
     register_all_handlers(dp, bot)
-    logging.info("Все хэндлеры успешно зарегистрированы. Запуск бота...")
-    await dp.start_polling(bot)
+    startup_report.mark("handlers")
+
+    if handover:
+        # Прогреваемся полностью до того, как забрать поллинг у старого процесса
+        await asyncio.to_thread(startup_report.prewarm)
+        handover.signal("ready")
+        if not await handover.wait_for("released"):
+            logging.warning("Старый процесс не отдал поллинг вовремя, начинаю поллинг сам.")
+        asyncio.create_task(_signal_polling(handover))
 
+    logging.info("Все хэндлеры успешно зарегистрированы. Запуск бота...")
+    # Тяжёлые модули прогреваются в фоне уже после первого getUpdates
+    prewarm_task = asyncio.create_task(startup_report.prewarm_after_polling())
+    updater = Updater(dp, bot)
+    try:
+        while True:
+            # Проверка обновлений идёт в фоне и не задерживает поллинг
+            update_task = asyncio.create_task(updater.run())
+            try:
+                await dp.start_polling(bot, close_bot_session=False)
+            finally:
+                update_task.cancel()
+            if updater.successor is None:
+                return False
+            if await updater.finish_handover(lambda: _drain(metrics_server)):
+                return True
+    finally:
+        janitor_task.cancel()
+        prewarm_task.cancel()
+        render_pool.shutdown()
+        if metrics_server is not None:
+            metrics_server.close()
+        await bot.session.close()
+
+
+async def _drain(metrics_server):
+    """Доделывает задачи перед передачей работы и освобождает порт метрик для преемника."""
+    await scheduler.drain()
+    if metrics_server is not None:
+        metrics_server.close()
+
+
+async def _signal_polling(handover):
+    """Сообщает старому процессу, что преемник начал поллинг."""
+    await startup_report.polling_started.wait()
+    handover.signal("polling")
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if asyncio.run(main()):
+            # Уже вне event loop: пул рендера и прочие ресурсы закрыты в finally
+            release_process()
     except KeyboardInterrupt:
         logging.info("Bot stopped by KeyboardInterrupt.")
\ No newline at end of file